@@ -1,30 +1,21 @@
 #!/usr/bin/env python3
 
 import logging
-import sys
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from os import getenv
 from typing import List
 
 from dateutil import parser
 from dotenv import load_dotenv
 
-from client_modules.azure_feedreader import FeedItem, create_channel
-from client_modules.openai_summarizer import OpenaiClient
-from client_modules.slack_client import SlackClient
-
-load_dotenv()
+from client_modules.azure_feedreader import FeedItem, create_channel, fetch_blog_texts
+from client_modules.digest_packer import pack_entries, reassemble_sections
+from client_modules.fanout import deliver
+from client_modules.runtime import Clients, configure_logging
+from client_modules.watermark_store import Watermark
 
 logger = logging.getLogger(__name__)
-logging.basicConfig(
-    stream=sys.stdout,
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-)
-
-openai_client = OpenaiClient(getenv("OPENAI_API_KEY"))
-slackClient = SlackClient(getenv("SLACK_TOKEN"))
-slack_channel = getenv("SLACK_CHANNEL")
 
 default_system_message = """ You are a consultant for a Cloud consulting company. You are reading the Azure blog for new Features of the azure cloud platform. Gather the key points of each section, and create a summary using 150 words or less for each one, and use bullet points where appropriate. Write from the perspective of "Azure announced" or "Azure posted on their blog". Also generate a heading, and dont include the Release date of the update post. Also do not include phrases that say things like "You can find more info one another page.
 
@@ -48,20 +39,115 @@ Take these sections, take the fields and output the summarized sections like thi
 ---
 """
 
-azure_rss_url = getenv("AZURE_RSS_URL")
-custom_system_message = getenv("AZURE_SYSTEM_MESSAGE")
+default_azure_rss_url = "https://azure.microsoft.com/de-de/updates/feed/?category=compute%2Ccontainers%2Cdatabases%2Cdevops%2Cai-machine-learning%2Cnetworking%2Csecurity%2Cstorage&status=nowavailable%2Cinpreview"
 
-system_message: str
+# Settings and clients of the mode, set by `configure`
+azure_rss_url = default_azure_rss_url
+fetch_workers = 8
+fetch_per_host = 4
+summary_workers = 4
+section_tokens = 300
+min_feed_chars = None
+trace_extraction_memory = False
+system_message = default_system_message
 
-if custom_system_message:
-    system_message = custom_system_message
-else:
-    system_message = default_system_message
+transport = None
+shared_clients = None
+metrics = None
+slack_channel = None
+slack_channels = []
+watermark_store = None
 
 
-def summarize_day(groups, date):
+def configure(clients: Clients):
     """
-    Summarizes all the Azure blog posts for a particular day and posts them to Slack.
+    Reads the settings of the Azure mode from the environment and sets up its clients.
+
+    Parameters
+    ----------
+    clients : Clients
+        The clients shared with the other modes of the process.
+    """
+    global azure_rss_url, fetch_workers, fetch_per_host, summary_workers, section_tokens
+    global min_feed_chars, trace_extraction_memory, system_message
+    global shared_clients, transport, metrics, slack_channel, slack_channels, watermark_store
+
+    azure_rss_url = getenv("AZURE_RSS_URL", default_azure_rss_url)
+    fetch_workers = int(getenv("AZURE_FETCH_WORKERS", "8"))
+    fetch_per_host = int(getenv("AZURE_FETCH_PER_HOST", "4"))
+    summary_workers = int(getenv("AZURE_SUMMARY_WORKERS", "4"))
+    section_tokens = int(getenv("AZURE_SECTION_TOKENS", "300"))
+    feed_content_min_chars = getenv("AZURE_FEED_CONTENT_MIN_CHARS")
+    min_feed_chars = int(feed_content_min_chars) if feed_content_min_chars else None
+    trace_extraction_memory = bool(getenv("AZURE_TRACE_EXTRACTION_MEMORY"))
+    system_message = getenv("AZURE_SYSTEM_MESSAGE") or default_system_message
+
+    transport = clients.transport
+    shared_clients = clients
+    metrics = clients.metrics
+    slack_channel = clients.slack_channel
+    slack_channels = clients.slack_channels
+    watermark_store = clients.watermark_store
+
+
+def get_last_summary_date(channel: str = None) -> str:
+    """
+    Returns the publication date of the last Azure update day that was summarized in a Slack channel, by
+    default `slack_channel`.
+
+    The date is read from the watermark store. Only if the store has no record for the channel yet, the
+    Slack history is scanned once and the result is recorded in the store. The lookup is recorded in the
+    `watermark_lookup` stage of the metrics.
+    """
+    channel = channel or slack_channel
+
+    with metrics.stage("watermark_lookup"):
+        if watermark_store:
+            last_date = watermark_store.get(channel, Watermark.AZURE_DATE)
+            if last_date:
+                return last_date
+
+            logging.info(
+                f"No watermark recorded yet for {channel}, bootstrapping from Slack history"
+            )
+
+        last_date = shared_clients.slack_client.get_last_azure_summary_date(channel)
+
+        if watermark_store and last_date:
+            watermark_store.set(channel, Watermark.AZURE_DATE, last_date)
+
+        return last_date
+
+
+def record_summary_date(date, day: List[FeedItem], channel: str = None):
+    """
+    Records a summarized day in the watermark store, unless a later day was already recorded.
+
+    Parameters
+    ----------
+    date : datetime.date
+        The date that was summarized.
+    day : List[FeedItem]
+        The blog posts of that day.
+    channel : str
+        The Slack channel the summary was sent to. Defaults to `slack_channel`.
+    """
+    if not watermark_store:
+        return
+
+    channel = channel or slack_channel
+
+    last_date = watermark_store.get(channel, Watermark.AZURE_DATE)
+    if last_date and parser.parse(last_date).date() > date:
+        return
+
+    watermark_store.set(channel, Watermark.AZURE_DATE, str(date))
+    watermark_store.set(channel, Watermark.AZURE_GUID, day[0].guid)
+
+
+def summarize_sections(groups, date) -> list:
+    """
+    Summarizes all the Azure blog posts for a particular day.
 
     Parameters
     ----------
@@ -69,39 +155,104 @@ def summarize_day(groups, date):
         The dictionary of blog posts grouped by day.
     date : datetime.date
         The date for which to summarize blog posts.
+
+    Returns
+    -------
+    list
+        The summarized sections of the day.
     """
 
     day = groups[date]
 
-    contents = ""
+    results = fetch_blog_texts(
+        day,
+        fetch_workers,
+        fetch_per_host,
+        transport,
+        min_feed_chars,
+        trace_extraction_memory,
+    )
 
-    for item in day:
-        contents = f"""{ contents }
+    entries = [
+        f"""
 
-Heading: { item.title }
+Heading: { result.item.title }
 
-Link: { item.link }
+Link: { result.item.link }
 
 Blog Content:
 
-{ item.extract_blog_text() }
+{ result.text }
 
 ___
 """
+        for result in results
+    ]
+
+    batches = pack_entries(
+        entries,
+        shared_clients.openai_client.input_budget(system_message),
+        shared_clients.openai_client.max_tokens,
+        section_tokens,
+    )
+
+    with ThreadPoolExecutor(max_workers=max(1, summary_workers)) as executor:
+        summaries = list(
+            executor.map(
+                lambda batch: shared_clients.openai_client.chatCompletion(
+                    system_message,
+                    "".join(entries[index] for index in batch),
+                    expected_tokens=len(batch) * section_tokens,
+                ),
+                batches,
+            )
+        )
 
-    summary = openai_client.chatCompletion(system_message, contents)
-    sections = summary.split("---")
-    slackClient.send_azure_blogpost_summary(sections, slack_channel, str(date))
+    return reassemble_sections(batches, summaries)
 
 
-def summarize_newer_groups(groups, last_date):
+def send_day(channel: str, groups, date, sections: list):
     """
-    Summarizes all the Azure blog posts for days later than a particular date and posts them to Slack.
+    Sends the summarized sections of a day to a Slack channel and records the day in the channel's watermark.
+    """
+    shared_clients.slack_client.send_azure_blogpost_summary(
+        sections, channel, str(date)
+    )
+    record_summary_date(date, groups[date], channel)
+
+
+def summarize_day(groups, date, channels: List[str] = None):
+    """
+    Summarizes all the Azure blog posts for a particular day and posts them to Slack.
 
     Parameters
     ----------
     groups : dict
         The dictionary of blog posts grouped by day.
+    date : datetime.date
+        The date for which to summarize blog posts.
+    channels : List[str]
+        The Slack channels to post to, concurrently. Defaults to `slack_channels`.
+    """
+    channels = channels or slack_channels
+    sections = summarize_sections(groups, date)
+
+    with ThreadPoolExecutor(max_workers=len(channels)) as executor:
+        list(
+            executor.map(
+                lambda channel: send_day(channel, groups, date, sections), channels
+            )
+        )
+
+
+def newer_dates(groups, last_date) -> list:
+    """
+    Returns the days of the blog posts later than a particular date, newest first.
+
+    Parameters
+    ----------
+    groups : dict
+        The dictionary of blog posts grouped by day, newest first.
     last_date : datetime.date
         The date to use as a reference point.
     """
@@ -123,25 +274,79 @@ def summarize_newer_groups(groups, last_date):
         elif date < last_date:
             break
 
-    for date in reversed(new_dates):
-        print(f"Date: {date}, Item count: {len(groups[date])}")
-        summarize_day(groups, date)
+    return new_dates
 
 
-def latest_posts():
+def summarize_newer_groups(groups, last_dates: dict):
     """
-    Retrieves the latest blog posts from the Azure blog and summarizes them.
+    Summarizes all the Azure blog posts for days later than the last summarized day of each Slack channel and
+    posts them to the channels that have not received them yet.
+
+    Every day is summarized once for all channels, oldest first. While a day is delivered to the channels
+    concurrently, the next day is already summarized. Each channel receives its days strictly oldest first (see
+    `deliver`).
+
+    Parameters
+    ----------
+    groups : dict
+        The dictionary of blog posts grouped by day.
+    last_dates : dict
+        The last summarized date, keyed by Slack channel.
     """
 
-    channel = create_channel(
-        "https://azure.microsoft.com/de-de/updates/feed/?category=compute%2Ccontainers%2Cdatabases%2Cdevops%2Cai-machine-learning%2Cnetworking%2Csecurity%2Cstorage&status=nowavailable%2Cinpreview"
-    )
+    pending = {
+        channel: list(reversed(newer_dates(groups, last_date)))
+        for channel, last_date in last_dates.items()
+    }
+    new_dates = sorted({date for dates in pending.values() for date in dates})
 
-    last_date = parser.parse(
-        slackClient.get_last_azure_summary_date(slack_channel)
-    ).date()
+    if not new_dates:
+        return
 
-    summarize_newer_groups(channel.groups, last_date)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        summaries = {}
+        for date in new_dates:
+            print(f"Date: {date}, Item count: {len(groups[date])}")
+            summaries[date] = executor.submit(summarize_sections, groups, date)
+
+        try:
+            deliver(
+                pending,
+                summaries,
+                lambda channel, date, sections: send_day(
+                    channel, groups, date, sections
+                ),
+            )
+        except BaseException:
+            for future in summaries.values():
+                future.cancel()
+            raise
+
+
+def latest_posts(channels: List[str] = None):
+    """
+    Retrieves the latest blog posts from the Azure blog and summarizes them for the given Slack channels.
+
+    Parameters
+    ----------
+    channels : List[str]
+        The Slack channels to deliver to. Defaults to `slack_channels`.
+    """
+    channels = channels or slack_channels
+
+    channel = create_channel(azure_rss_url, transport)
+
+    with ThreadPoolExecutor(max_workers=len(channels)) as executor:
+        last_dates = dict(zip(channels, executor.map(get_last_summary_date, channels)))
+
+    for slack_target in channels:
+        if not last_dates[slack_target]:
+            logging.error(f"No Azure summary found in {slack_target}")
+            del last_dates[slack_target]
+        else:
+            last_dates[slack_target] = parser.parse(last_dates[slack_target]).date()
+
+    summarize_newer_groups(channel.groups, last_dates)
 
 
 def specific_day():
@@ -149,16 +354,36 @@ def specific_day():
     Summarizes the Azure blog posts for a specific day set by the 'AZURE_SUMMARY_DATE' environment variable.
     """
 
-    channel = create_channel(
-        "https://azure.microsoft.com/de-de/updates/feed/?category=compute%2Ccontainers%2Cdatabases%2Cdevops%2Cai-machine-learning%2Cnetworking%2Csecurity%2Cstorage&status=nowavailable%2Cinpreview"
-    )
+    channel = create_channel(azure_rss_url, transport)
 
     date = getenv("AZURE_SUMMARY_DATE")
 
     summarize_day(channel.groups, parser.parse(date).date())
 
 
-if getenv("AZURE_SUMMARY_DATE"):
-    specific_day()
-else:
-    latest_posts()
+def main(clients: Clients):
+    """
+    Runs the Azure mode with the given clients.
+
+    Summarizes the day set by `AZURE_SUMMARY_DATE`, or all days published since the last summary.
+
+    Parameters
+    ----------
+    clients : Clients
+        The clients shared with the other modes of the process.
+    """
+    configure(clients)
+
+    if getenv("AZURE_SUMMARY_DATE"):
+        specific_day()
+    else:
+        latest_posts()
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    configure_logging()
+
+    clients = Clients.from_env("azure")
+    main(clients)
+    clients.finish()
@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import client_modules.confluence as confluence
+from client_modules.backfill_queue import BackfillQueue, QueuedPost
+from client_modules.runtime import Clients, configure_logging
+from summarize_blogposts import default_blogpost_summary_statement
+
+from dateutil import parser
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+# Number of blog posts whose bodies are requested at once and that are summarized ahead of the delivery
+BATCH_SIZE = 25
+
+# Number of blog posts requested per search page
+SEARCH_PAGE_SIZE = 50
+
+# Settings and clients of the mode, set by `configure`
+confluence_base_url = None
+queue_path = ".cache/backfill.sqlite"
+backfill_limit = 1000
+backfill_since = None
+output_path = None
+workers = 4
+slack_interval = 1.0
+max_attempts = 3
+blogpost_summary_statement = default_blogpost_summary_statement
+targets = []
+
+shared_clients = None
+confluenceClient = None
+queue = None
+
+
+def configure(clients: Clients):
+    """
+    Reads the settings of the backfill from the environment and sets up its clients.
+
+    Parameters
+    ----------
+    clients : Clients
+        The clients shared with the other modes of the process.
+    """
+    global confluence_base_url, queue_path, backfill_limit, backfill_since, output_path, workers
+    global slack_interval, max_attempts, blogpost_summary_statement, targets
+    global shared_clients, confluenceClient, queue
+
+    confluence_base_url = os.getenv("BASE_URL")
+    queue_path = os.getenv("BACKFILL_QUEUE_PATH", ".cache/backfill.sqlite")
+    backfill_limit = int(os.getenv("BACKFILL_LIMIT", "1000"))
+    backfill_since = os.getenv("BACKFILL_SINCE")
+    if backfill_since:
+        try:
+            backfill_since = parser.parse(backfill_since).strftime("%Y-%m-%d")
+        except (ValueError, OverflowError):
+            logging.error(
+                f"BACKFILL_SINCE has to be a date, e.g. 2023-01-01, not {backfill_since}. (╯°□°）╯︵ ┻━┻"
+            )
+            sys.exit(1)
+    output_path = os.getenv("BACKFILL_OUTPUT")
+    workers = int(os.getenv("BACKFILL_WORKERS", "4"))
+    slack_interval = float(os.getenv("BACKFILL_SLACK_INTERVAL", "1.0"))
+    max_attempts = int(os.getenv("BACKFILL_MAX_ATTEMPTS", "3"))
+    blogpost_summary_statement = (
+        os.getenv("OPENAI_STATEMENT") or default_blogpost_summary_statement
+    )
+
+    # The summaries go either to a local file or to the Slack channels
+    targets = [f"file:{output_path}"] if output_path else clients.slack_channels
+
+    shared_clients = clients
+    queue = BackfillQueue(queue_path)
+    confluenceClient = confluence.ConfluenceClient(
+        confluence_base_url,
+        os.getenv("CONFLUENCE_USERNAME"),
+        os.getenv("CONFLUENCE_TOKEN"),
+        clients.transport,
+        clients.metrics,
+    )
+
+
+def backfill_search(before: str = None) -> str:
+    """
+    Returns the CQL query of the backfill, newest blog posts first.
+
+    Parameters
+    ----------
+    before : str, optional
+        If set, only blog posts created before this date, as `yyyy-MM-dd`, are searched.
+    """
+    cql = "type = blogpost"
+    if backfill_since:
+        cql += f' and created >= "{backfill_since}"'
+    if before:
+        cql += f' and created < "{before}"'
+
+    return f"{cql} order by created desc"
+
+
+def enqueue_posts():
+    """
+    Pages through the blog posts of the backfill search and adds the newest `backfill_limit` to the queue.
+
+    Every page is committed to the queue. A killed backfill searches again for the blog posts created before
+    the oldest queued one, so new blog posts cannot shift the search like an offset. CQL compares dates in
+    the time zone of the Confluence user, so this cursor lies two days after the UTC date of the oldest
+    queued blog post, and the blog posts found again are skipped. Once the search is complete, it is not
+    repeated.
+    """
+    search = f"{backfill_search()} limit {backfill_limit}"
+
+    recorded_search = queue.get_state("search")
+    if recorded_search and recorded_search != search:
+        logging.error(
+            f"The backfill queue {queue_path} belongs to another search ({recorded_search}). Delete it to start a new backfill. (╯°□°）╯︵ ┻━┻"
+        )
+        sys.exit(1)
+
+    if queue.get_state("search_complete"):
+        logging.info("Backfill search complete, resuming the queue")
+        return
+
+    queue.set_state("search", search)
+    queued, oldest = queue.progress()
+
+    before = None
+    if oldest:
+        before = (parser.isoparse(oldest) + timedelta(days=2)).strftime("%Y-%m-%d")
+        logging.info(f"Resuming the backfill search before {before}")
+
+    if queued < backfill_limit:
+        for _, page in confluenceClient.iter_blogpost_pages(
+            backfill_search(before), SEARCH_PAGE_SIZE
+        ):
+            added = queue.add(page, limit=backfill_limit - queued)
+            queued += added
+            logging.info(
+                f"Queued {added} blog posts, {queued} of at most {backfill_limit}"
+            )
+
+            if queued >= backfill_limit:
+                break
+
+    queue.set_state("search_complete", "1")
+
+
+def summarize(blogpost: confluence.BlogPost) -> str:
+    """
+    Summarizes a blog post and records the summary in the queue.
+    """
+    summary = shared_clients.openai_client.summarize(
+        blogpost_summary_statement, blogpost.extract_text()
+    )
+    queue.set_summary(blogpost.id, summary)
+    return summary
+
+
+def send(target: str, post: QueuedPost, summary: str, last_sent: dict):
+    """
+    Delivers the summary of a blog post to a target, a `file:` path or a Slack channel.
+
+    Messages to the same Slack channel are paced by `slack_interval`.
+    """
+    blogpost_url = f"{confluence_base_url}{post.tinyui}"
+
+    if target.startswith("file:"):
+        with open(target[len("file:") :], "a", encoding="utf-8") as file:
+            file.write(
+                json.dumps(
+                    {
+                        "id": post.id,
+                        "title": post.title,
+                        "created": post.created,
+                        "url": blogpost_url,
+                        "summary": summary,
+                    },
+                    ensure_ascii=False,
+                )
+                + "\n"
+            )
+            file.flush()
+            os.fsync(file.fileno())
+        return
+
+    from client_modules.slack_client import ActionTrigger
+
+    wait = last_sent.get(target, 0) + slack_interval - time.monotonic()
+    if wait > 0:
+        time.sleep(wait)
+
+    shared_clients.slack_client.send_message_confluence_summary(
+        summary,
+        post.title,
+        target,
+        blogpost_url,
+        post.id,
+        ActionTrigger.BACKFILL.value,
+    )
+    last_sent[target] = time.monotonic()
+
+
+def process_queue():
+    """
+    Summarizes the pending blog posts of the queue and delivers the summaries to the targets, oldest first.
+
+    The bodies of the blog posts are requested in batches of `BATCH_SIZE`, and up to `workers` blog posts are
+    summarized in parallel under the rate limits of the OpenAI client, while the summaries of the previous
+    batch are delivered. If a blog post fails to summarize or to deliver, it is recorded as failed and the
+    backfill stops, so no target receives a newer summary before an older one. The next run retries it, and
+    skips it once it failed `max_attempts` times.
+    """
+    pending = queue.pending(targets, max_attempts)
+    logging.info(f"{len(pending)} blog posts to backfill to {', '.join(targets)}")
+
+    batches = [
+        pending[start : start + BATCH_SIZE]
+        for start in range(0, len(pending), BATCH_SIZE)
+    ]
+    last_sent = {}
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+
+        def submit(batch: list) -> dict:
+            blogposts = [
+                confluence.BlogPost(
+                    {
+                        "id": post.id,
+                        "title": post.title,
+                        "history": {"createdDate": post.created},
+                        "_links": {"tinyui": post.tinyui},
+                    },
+                    confluenceClient,
+                )
+                for post in batch
+                if post.summary is None
+            ]
+            confluenceClient.load_bodies(blogposts)
+            return {
+                blogpost.id: executor.submit(summarize, blogpost)
+                for blogpost in blogposts
+            }
+
+        def deliver(batch: list, summaries: dict):
+            for post in batch:
+                try:
+                    summary = post.summary or summaries[post.id].result()
+                except (Exception, SystemExit) as e:
+                    logging.error(
+                        f"Summarizing blogpost {post.id} failed, not delivering newer summaries: {e}"
+                    )
+                    queue.mark_failed(post.id, f"summary: {e}")
+                    raise
+
+                for target in targets:
+                    if target in post.delivered_to:
+                        continue
+
+                    try:
+                        send(target, post, summary, last_sent)
+                    except (Exception, SystemExit) as e:
+                        queue.mark_failed(post.id, f"delivery to {target}: {e}")
+                        raise
+
+                    queue.mark_delivered(post.id, target)
+                    logger.info(f"Backfilled blogpost {post.id} to {target}")
+
+        # The next batch is summarized while the previous one is delivered
+        in_flight = []
+        try:
+            for batch in batches:
+                in_flight.append((batch, submit(batch)))
+                if len(in_flight) > 1:
+                    deliver(*in_flight.pop(0))
+                    log_progress()
+
+            for batch, summaries in in_flight:
+                deliver(batch, summaries)
+        except BaseException:
+            for _, summaries in in_flight:
+                for future in summaries.values():
+                    future.cancel()
+            raise
+
+
+def log_progress():
+    """
+    Logs the numbers of queued, summarized, delivered and failed blog posts.
+    """
+    counts = queue.counts(targets, max_attempts)
+    logging.info(
+        f"Backfill: {counts['delivered']} of {counts['queued']} blog posts delivered, "
+        f"{counts['summarized']} summarized, {counts['failed']} failed"
+    )
+
+
+def main(clients: Clients):
+    """
+    Runs the backfill with the given clients.
+
+    Searches the newest `BACKFILL_LIMIT` blog posts, created since `BACKFILL_SINCE` if set, queues them in the
+    SQLite file at `BACKFILL_QUEUE_PATH` and delivers their summaries, oldest first, to the file at
+    `BACKFILL_OUTPUT` as JSON lines or else to the Slack channels. A killed backfill resumes where it stopped
+    when it is run again with the same settings.
+
+    Parameters
+    ----------
+    clients : Clients
+        The clients shared with the other modes of the process.
+    """
+    configure(clients)
+
+    enqueue_posts()
+    process_queue()
+    log_progress()
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    configure_logging()
+
+    clients = Clients.from_env("backfill")
+    main(clients)
+    clients.finish()
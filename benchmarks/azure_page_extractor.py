@@ -0,0 +1,45 @@
+"""
+Micro-benchmark of the Azure update page extraction.
+
+Compares the streaming fast path with the full BeautifulSoup parse on the sample pages in
+`benchmarks/fixtures` and reports the parse time and peak memory per page.
+
+Run from the repository root:
+
+    python -m benchmarks.azure_page_extractor
+"""
+import glob
+import os
+
+from benchmarks.timing import measure
+from client_modules.azure_page_extractor import (
+    extract_update_text_fast,
+    extract_update_text_full,
+)
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def main():
+    print(
+        f"{'page':<28} {'size':>9} {'path':<6} {'median ms':>10} {'peak KiB':>10} {'same text':>10}"
+    )
+
+    for path in sorted(glob.glob(os.path.join(FIXTURES, "azure_*.html"))):
+        with open(path, encoding="utf-8") as file:
+            html = file.read()
+
+        same_text = extract_update_text_fast(html) == extract_update_text_full(html)
+        for name, function in (
+            ("full", extract_update_text_full),
+            ("fast", extract_update_text_fast),
+        ):
+            duration, peak = measure(function, html)
+            print(
+                f"{os.path.basename(path):<28} {len(html) // 1024:>6} KiB {name:<6} "
+                f"{duration * 1000:>10.2f} {peak // 1024:>10} {str(same_text):>10}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,565 @@
+"""
+Local stand-ins for Confluence, Slack, OpenAI and the Azure updates site, used by the load harness.
+
+Every fake is an HTTP server on a random local port that answers the endpoints the clients of this project
+use. The fakes count the calls per endpoint and can add latency, server errors and 429 responses.
+"""
+import json
+import math
+import random
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterator
+from urllib.parse import parse_qs, urlencode, urlparse
+
+from benchmarks.fixture_server import read_fixture
+
+
+class FakeService(ABC):
+    """
+    Base class of the fake services.
+
+    Subclasses implement `route`, which answers a request that was not turned into an injected fault, and
+    override `rate_limited` and `server_error` to answer faults in the shape of the real service.
+
+    Attributes
+    ----------
+    name : str
+        The name of the service, used in reports.
+    latency : float
+        The mean delay in seconds added to every response. The actual delay varies by ±20%.
+    error_rate : float
+        The share of requests answered with a 500 error.
+    rate_limit_rate : float
+        The share of requests answered with a 429 error.
+    retry_after : float
+        The `Retry-After` in seconds sent with 429 errors.
+    calls : Counter
+        The number of requests per endpoint.
+    statuses : Counter
+        The number of responses per status code.
+    url : str
+        The base URL of the running server.
+    first_request_at : float
+        The UNIX timestamp of the first request, or None.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        retry_after: float = 1.0,
+    ) -> None:
+        self.name = name
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.calls = Counter()
+        self.statuses = Counter()
+        self.first_request_at = None
+        self._lock = threading.Lock()
+        self._random = random.Random(name)
+
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                service._handle(self, "GET")
+
+            def do_POST(self):
+                service._handle(self, "POST")
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._server.server_port}"
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handle(self, handler: BaseHTTPRequestHandler, method: str):
+        with self._lock:
+            if self.first_request_at is None:
+                self.first_request_at = time.time()
+
+        parsed = urlparse(handler.path)
+        length = int(handler.headers.get("Content-Length") or 0)
+        body = handler.rfile.read(length) if length else b""
+
+        if self.latency:
+            time.sleep(self.latency * (0.8 + 0.4 * self._random.random()))
+
+        with self._lock:
+            self.calls[self.endpoint(parsed.path)] += 1
+            fault = self._random.random()
+
+        if fault < self.rate_limit_rate:
+            status, headers, payload = self.rate_limited()
+        elif fault < self.rate_limit_rate + self.error_rate:
+            status, headers, payload = self.server_error()
+        else:
+            status, headers, payload = self.route(
+                method, parsed.path, parse_qs(parsed.query), body
+            )
+
+        with self._lock:
+            self.statuses[status] += 1
+
+        handler.send_response(status)
+        for name, value in headers.items():
+            handler.send_header(name, value)
+
+        if isinstance(payload, bytes):
+            handler.send_header("Content-Length", str(len(payload)))
+            handler.end_headers()
+            handler.wfile.write(payload)
+            return
+
+        # A streamed body is written part by part and ends with the connection
+        handler.send_header("Connection", "close")
+        handler.close_connection = True
+        handler.end_headers()
+        try:
+            for part in payload:
+                handler.wfile.write(part)
+                handler.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client stopped reading the stream early
+            pass
+
+    def endpoint(self, path: str) -> str:
+        """
+        Returns the name under which a request path is counted.
+        """
+        return path
+
+    def rate_limited(self) -> tuple:
+        """
+        Returns the status, headers and body of a 429 response.
+        """
+        return (
+            429,
+            {
+                "Content-Type": "application/json",
+                "Retry-After": f"{self.retry_after:g}",
+            },
+            json.dumps({"error": "rate limited"}).encode(),
+        )
+
+    def server_error(self) -> tuple:
+        """
+        Returns the status, headers and body of an injected 500 response.
+        """
+        return self.json_response({"message": "injected server error"}, 500)
+
+    @abstractmethod
+    def route(self, method: str, path: str, query: dict, body: bytes) -> tuple:
+        """
+        Answers a request with a status, headers and body. The body is either bytes or an iterable of bytes,
+        which is streamed part by part.
+        """
+
+    @staticmethod
+    def json_response(data, status: int = 200) -> tuple:
+        return status, {"Content-Type": "application/json"}, json.dumps(data).encode()
+
+    def report(self) -> dict:
+        """
+        Returns the counters of the service.
+        """
+        return {
+            "calls": sum(self.calls.values()),
+            "endpoints": dict(self.calls),
+            "statuses": {str(status): count for status, count in self.statuses.items()},
+        }
+
+
+class FakeConfluence(FakeService):
+    """
+    A fake Confluence with one already summarized blog post followed by `posts` new ones.
+
+    The posts are created one hour apart. The search endpoint understands the CQL queries of
+    `ConfluenceClient` and the backfill: `created >= "<date>"`, `created < "<date>"`, `id in (...)` and
+    `order by created desc`. Like Confluence, it returns at most `MAX_LIMIT` results per page and links
+    the next page in `_links.next`.
+
+    Attributes
+    ----------
+    last_summarized_id : str
+        The id of the blog post that was summarized before the run.
+    """
+
+    MAX_LIMIT = 25
+
+    def __init__(self, posts: int, **kwargs) -> None:
+        super().__init__("confluence", **kwargs)
+
+        bodies = [
+            read_fixture("confluence_blogpost.xml"),
+            read_fixture("confluence_announcement.xml"),
+        ]
+        first_created = datetime.now(timezone.utc) - timedelta(hours=posts + 1)
+
+        self.posts = [
+            {
+                "id": str(100000 + index),
+                "type": "blogpost",
+                "status": "current",
+                "title": f"Load test blog post {index}",
+                "history": {
+                    "createdDate": (first_created + timedelta(hours=index))
+                    .isoformat(timespec="milliseconds")
+                    .replace("+00:00", "Z")
+                },
+                "body": {
+                    "storage": {
+                        "value": bodies[index % len(bodies)],
+                        "representation": "storage",
+                    }
+                },
+                "_links": {"tinyui": f"/x/load{index}"},
+            }
+            for index in range(posts + 1)
+        ]
+        self._by_id = {post["id"]: post for post in self.posts}
+        self.last_summarized_id = self.posts[0]["id"]
+
+    def endpoint(self, path: str) -> str:
+        return "search" if path.endswith("/search") else "content"
+
+    @staticmethod
+    def _render(post: dict, expand: str) -> dict:
+        if "body" in expand:
+            return post
+        return {key: value for key, value in post.items() if key != "body"}
+
+    def route(self, method, path, query, body):
+        expand = query.get("expand", [""])[0]
+
+        if not path.endswith("/search"):
+            post = self._by_id.get(path.rsplit("/", 1)[-1])
+            if post is None:
+                return self.json_response({"message": "No content found"}, 404)
+            return self.json_response(self._render(post, expand))
+
+        cql = query.get("cql", [""])[0]
+        start = int(query.get("start", ["0"])[0])
+        limit = min(int(query.get("limit", ["25"])[0]), self.MAX_LIMIT)
+
+        if "id in" in cql:
+            ids = re.findall(r"\d+", cql.split("id in", 1)[1])
+            results = [self._by_id[id] for id in ids if id in self._by_id]
+        else:
+            results = self.posts
+            for comparison, date in re.findall(r'created (>=|<) "([^"]+)"', cql):
+                results = [
+                    post
+                    for post in results
+                    if (post["history"]["createdDate"] >= date) == (comparison == ">=")
+                ]
+            if "order by created desc" in cql:
+                results = list(reversed(results))
+
+        page = results[start : start + limit]
+        links = {}
+        if start + limit < len(results):
+            next_query = {key: values[0] for key, values in query.items()}
+            next_query.update(start=start + limit, limit=limit)
+            links["next"] = f"{path}?{urlencode(next_query)}"
+
+        return self.json_response(
+            {
+                "results": [self._render(post, expand) for post in page],
+                "start": start,
+                "limit": limit,
+                "size": len(page),
+                "cqlQuery": cql,
+                "totalSize": len(results),
+                "_links": links,
+            }
+        )
+
+
+class FakeSlack(FakeService):
+    """
+    A fake Slack Web API answering `conversations.history`, `chat.postMessage`, `chat.update` and
+    `chat.delete`.
+
+    The channel history contains a message with the given metadata, which marks the last summary. A list of
+    metadata creates one message each, e.g. to mark the last Confluence and Azure summaries.
+
+    Attributes
+    ----------
+    history_metadata : dict or list
+        The metadata of the messages in the channel history.
+    posted : int
+        The number of messages posted.
+    """
+
+    def __init__(self, history_metadata, **kwargs) -> None:
+        super().__init__("slack", **kwargs)
+        self.history_metadata = history_metadata
+        self.posted = 0
+
+    def endpoint(self, path: str) -> str:
+        return path.rsplit("/", 1)[-1]
+
+    def rate_limited(self) -> tuple:
+        return (
+            429,
+            {
+                "Content-Type": "application/json",
+                "Retry-After": f"{self.retry_after:g}",
+            },
+            json.dumps({"ok": False, "error": "ratelimited"}).encode(),
+        )
+
+    def server_error(self) -> tuple:
+        return self.json_response({"ok": False, "error": "internal_error"}, 500)
+
+    def route(self, method, path, query, body):
+        api_method = path.rsplit("/", 1)[-1]
+        timestamp = f"{time.time():.6f}"
+
+        if api_method == "conversations.history":
+            return self.json_response(
+                {
+                    "ok": True,
+                    "messages": [
+                        {
+                            "type": "message",
+                            "ts": f"1692000000.{index + 100:06d}",
+                            "text": "Last summary",
+                            "metadata": metadata,
+                        }
+                        for index, metadata in enumerate(
+                            self.history_metadata
+                            if isinstance(self.history_metadata, list)
+                            else [self.history_metadata]
+                        )
+                    ],
+                    "has_more": False,
+                }
+            )
+
+        if api_method in ("chat.postMessage", "chat.update", "chat.delete"):
+            if api_method == "chat.postMessage":
+                with self._lock:
+                    self.posted += 1
+            return self.json_response(
+                {"ok": True, "channel": "C0LOADTEST", "ts": timestamp, "message": {}}
+            )
+
+        return self.json_response({"ok": False, "error": "unknown_method"}, 404)
+
+    def report(self) -> dict:
+        return {**super().report(), "messages_posted": self.posted}
+
+
+class FakeOpenAI(FakeService):
+    """
+    A fake OpenAI API answering chat completions with canned summaries.
+
+    Prompts containing several Azure sections (`Heading:` fields) are answered with one section per heading,
+    separated by `---`. The reported usage is estimated from the characters of the prompt and the answer.
+    Requests with `"stream": true` are answered with server-sent `chat.completion.chunk` events, one per word
+    and `stream_delay` seconds apart, ending with `data: [DONE]`.
+
+    Attributes
+    ----------
+    stream_delay : float
+        The number of seconds between two chunks of a streamed completion.
+    prompt_tokens : int
+        The number of prompt tokens of all answered completions.
+    completion_tokens : int
+        The number of completion tokens of all answered completions.
+    streamed : int
+        The number of completions answered as stream.
+    """
+
+    def __init__(self, stream_delay: float = 0.05, **kwargs) -> None:
+        super().__init__("openai", **kwargs)
+        self.stream_delay = stream_delay
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.streamed = 0
+
+    def rate_limited(self) -> tuple:
+        return (
+            429,
+            {
+                "Content-Type": "application/json",
+                "Retry-After": f"{self.retry_after:g}",
+            },
+            json.dumps(
+                {
+                    "error": {
+                        "message": "Rate limit reached for requests",
+                        "type": "requests",
+                        "code": "rate_limit_exceeded",
+                    }
+                }
+            ).encode(),
+        )
+
+    def server_error(self) -> tuple:
+        return self.json_response(
+            {
+                "error": {
+                    "message": "The server had an error while processing your request.",
+                    "type": "server_error",
+                }
+            },
+            500,
+        )
+
+    def route(self, method, path, query, body):
+        if not path.endswith("/chat/completions"):
+            return self.json_response({"error": {"message": "Not found"}}, 404)
+
+        request = json.loads(body or b"{}")
+        messages = request.get("messages", [])
+        prompt = "".join(message.get("content", "") for message in messages)
+        user = messages[-1].get("content", "") if messages else ""
+
+        headings = re.findall(r"Heading: (.+)", user)
+        if headings:
+            content = "\n---\n".join(
+                f"*{heading.strip()}*\n- Azure announced an update.\n- It is available now."
+                for heading in headings
+            )
+        else:
+            content = "*Zusammenfassung*\n- Punkt eins\n- Punkt zwei\n- Punkt drei"
+
+        prompt_tokens = math.ceil(len(prompt) / 3.5)
+        completion_tokens = math.ceil(len(content) / 3.5)
+        with self._lock:
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+
+        model = request.get("model", "gpt-3.5-turbo")
+        if request.get("stream"):
+            with self._lock:
+                self.streamed += 1
+            return (
+                200,
+                {"Content-Type": "text/event-stream"},
+                self._stream(model, content),
+            )
+
+        return self.json_response(
+            {
+                "id": f"chatcmpl-load{time.time_ns()}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                },
+            }
+        )
+
+    def report(self) -> dict:
+        return {
+            **super().report(),
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "total_tokens": self.prompt_tokens + self.completion_tokens,
+            "streamed": self.streamed,
+        }
+
+    def _stream(self, model: str, content: str) -> Iterator[bytes]:
+        """
+        Yields the server-sent events of a streamed completion of `content`, one word per chunk.
+        """
+        completion_id = f"chatcmpl-load{time.time_ns()}"
+        created = int(time.time())
+
+        def event(delta: dict, finish_reason: str = None) -> bytes:
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [
+                    {"index": 0, "delta": delta, "finish_reason": finish_reason}
+                ],
+            }
+            return f"data: {json.dumps(chunk)}\n\n".encode()
+
+        yield event({"role": "assistant"})
+        for word in re.findall(r"\S+\s*", content):
+            time.sleep(self.stream_delay)
+            yield event({"content": word})
+        yield event({}, "stop")
+        yield b"data: [DONE]\n\n"
+
+
+class FakeAzure(FakeService):
+    """
+    A fake Azure updates site with a feed of `items` updates published on one day.
+
+    Attributes
+    ----------
+    day : datetime
+        The publication day of the updates.
+    """
+
+    def __init__(self, items: int, day: datetime = None, **kwargs) -> None:
+        super().__init__("azure", **kwargs)
+        self.items = items
+        self.day = day or datetime(2023, 8, 21, 18, 0, tzinfo=timezone.utc)
+        self._page = read_fixture("azure_update.html", "rb")
+
+    def endpoint(self, path: str) -> str:
+        return "feed" if path.startswith("/feed") else "page"
+
+    def feed(self) -> bytes:
+        entries = "".join(
+            f"""<item><title>Generally available: Load test update {index}</title>
+<link>{self.url}/updates/{index}/</link><guid isPermaLink="false">{self.url}/updates/{index}/</guid>
+<pubDate>{format_datetime(self.day - timedelta(minutes=index))}</pubDate>
+<description>Load test update {index} is now available.</description></item>
+"""
+            for index in range(self.items)
+        )
+        return f"""<?xml version="1.0" encoding="utf-8"?>
+<rss version="2.0"><channel><title>Azure updates</title><link>{self.url}/updates</link>
+<description>Azure updates</description><language>de-de</language>
+{entries}</channel></rss>
+""".encode()
+
+    def route(self, method, path, query, body):
+        if path.startswith("/feed"):
+            return 200, {"Content-Type": "application/rss+xml"}, self.feed()
+        if path.startswith("/updates/"):
+            return 200, {"Content-Type": "text/html; charset=utf-8"}, self._page
+        return 404, {"Content-Type": "text/plain"}, b"Not found"
@@ -0,0 +1,77 @@
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def read_fixture(name: str, mode: str = "r"):
+    """
+    Reads a file from `benchmarks/fixtures`.
+    """
+    encoding = "utf-8" if "b" not in mode else None
+    with open(os.path.join(FIXTURES, name), mode, encoding=encoding) as file:
+        return file.read()
+
+
+class FixtureServer:
+    """
+    A local HTTP server answering like the Azure updates site from the recorded fixtures.
+
+    `/feed` returns the RSS feed with its links pointing back to this server, `/updates/<n>/` returns the
+    recorded update page for every `n`.
+
+    Attributes
+    ----------
+    base_url : str
+        The base URL of the running server.
+    requests : int
+        The number of requests served.
+    """
+
+    def __init__(self) -> None:
+        self.requests = 0
+        self._feed = None
+        self._page = read_fixture("azure_update.html", "rb")
+
+        fixture_server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                fixture_server.requests += 1
+
+                if self.path.startswith("/feed"):
+                    body, content_type = fixture_server._feed, "application/rss+xml"
+                elif self.path.startswith("/updates/"):
+                    body, content_type = fixture_server._page, "text/html"
+                else:
+                    self.send_error(404)
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self._server.server_port}"
+        self._feed = (
+            read_fixture("azure_feed.xml")
+            .replace("{base_url}", self.base_url)
+            .encode("utf-8")
+        )
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def __enter__(self) -> "FixtureServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,431 @@
+"""
+End-to-end load harness running the summarizer scripts against local fake services.
+
+The harness starts fakes for Confluence, Slack, OpenAI and the Azure updates site (see `benchmarks.fakes`),
+runs `main.py confluence` or `main.py azure` in a subprocess with the environment pointing at
+the fakes and reports the wall time, the calls per service and the tokens used.
+
+Run from the repository root, e.g.:
+
+    python -m benchmarks.load_harness confluence --posts 500
+    python -m benchmarks.load_harness azure --items 60 --openai-latency 1.5
+    python -m benchmarks.load_harness all --rate-limit-rate 0.05 --env OPENAI_MAX_CONCURRENCY=16
+    python -m benchmarks.load_harness confluence --openai-rate-limit-rate 0.2 --slack-error-rate 0.05
+
+The `all` scenario runs both modes concurrently in one process with `main.py all`. The `stream` scenario
+summarizes one requested blog post with `STREAM_SUMMARY=1`, so the summary is streamed from the fake OpenAI
+into a Slack message that is updated while it is generated:
+
+    python -m benchmarks.load_harness stream --stream-delay 0.2
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from contextlib import ExitStack
+from datetime import timedelta
+
+from benchmarks.fakes import FakeAzure, FakeConfluence, FakeOpenAI, FakeSlack
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Settings a developer's environment or .env file might contain that would change the scenario.
+CLEARED_SETTINGS = (
+    "DEBUG",
+    "REQUESTED_BLOGPOST_ID",
+    "INITIAL_BLOGPOST_ID",
+    "AZURE_SUMMARY_DATE",
+    "WATERMARK_STORE",
+    "SUMMARY_CACHE_PATH",
+    "HTTP_CACHE_PATH",
+    "STREAM_SUMMARY",
+    "MODE",
+    "SLACK_CHANNELS",
+)
+
+
+def service_options(options, service: str) -> dict:
+    """
+    Returns the latency and fault settings of a fake service from the command line options.
+
+    `--error-rate` and `--rate-limit-rate` apply to OpenAI and Slack, whose clients retry errors and 429
+    responses, unless they are overridden per service. The Confluence and Azure sources are fault-free unless
+    `--source-error-rate` or `--source-rate-limit-rate` is given.
+
+    Parameters
+    ----------
+    service : str
+        `openai`, `slack` or `source`.
+    """
+    error_rate = getattr(options, f"{service}_error_rate")
+    rate_limit_rate = getattr(options, f"{service}_rate_limit_rate")
+
+    if service != "source":
+        error_rate = options.error_rate if error_rate is None else error_rate
+        rate_limit_rate = (
+            options.rate_limit_rate if rate_limit_rate is None else rate_limit_rate
+        )
+
+    return {
+        "latency": options.openai_latency if service == "openai" else options.latency,
+        "error_rate": error_rate or 0.0,
+        "rate_limit_rate": rate_limit_rate or 0.0,
+        "retry_after": options.retry_after,
+    }
+
+
+def run_script(mode: str, environment: dict, log) -> tuple[int, float]:
+    """
+    Runs a mode of `main.py` with the given environment variables.
+
+    Returns
+    -------
+    tuple[int, float]
+        The exit code and the wall time in seconds.
+    """
+    env = {**os.environ, **{name: "" for name in CLEARED_SETTINGS}, **environment}
+
+    started = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, "main.py", mode],
+        cwd=ROOT,
+        env=env,
+        stdout=log,
+        stderr=subprocess.STDOUT,
+    )
+    return process.returncode, time.perf_counter() - started
+
+
+def common_environment(slack: FakeSlack, openai: FakeOpenAI, extra: dict) -> dict:
+    return {
+        "OPENAI_API_KEY": "sk-load-test",
+        "OPENAI_API_BASE": f"{openai.url}/v1",
+        "SLACK_TOKEN": "xoxb-load-test",
+        "SLACK_CHANNEL": "C0LOADTEST",
+        "SLACK_API_URL": f"{slack.url}/api/",
+        **extra,
+    }
+
+
+def confluence_metadata(confluence: FakeConfluence) -> dict:
+    return {
+        "event_type": "blogpost_summary",
+        "event_payload": {
+            "id": confluence.last_summarized_id,
+            "action_trigger": "scheduled",
+        },
+    }
+
+
+def azure_metadata(azure: FakeAzure) -> dict:
+    return {
+        "event_type": "azure_blogpost",
+        "event_payload": {
+            "id": "load-test",
+            "action_trigger": "scheduled",
+            "date_published": str((azure.day - timedelta(days=1)).date()),
+        },
+    }
+
+
+def confluence_environment(confluence: FakeConfluence) -> dict:
+    return {
+        "BASE_URL": confluence.url,
+        "CONFLUENCE_USERNAME": "load-test",
+        "CONFLUENCE_TOKEN": "load-test",
+    }
+
+
+def run_confluence(options, extra: dict, log) -> dict:
+    """
+    Runs the Confluence scenario: `options.posts` new blog posts since the last summary.
+    """
+    with ExitStack() as stack:
+        confluence = stack.enter_context(
+            FakeConfluence(options.posts, **service_options(options, "source"))
+        )
+        slack = stack.enter_context(
+            FakeSlack(
+                confluence_metadata(confluence), **service_options(options, "slack")
+            )
+        )
+        openai = stack.enter_context(FakeOpenAI(**service_options(options, "openai")))
+
+        exit_code, wall_time = run_script(
+            "confluence",
+            {
+                **confluence_environment(confluence),
+                **common_environment(slack, openai, extra),
+            },
+            log,
+        )
+
+        return {
+            "scenario": "confluence",
+            "posts": options.posts,
+            "exit_code": exit_code,
+            "wall_time_s": wall_time,
+            "services": {
+                service.name: service.report()
+                for service in (confluence, slack, openai)
+            },
+        }
+
+
+def run_azure(options, extra: dict, log) -> dict:
+    """
+    Runs the Azure scenario: one new day with `options.items` updates.
+    """
+    with ExitStack() as stack:
+        azure = stack.enter_context(
+            FakeAzure(options.items, **service_options(options, "source"))
+        )
+        slack = stack.enter_context(
+            FakeSlack(azure_metadata(azure), **service_options(options, "slack"))
+        )
+        openai = stack.enter_context(FakeOpenAI(**service_options(options, "openai")))
+
+        exit_code, wall_time = run_script(
+            "azure",
+            {
+                "AZURE_RSS_URL": f"{azure.url}/feed",
+                **common_environment(slack, openai, extra),
+            },
+            log,
+        )
+
+        return {
+            "scenario": "azure",
+            "items": options.items,
+            "exit_code": exit_code,
+            "wall_time_s": wall_time,
+            "services": {
+                service.name: service.report() for service in (azure, slack, openai)
+            },
+        }
+
+
+def run_stream(options, extra: dict, log) -> dict:
+    """
+    Runs the streaming scenario: the newest blog post is requested and its summary is streamed to Slack.
+    """
+    with ExitStack() as stack:
+        confluence = stack.enter_context(
+            FakeConfluence(1, **service_options(options, "source"))
+        )
+        slack = stack.enter_context(
+            FakeSlack(
+                confluence_metadata(confluence), **service_options(options, "slack")
+            )
+        )
+        openai = stack.enter_context(
+            FakeOpenAI(
+                stream_delay=options.stream_delay, **service_options(options, "openai")
+            )
+        )
+
+        exit_code, wall_time = run_script(
+            "confluence",
+            {
+                **confluence_environment(confluence),
+                **common_environment(
+                    slack,
+                    openai,
+                    {
+                        "REQUESTED_BLOGPOST_ID": confluence.posts[-1]["id"],
+                        "STREAM_SUMMARY": "1",
+                        "SLACK_UPDATE_INTERVAL": f"{options.stream_delay * 2:g}",
+                        **extra,
+                    },
+                ),
+            },
+            log,
+        )
+
+        return {
+            "scenario": "stream",
+            "exit_code": exit_code,
+            "wall_time_s": wall_time,
+            "services": {
+                service.name: service.report()
+                for service in (confluence, slack, openai)
+            },
+        }
+
+
+def run_all(options, extra: dict, log) -> dict:
+    """
+    Runs both scenarios concurrently in one process, sharing the Slack and OpenAI fakes.
+    """
+    with ExitStack() as stack:
+        confluence = stack.enter_context(
+            FakeConfluence(options.posts, **service_options(options, "source"))
+        )
+        azure = stack.enter_context(
+            FakeAzure(options.items, **service_options(options, "source"))
+        )
+        slack = stack.enter_context(
+            FakeSlack(
+                [confluence_metadata(confluence), azure_metadata(azure)],
+                **service_options(options, "slack"),
+            )
+        )
+        openai = stack.enter_context(FakeOpenAI(**service_options(options, "openai")))
+
+        exit_code, wall_time = run_script(
+            "all",
+            {
+                **confluence_environment(confluence),
+                "AZURE_RSS_URL": f"{azure.url}/feed",
+                **common_environment(slack, openai, extra),
+            },
+            log,
+        )
+
+        return {
+            "scenario": "all",
+            "posts": options.posts,
+            "items": options.items,
+            "exit_code": exit_code,
+            "wall_time_s": wall_time,
+            "services": {
+                service.name: service.report()
+                for service in (confluence, azure, slack, openai)
+            },
+        }
+
+
+def print_report(report: dict):
+    """
+    Prints the report of a scenario.
+    """
+    print(
+        f"{report['scenario']}: exit code {report['exit_code']}, wall time {report['wall_time_s']:.2f}s"
+    )
+
+    for name, service in report["services"].items():
+        endpoints = ", ".join(
+            f"{endpoint} {count}"
+            for endpoint, count in sorted(service["endpoints"].items())
+        )
+        statuses = ", ".join(
+            f"{status}: {count}"
+            for status, count in sorted(service["statuses"].items())
+        )
+        print(f"  {name:<11} {service['calls']:>6} calls ({endpoints}) [{statuses}]")
+
+    openai = report["services"]["openai"]
+    print(
+        f"  tokens      {openai['total_tokens']:>6} ({openai['prompt_tokens']} prompt, "
+        f"{openai['completion_tokens']} completion)"
+    )
+    print(
+        f"  slack       {report['services']['slack']['messages_posted']:>6} messages posted"
+    )
+    if openai["streamed"]:
+        print(f"  openai      {openai['streamed']:>6} completions streamed")
+
+
+def main():
+    arguments = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arguments.add_argument("scenario", choices=("confluence", "azure", "all", "stream"))
+    arguments.add_argument(
+        "--posts", type=int, default=50, help="new Confluence posts to summarize"
+    )
+    arguments.add_argument(
+        "--items", type=int, default=60, help="Azure updates on the new day"
+    )
+    arguments.add_argument(
+        "--latency",
+        type=float,
+        default=0.02,
+        help="mean latency of Confluence, Slack and Azure in seconds",
+    )
+    arguments.add_argument(
+        "--openai-latency",
+        type=float,
+        default=0.5,
+        help="mean latency of OpenAI in seconds",
+    )
+    arguments.add_argument(
+        "--stream-delay",
+        type=float,
+        default=0.05,
+        help="seconds between two chunks of a streamed OpenAI completion",
+    )
+    arguments.add_argument(
+        "--error-rate",
+        type=float,
+        default=0.0,
+        help="share of 500 responses of OpenAI and Slack",
+    )
+    arguments.add_argument(
+        "--rate-limit-rate",
+        type=float,
+        default=0.0,
+        help="share of 429 responses of OpenAI and Slack",
+    )
+    for service, name in (
+        ("openai", "OpenAI"),
+        ("slack", "Slack"),
+        ("source", "Confluence and Azure"),
+    ):
+        arguments.add_argument(
+            f"--{service}-error-rate",
+            type=float,
+            help=f"share of 500 responses of {name}"
+            + ("" if service == "source" else ", overrides --error-rate"),
+        )
+        arguments.add_argument(
+            f"--{service}-rate-limit-rate",
+            type=float,
+            help=f"share of 429 responses of {name}"
+            + ("" if service == "source" else ", overrides --rate-limit-rate"),
+        )
+    arguments.add_argument(
+        "--retry-after",
+        type=float,
+        default=1.0,
+        help="Retry-After of 429 responses in seconds",
+    )
+    arguments.add_argument(
+        "--env",
+        action="append",
+        default=[],
+        metavar="NAME=VALUE",
+        help="additional environment variable for the script, e.g. OPENAI_MAX_CONCURRENCY=16",
+    )
+    arguments.add_argument(
+        "--log", help="file for the output of the scripts, discarded by default"
+    )
+    arguments.add_argument("--output", help="path of a JSON file for the reports")
+    options = arguments.parse_args()
+
+    extra = dict(setting.split("=", 1) for setting in options.env)
+
+    scenarios = {
+        "confluence": [run_confluence],
+        "azure": [run_azure],
+        "all": [run_all],
+        "stream": [run_stream],
+    }[options.scenario]
+
+    reports = []
+    with open(options.log or os.devnull, "w", encoding="utf-8") as log:
+        for scenario in scenarios:
+            report = scenario(options, extra, log)
+            print_report(report)
+            reports.append(report)
+
+    if options.output:
+        with open(options.output, "w", encoding="utf-8") as file:
+            json.dump(reports, file, indent=2)
+
+    if any(report["exit_code"] for report in reports):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""
+Start-up benchmark of `main.py` for runs that find nothing new.
+
+Each run starts `python -X importtime main.py <mode>` against the local fakes of `benchmarks.fakes`, with the
+last summary being the newest post, and measures the wall time, the time from the process start to the
+first request any fake receives, the total import time and which heavy dependencies were imported.
+
+Run from the repository root, e.g.:
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup confluence --runs 10 --watermark-store
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import ExitStack
+
+from benchmarks.fakes import FakeAzure, FakeConfluence, FakeSlack
+from benchmarks.load_harness import (
+    CLEARED_SETTINGS,
+    ROOT,
+    azure_metadata,
+    confluence_environment,
+)
+from client_modules.watermark_store import Watermark, create_watermark_store
+
+# Dependencies whose import time matters for the start-up, reported as `heavy_imports`.
+HEAVY_IMPORTS = ("openai", "slack_sdk", "bs4", "feedparser", "dateutil", "requests")
+
+
+def parse_importtime(output: str) -> tuple[float, dict]:
+    """
+    Parses the `-X importtime` output of a process.
+
+    Returns
+    -------
+    tuple[float, dict]
+        The total import time in ms and the cumulative import time in ms of each package of
+        `HEAVY_IMPORTS` that was imported.
+    """
+    total = 0.0
+    heavy = {}
+
+    for line in output.splitlines():
+        if not line.startswith("import time:") or line.count("|") != 2:
+            continue
+
+        _, cumulative, name = line[len("import time:") :].split("|")
+        if not cumulative.strip().isdigit():
+            continue
+
+        # Top-level imports have a single space of indentation, nested imports are part of them
+        if not name.startswith("  "):
+            total += int(cumulative) / 1000
+        package = name.strip().split(".")[0]
+        if package in HEAVY_IMPORTS:
+            heavy[package] = max(heavy.get(package, 0), int(cumulative) / 1000)
+
+    return total, heavy
+
+
+def run_once(mode: str, environment: dict, services: list) -> dict:
+    """
+    Runs `main.py` once and measures its start-up.
+    """
+    for service in services:
+        service.first_request_at = None
+
+    env = {**os.environ, **{name: "" for name in CLEARED_SETTINGS}, **environment}
+
+    started_at = time.time()
+    started = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "main.py", mode],
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    wall_time = time.perf_counter() - started
+
+    first_requests = [
+        service.first_request_at
+        for service in services
+        if service.first_request_at is not None
+    ]
+    import_time, heavy_imports = parse_importtime(process.stderr)
+
+    return {
+        "exit_code": process.returncode,
+        "wall_time_ms": wall_time * 1000,
+        "first_request_ms": (min(first_requests) - started_at) * 1000
+        if first_requests
+        else None,
+        "import_ms": import_time,
+        "heavy_imports": {
+            name: round(heavy_imports[name], 1)
+            for name in HEAVY_IMPORTS
+            if name in heavy_imports
+        },
+    }
+
+
+def benchmark(mode: str, runs: int, watermark_store: bool) -> dict:
+    """
+    Runs the start-up benchmark of a mode.
+
+    Parameters
+    ----------
+    mode : str
+        `confluence` or `azure`.
+    runs : int
+        The number of measured runs.
+    watermark_store : bool
+        Whether the last summary is read from a watermark store instead of the Slack history.
+
+    Returns
+    -------
+    dict
+        The medians of the measurements and the heavy imports of the last run.
+    """
+    with ExitStack() as stack:
+        slack_channel = "C0STARTUP"
+        environment = {
+            "OPENAI_API_KEY": "sk-startup",
+            "SLACK_TOKEN": "xoxb-startup",
+            "SLACK_CHANNEL": slack_channel,
+        }
+
+        if mode == "confluence":
+            source = stack.enter_context(FakeConfluence(0))
+            metadata = {
+                "event_type": "blogpost_summary",
+                "event_payload": {
+                    "id": source.last_summarized_id,
+                    "action_trigger": "scheduled",
+                },
+            }
+            environment.update(confluence_environment(source))
+            watermarks = {
+                Watermark.CONFLUENCE_ID: source.last_summarized_id,
+                Watermark.CONFLUENCE_CREATED: source.posts[0]["history"]["createdDate"],
+            }
+        else:
+            source = stack.enter_context(FakeAzure(5))
+            metadata = azure_metadata(source)
+            metadata["event_payload"]["date_published"] = str(source.day.date())
+            environment["AZURE_RSS_URL"] = f"{source.url}/feed"
+            watermarks = {Watermark.AZURE_DATE: str(source.day.date())}
+
+        slack = stack.enter_context(FakeSlack(metadata))
+        environment["SLACK_API_URL"] = f"{slack.url}/api/"
+
+        if watermark_store:
+            directory = stack.enter_context(tempfile.TemporaryDirectory())
+            url = f"file://{directory}/watermarks.json"
+            store = create_watermark_store(url)
+            for watermark, value in watermarks.items():
+                store.set(slack_channel, watermark, value)
+            environment["WATERMARK_STORE"] = url
+
+        results = [run_once(mode, environment, [source, slack]) for _ in range(runs)]
+
+    failed = [result for result in results if result["exit_code"]]
+    if failed:
+        raise RuntimeError(f"main.py {mode} exited with {failed[0]['exit_code']}")
+
+    return {
+        "mode": mode,
+        "watermark_store": watermark_store,
+        "runs": runs,
+        "wall_time_ms": statistics.median(r["wall_time_ms"] for r in results),
+        "first_request_ms": statistics.median(
+            r["first_request_ms"] for r in results if r["first_request_ms"] is not None
+        ),
+        "import_ms": statistics.median(r["import_ms"] for r in results),
+        "heavy_imports": results[-1]["heavy_imports"],
+    }
+
+
+def main():
+    arguments = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arguments.add_argument(
+        "mode", nargs="?", choices=("confluence", "azure", "all"), default="all"
+    )
+    arguments.add_argument("--runs", type=int, default=5, help="measured runs per mode")
+    arguments.add_argument(
+        "--watermark-store",
+        action="store_true",
+        help="read the last summary from a watermark store instead of the Slack history",
+    )
+    arguments.add_argument("--output", help="path of a JSON file for the reports")
+    options = arguments.parse_args()
+
+    reports = []
+    print(
+        f"{'mode':<11} {'wall ms':>9} {'first request ms':>17} {'imports ms':>11}  heavy imports (ms)"
+    )
+
+    modes = ["confluence", "azure"] if options.mode == "all" else [options.mode]
+    for mode in modes:
+        report = benchmark(mode, options.runs, options.watermark_store)
+        reports.append(report)
+
+        heavy = ", ".join(
+            f"{name} {duration:.0f}"
+            for name, duration in report["heavy_imports"].items()
+        )
+        print(
+            f"{mode:<11} {report['wall_time_ms']:>9.0f} {report['first_request_ms']:>17.0f} "
+            f"{report['import_ms']:>11.0f}  {heavy}"
+        )
+
+    if options.output:
+        with open(options.output, "w", encoding="utf-8") as file:
+            json.dump(reports, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
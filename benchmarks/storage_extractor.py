@@ -0,0 +1,53 @@
+"""
+Micro-benchmark of the Confluence storage format text extraction.
+
+Compares the streaming `extract_storage_text` with the previous BeautifulSoup `get_text()` implementation
+on the sample posts in `benchmarks/fixtures`, repeated to simulate small, medium and large posts.
+
+Run from the repository root:
+
+    python -m benchmarks.storage_extractor
+"""
+import glob
+import os
+
+from bs4 import BeautifulSoup
+
+from benchmarks.timing import measure
+from client_modules.storage_extractor import extract_storage_text
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+REPEATS = (1, 20, 200)
+
+
+def extract_with_beautifulsoup(storage: str) -> str:
+    """
+    The previous implementation of `BlogPost.extract_text`.
+    """
+    return BeautifulSoup(storage, "html.parser").get_text()
+
+
+def main():
+    print(
+        f"{'fixture':<28} {'size':>9} {'implementation':<15} {'median ms':>10} {'peak KiB':>10}"
+    )
+
+    for path in sorted(glob.glob(os.path.join(FIXTURES, "confluence_*.xml"))):
+        with open(path, encoding="utf-8") as file:
+            sample = file.read()
+
+        for repeat in REPEATS:
+            storage = sample * repeat
+            for name, function in (
+                ("beautifulsoup", extract_with_beautifulsoup),
+                ("streaming", extract_storage_text),
+            ):
+                duration, peak = measure(function, storage)
+                print(
+                    f"{os.path.basename(path):<28} {len(storage) // 1024:>6} KiB {name:<15} "
+                    f"{duration * 1000:>10.2f} {peak // 1024:>10}"
+                )
+
+
+if __name__ == "__main__":
+    main()
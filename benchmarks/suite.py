@@ -0,0 +1,230 @@
+"""
+Offline benchmark suite for the extraction, feed parsing, section splitting and Slack block building.
+
+All benchmarks run against the recorded fixtures in `benchmarks/fixtures`. Azure pages and the feed are
+served by a local fixture server, so no external service is contacted. The results are printed and saved as
+JSON, which can be compared with the results of another commit.
+
+Run from the repository root:
+
+    python -m benchmarks.suite
+    python -m benchmarks.suite --compare benchmarks/results/<other commit>.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime, timezone
+
+from benchmarks.fixture_server import FixtureServer, read_fixture
+from benchmarks.timing import profile
+from client_modules.azure_feedreader import create_channel
+from client_modules.confluence import ConfluenceSearchResponse
+from client_modules.http_transport import HttpTransport
+from client_modules.slack_client import (
+    azure_summary_blocks,
+    confluence_summary_blocks,
+    split_sections_by_blank_lines,
+)
+
+RESULTS = os.path.join(os.path.dirname(__file__), "results")
+
+
+def current_commit() -> str:
+    """
+    Returns the abbreviated hash of the checked out commit, or `unknown` outside of a git checkout.
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_benchmarks(iterations: int) -> list:
+    """
+    Runs all benchmarks of the suite.
+
+    Parameters
+    ----------
+    iterations : int
+        The number of timed calls per benchmark.
+
+    Returns
+    -------
+    list
+        The results of all benchmarks, see `benchmarks.timing.profile`.
+    """
+    results = []
+
+    search = json.loads(read_fixture("confluence_search.json"))
+    results.append(
+        profile(
+            "confluence.extract_text",
+            lambda response: [post.extract_text() for post in response.results],
+            iterations,
+            len(search["results"]),
+            setup=lambda: ConfluenceSearchResponse(search),
+        )
+    )
+
+    with FixtureServer() as server:
+        transport = HttpTransport()
+        feed_url = f"{server.base_url}/feed"
+
+        channel = create_channel(feed_url, transport)
+        results.append(
+            profile(
+                "azure.create_channel",
+                lambda: create_channel(feed_url, transport),
+                iterations,
+                len(channel.items),
+            )
+        )
+        results.append(
+            profile(
+                "azure.group_by_day",
+                channel.group_by_day,
+                iterations,
+                len(channel.items),
+            )
+        )
+
+        items = channel.items[:10]
+        results.append(
+            profile(
+                "azure.extract_blog_text",
+                lambda: [item.extract_blog_text(transport) for item in items],
+                iterations,
+                len(items),
+            )
+        )
+
+    summary = read_fixture("azure_summary.txt")
+    sections = split_sections_by_blank_lines(summary)
+    results.append(
+        profile(
+            "slack.split_sections_by_blank_lines",
+            lambda: split_sections_by_blank_lines(summary),
+            iterations,
+            len(sections),
+        )
+    )
+    results.append(
+        profile(
+            "slack.confluence_summary_blocks",
+            lambda: confluence_summary_blocks(
+                summary, "Engineering Blog #1", "https://example.atlassian.net/x/AbC0"
+            ),
+            iterations,
+        )
+    )
+    results.append(
+        profile(
+            "slack.azure_summary_blocks",
+            lambda: azure_summary_blocks(sections, "2023-08-21"),
+            iterations,
+        )
+    )
+
+    return results
+
+
+def print_results(results: list, baseline: dict = None):
+    """
+    Prints the results as a table, including the change of the p50 time against a baseline.
+    """
+    print(
+        f"{'benchmark':<38} {'p50 ms':>9} {'p95 ms':>9} {'items/s':>11} {'peak KiB':>10} {'vs base':>8}"
+    )
+
+    for result in results:
+        change = ""
+        if baseline and result["name"] in baseline:
+            change = f"{result['p50_ms'] / baseline[result['name']]['p50_ms']:.2f}x"
+
+        print(
+            f"{result['name']:<38} {result['p50_ms']:>9.3f} {result['p95_ms']:>9.3f} "
+            f"{result['throughput_per_s']:>11.0f} {result['peak_kib']:>10.1f} {change:>8}"
+        )
+
+
+def find_regressions(results: list, baseline: dict, tolerance: float) -> list:
+    """
+    Returns the names of the benchmarks whose p50 time grew by more than `tolerance` against the baseline.
+    """
+    return [
+        result["name"]
+        for result in results
+        if result["name"] in baseline
+        and result["p50_ms"] > baseline[result["name"]]["p50_ms"] * tolerance
+    ]
+
+
+def main():
+    arguments = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arguments.add_argument(
+        "--iterations", type=int, default=50, help="timed calls per benchmark"
+    )
+    arguments.add_argument(
+        "--output",
+        help="path of the JSON results, defaults to benchmarks/results/<commit>.json",
+    )
+    arguments.add_argument(
+        "--compare", help="JSON results of another run to compare the p50 times with"
+    )
+    arguments.add_argument(
+        "--tolerance",
+        type=float,
+        default=1.5,
+        help="p50 growth factor above which a benchmark counts as regression",
+    )
+    options = arguments.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    commit = current_commit()
+    results = run_benchmarks(options.iterations)
+
+    baseline = None
+    if options.compare:
+        with open(options.compare, encoding="utf-8") as file:
+            baseline = {result["name"]: result for result in json.load(file)["results"]}
+
+    print_results(results, baseline)
+
+    output = options.output or os.path.join(RESULTS, f"{commit}.json")
+    directory = os.path.dirname(output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(
+            {
+                "commit": commit,
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "python": platform.python_version(),
+                "iterations": options.iterations,
+                "results": results,
+            },
+            file,
+            indent=2,
+        )
+    print(f"Saved results to {output}")
+
+    if baseline:
+        regressions = find_regressions(results, baseline, options.tolerance)
+        if regressions:
+            print(f"Regressions beyond {options.tolerance}x: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import math
+import statistics
+import time
+import tracemalloc
+
+ROUNDS = 5
+MIN_SAMPLE_SECONDS = 0.001
+
+
+def measure(function, *args, rounds: int = ROUNDS) -> tuple[float, int]:
+    """
+    Measures the median run time in seconds and the peak memory in bytes of a function call.
+
+    The run time is measured over `rounds` calls without memory tracing, the peak memory during one
+    additional traced call.
+    """
+    durations = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        function(*args)
+        durations.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    function(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return statistics.median(durations), peak
+
+
+def percentile(durations: list, share: float) -> float:
+    """
+    Returns the value below which `share` of the sorted durations lie (nearest rank).
+    """
+    ordered = sorted(durations)
+    index = min(len(ordered) - 1, max(0, math.ceil(share * len(ordered)) - 1))
+    return ordered[index]
+
+
+def profile(
+    name: str, function, iterations: int, items_per_call: int = 1, setup=None
+) -> dict:
+    """
+    Profiles a function over several iterations after one warm-up call.
+
+    Parameters
+    ----------
+    name : str
+        The name of the benchmark.
+    function : Callable
+        The function to profile. It is called with the result of `setup`, if given.
+    iterations : int
+        The number of timed calls.
+    items_per_call : int
+        The number of items, e.g. posts or pages, one call processes. Used for the throughput.
+    setup : Callable, optional
+        Called before every call outside of the timing, e.g. to create fresh objects. Calls with a setup are
+        never repeated within one sample.
+
+    Returns
+    -------
+    dict
+        The name, the p50, p95 and mean time per call in milliseconds, the throughput in items per second
+        and the peak memory of one call in KiB.
+    """
+
+    number = 1
+
+    def timed() -> float:
+        arguments = (setup(),) if setup is not None else ()
+        started = time.perf_counter()
+        for _ in range(number):
+            function(*arguments)
+        return (time.perf_counter() - started) / number
+
+    # Calls much shorter than a millisecond are repeated per sample, so timer resolution does not dominate
+    warm_up = timed()
+    if setup is None and warm_up < MIN_SAMPLE_SECONDS:
+        number = math.ceil(MIN_SAMPLE_SECONDS / max(warm_up, 1e-7))
+
+    durations = [timed() for _ in range(max(1, iterations))]
+
+    arguments = (setup(),) if setup is not None else ()
+    tracemalloc.start()
+    function(*arguments)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    mean = statistics.mean(durations)
+    return {
+        "name": name,
+        "iterations": len(durations),
+        "items_per_call": items_per_call,
+        "p50_ms": percentile(durations, 0.5) * 1000,
+        "p95_ms": percentile(durations, 0.95) * 1000,
+        "mean_ms": mean * 1000,
+        "throughput_per_s": items_per_call / mean if mean else None,
+        "peak_kib": peak / 1024,
+    }
@@ -1,15 +1,25 @@
+import threading
+import time
 from collections import defaultdict
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+from urllib.parse import urlparse
 
 import feedparser
-import requests
-from bs4 import BeautifulSoup
 from dateutil import parser
 
+from client_modules.azure_page_extractor import PageExtraction, extract_update_text
+from client_modules.http_transport import HttpTransport, default_transport
+from client_modules.metrics import StageRecord, default_metrics
+from client_modules.storage_extractor import extract_storage_text
+
 import logging
 
 logging.getLogger(__name__)
 
+# Endings of feed content that was cut off and links to the full article.
+TRUNCATION_MARKERS = ("…", "...", "[…]", "[...]", "Read more", "Learn more")
+
 
 class FeedItem:
     """
@@ -67,38 +77,251 @@ class FeedItem:
         self.comment_rss = comment_rss.strip()  # Remove newline characters
         self.num_comments = num_comments
         self.parsed_date = parser.parse(pub_date)
+        self._feed_text = None
+
+    def feed_text(self) -> str:
+        """
+        Extracts the plain text of the content embedded in the feed entry.
+
+        The encoded content is preferred over the description. The text is memoized.
+
+        Returns
+        -------
+        str
+            The embedded text, or an empty string if the entry carries no content.
+        """
+        if self._feed_text is None:
+            self._feed_text = ""
+            for content in (self.content_encoded, self.description):
+                if content and content != "N/A":
+                    self._feed_text = extract_storage_text(content)
+                    if self._feed_text:
+                        break
+
+        return self._feed_text
+
+    def content_source(self, min_feed_chars: int = None) -> str:
+        """
+        Decides whether the blog text is taken from the feed entry or from the linked page.
+
+        The embedded content is used if it has at least `min_feed_chars` characters and does not look
+        truncated. Otherwise it is considered a stub and the page has to be fetched.
+
+        Parameters
+        ----------
+        min_feed_chars : int, optional
+            The minimum length of usable feed content. If None, the page is always fetched.
+
+        Returns
+        -------
+        str
+            `feed` or `page`.
+        """
+        if min_feed_chars is None:
+            return "page"
+
+        text = self.feed_text()
+        if len(text) < min_feed_chars or text.rstrip().endswith(TRUNCATION_MARKERS):
+            return "page"
+
+        return "feed"
 
-    def extract_blog_text(self) -> str:
+    def extract_blog_text(self, transport: HttpTransport = None) -> str:
         """
         Extracts the blog text from the feed item's link.
 
+        Parameters
+        ----------
+        transport : HttpTransport, optional
+            The pooled HTTP transport to use. Defaults to the transport shared by the process.
+
         Returns
         -------
         str
             The extracted blog text.
         """
-        url = self.link
-        response = requests.get(url)
-        soup = BeautifulSoup(response.text, "html.parser")
+        return self.fetch_page(transport).text
 
-        # Select the specific div using its XPath
-        specific_div = soup.select("body > main > div > div:nth-of-type(2)")
+    def fetch_page(
+        self, transport: HttpTransport = None, trace_memory: bool = False
+    ) -> PageExtraction:
+        """
+        Fetches the feed item's link and extracts the blog text, see `extract_update_text`. The page is requested
+        through the HTTP cache of the transport, if it has one. Both steps are recorded in the `page_fetch` and
+        `extraction` stages of the shared metrics.
 
-        for ul in specific_div[0].find_all("ul"):
-            ul.decompose()
+        Parameters
+        ----------
+        transport : HttpTransport, optional
+            The pooled HTTP transport to use. Defaults to the transport shared by the process.
+        trace_memory : bool
+            Whether the peak memory of the extraction is measured, see `extract_update_text`.
+
+        Returns
+        -------
+        PageExtraction
+            The extracted blog text, the parser path that was used, the parse time and the peak memory if traced.
+        """
+        metrics = default_metrics()
+        with metrics.stage("page_fetch") as stage:
+            response = (transport or default_transport()).get_cached(self.link)
+            stage.add_bytes(len(response.content))
 
-        # Extract the text within the div
-        raw_text = specific_div[0].get_text(separator="\n")
+        page = extract_update_text(response.text, self.link, trace_memory)
 
-        # Split the text into lines, filter out the empty lines, and join the lines back together
-        blog_text = "\n".join(
-            line
-            for line in raw_text.split("\n")
-            if line.strip()
-            and line.strip() not in ["Additional resources:", "Related Products"]
+        record = StageRecord()
+        record.add_bytes(len(response.content))
+        metrics.record("extraction", page.duration, record)
+
+        return page
+
+
+class FetchResult:
+    """
+    Class holding the outcome of fetching and extracting a single feed item.
+
+    Parameters
+    ----------
+    item : FeedItem
+        The feed item the text was extracted from.
+    text : str
+        The extracted blog text.
+    duration : float
+        The time in seconds it took to fetch and extract the item.
+    parse_path : str
+        `fast` or `full`, the parser path that extracted the text, or `feed` if the feed content was used.
+    parse_duration : float
+        The time in seconds it took to parse the page.
+    parse_peak_memory : int, optional
+        The peak memory of the parse in bytes, or None if it was not traced.
+    """
+
+    def __init__(
+        self,
+        item,
+        text,
+        duration,
+        parse_path=None,
+        parse_duration=0.0,
+        parse_peak_memory=None,
+    ):
+        self.item: FeedItem = item
+        self.text: str = text
+        self.duration: float = duration
+        self.parse_path: str = parse_path
+        self.parse_duration: float = parse_duration
+        self.parse_peak_memory: Optional[int] = parse_peak_memory
+
+
+def fetch_blog_texts(
+    items: List[FeedItem],
+    max_workers: int = 8,
+    max_per_host: int = 4,
+    transport: HttpTransport = None,
+    min_feed_chars: int = None,
+    trace_memory: bool = False,
+) -> List[FetchResult]:
+    """
+    Fetches and extracts the blog text of several feed items concurrently.
+
+    Items whose feed content is sufficient according to `FeedItem.content_source` are not fetched at all. They
+    are recorded in the `feed_content` stage of the shared metrics.
+
+    The items are processed by a bounded pool of worker threads. Additionally, no more than `max_per_host`
+    requests are in flight against the same host at any time. The results are returned in the order of the
+    provided items, regardless of the order in which the fetches complete.
+
+    Parameters
+    ----------
+    items : List[FeedItem]
+        The feed items to extract the blog text from.
+    max_workers : int
+        The maximum number of worker threads.
+    max_per_host : int
+        The maximum number of concurrent requests per host.
+    transport : HttpTransport, optional
+        The pooled HTTP transport to use. Defaults to the transport shared by the process.
+    min_feed_chars : int, optional
+        The minimum length of feed content that is used instead of fetching the page. If None, every page is
+        fetched.
+    trace_memory : bool
+        Whether the peak memory of every page extraction is measured and logged, see `extract_update_text`.
+
+    Returns
+    -------
+    List[FetchResult]
+        The extraction results in the order of `items`, including the time each item took.
+    """
+    if not items:
+        return []
+
+    host_limits = {
+        urlparse(item.link).netloc: threading.BoundedSemaphore(max(1, max_per_host))
+        for item in items
+    }
+
+    def fetch(item: FeedItem) -> FetchResult:
+        if item.content_source(min_feed_chars) == "feed":
+            logging.info(f"Using the feed content of '{ item.title }'")
+            text = item.feed_text()
+
+            # Every run of the stage is a page fetch the feed content avoided
+            record = StageRecord()
+            record.add_bytes(len(text.encode()))
+            default_metrics().record("feed_content", 0.0, record)
+
+            return FetchResult(item, text, 0.0, "feed")
+
+        with host_limits[urlparse(item.link).netloc]:
+            started = time.perf_counter()
+            page = item.fetch_page(transport, trace_memory)
+            duration = time.perf_counter() - started
+
+        peak = (
+            f", peak memory {page.peak_memory / 1024:.0f}KiB"
+            if page.peak_memory is not None
+            else ""
+        )
+        logging.info(
+            f"Extracted '{ item.title }' in {duration:.2f}s, "
+            f"parsed with the { page.path } path in {page.duration * 1000:.1f}ms{peak}"
+        )
+        return FetchResult(
+            item, page.text, duration, page.path, page.duration, page.peak_memory
+        )
+
+    started = time.perf_counter()
+    workers = max(1, min(max_workers, len(items)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(fetch, items))
+
+    slowest = max(results, key=lambda result: result.duration)
+    logging.info(
+        f"Extracted { len(results) } Azure blog posts in {time.perf_counter() - started:.2f}s "
+        f"using { workers } workers, slowest: { slowest.item.link } ({slowest.duration:.2f}s)"
+    )
+
+    avoided = sum(1 for result in results if result.parse_path == "feed")
+    if avoided:
+        logging.info(
+            f"Used the feed content of { avoided } of { len(results) } Azure blog posts, "
+            f"avoided { avoided } page fetches"
         )
 
-        return blog_text
+    traced = [result for result in results if result.parse_peak_memory is not None]
+    if traced:
+        largest = max(traced, key=lambda result: result.parse_peak_memory)
+        logging.info(
+            f"Largest parse peak memory: { largest.item.link } ({largest.parse_peak_memory / 1024:.0f}KiB)"
+        )
+
+    fallbacks = sum(1 for result in results if result.parse_path == "full")
+    if fallbacks:
+        logging.warning(
+            f"{ fallbacks } of { len(results) } Azure pages needed the full parse"
+        )
+
+    return results
 
 
 class FeedChannel:
@@ -189,21 +412,33 @@ class FeedChannel:
             self.items.append(item)
 
 
-def create_channel(feed_url) -> FeedChannel:
+def create_channel(feed_url, transport: HttpTransport = None) -> FeedChannel:
     """
-    Creates a FeedChannel object from a provided feed URL.
+    Creates a FeedChannel object from a provided feed URL. The feed is requested through the HTTP cache of the
+    transport, if it has one.
 
     Parameters
     ----------
     feed_url : str
         The URL of the feed.
+    transport : HttpTransport, optional
+        The pooled HTTP transport to use. Defaults to the transport shared by the process.
 
     Returns
     -------
     FeedChannel
         The created FeedChannel object.
     """
-    feed = feedparser.parse(feed_url)
+    with default_metrics().stage("rss_fetch") as stage:
+        response = (transport or default_transport()).get_cached(feed_url)
+        stage.add_bytes(len(response.content))
+
+    # feedparser looks the headers up by lowercase name, e.g. the charset in `content-type`
+    headers = {name.lower(): value for name, value in response.headers.items()}
+    feed = feedparser.parse(
+        response.content,
+        response_headers={**headers, "content-location": feed_url},
+    )
 
     # Define defaults for missing values
     defaults = {
@@ -239,7 +474,9 @@ def create_channel(feed_url) -> FeedChannel:
             category=getattr(entry, "category", "N/A"),
             guid=getattr(entry, "guid", "N/A"),
             description=getattr(entry, "description", "N/A"),
-            content_encoded=getattr(entry, "content_encoded", "N/A"),
+            content_encoded=entry.content[0].value
+            if getattr(entry, "content", None)
+            else getattr(entry, "content_encoded", "N/A"),
             comment_rss=getattr(entry, "wfw_commentrss", "N/A"),
             num_comments=getattr(entry, "slash_comments", "N/A"),
         )
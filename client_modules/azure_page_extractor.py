@@ -0,0 +1,265 @@
+import logging
+import threading
+import time
+import tracemalloc
+from html.parser import HTMLParser
+from typing import List, Optional
+
+logging.getLogger(__name__)
+
+# Lines that are part of every Azure update page but not of the update itself.
+IGNORED_LINES = ["Additional resources:", "Related Products"]
+
+# tracemalloc measures the whole process, so extractions with traced memory run one at a time.
+_trace_lock = threading.Lock()
+
+# Elements that are skipped including their content while walking the article.
+_SKIPPED_TAGS = {"ul", "script", "style", "template", "noscript"}
+
+# HTML void elements, which never have an end tag.
+_VOID_TAGS = {
+    "area",
+    "base",
+    "br",
+    "col",
+    "embed",
+    "hr",
+    "img",
+    "input",
+    "link",
+    "meta",
+    "source",
+    "track",
+    "wbr",
+}
+
+
+class PageExtraction:
+    """
+    Class holding the text extracted from an Azure update page and how it was extracted.
+
+    Parameters
+    ----------
+    text : str
+        The extracted update text.
+    path : str
+        `fast` if the text was extracted by the streaming parser, `full` if the whole page had to be parsed.
+    duration : float
+        The time in seconds it took to parse the page.
+    peak_memory : int, optional
+        The peak of the memory allocated while parsing the page in bytes, or None if it was not traced.
+    """
+
+    def __init__(self, text, path, duration, peak_memory=None):
+        self.text: str = text
+        self.path: str = path
+        self.duration: float = duration
+        self.peak_memory: Optional[int] = peak_memory
+
+
+class _ArticleParser(HTMLParser):
+    """
+    A streaming parser collecting the text of the element `main > div > div:nth-of-type(2)`.
+
+    Only the text nodes of the first matching element are kept, skipped elements and their children are
+    ignored while parsing. Everything after the matching element is ignored as well.
+    """
+
+    def __init__(self) -> None:
+        super().__init__(convert_charrefs=True)
+        self.texts: Optional[List[str]] = None
+        self.done = False
+        self._stack: List[str] = []
+        self._main_depth: Optional[int] = None
+        self._article_depth: Optional[int] = None
+        self._child_divs: List[int] = []
+        self._skip_depth: Optional[int] = None
+
+    def handle_starttag(self, tag, attrs):
+        if self.done or tag in _VOID_TAGS:
+            return
+
+        self._stack.append(tag)
+        depth = len(self._stack)
+
+        if self._skip_depth is not None:
+            return
+
+        if self._article_depth is not None:
+            if tag in _SKIPPED_TAGS:
+                self._skip_depth = depth
+            return
+
+        if tag == "main" and self._main_depth is None:
+            self._main_depth = depth
+            return
+
+        if self._main_depth is None or tag != "div":
+            return
+
+        if depth == self._main_depth + 1:
+            self._child_divs.append(0)
+        elif depth == self._main_depth + 2 and self._child_divs:
+            self._child_divs[-1] += 1
+            if self._child_divs[-1] == 2:
+                self._article_depth = depth
+                self.texts = []
+
+    def handle_startendtag(self, tag, attrs):
+        if tag not in _VOID_TAGS:
+            self.handle_starttag(tag, attrs)
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if self.done or tag not in self._stack:
+            return
+
+        # Implicitly close unclosed elements, as browsers do
+        while self._stack:
+            depth = len(self._stack)
+            closed = self._stack.pop()
+
+            if self._skip_depth == depth:
+                self._skip_depth = None
+            if self._article_depth == depth:
+                self.done = True
+            if self._main_depth == depth:
+                self._main_depth = None
+                self._child_divs = []
+
+            if closed == tag or self.done:
+                return
+
+    def handle_data(self, data):
+        if self.texts is not None and self._skip_depth is None and not self.done:
+            self.texts.append(data)
+
+
+def _clean_lines(raw_text: str) -> str:
+    """
+    Filters out empty and boilerplate lines.
+    """
+    return "\n".join(
+        line
+        for line in raw_text.split("\n")
+        if line.strip() and line.strip() not in IGNORED_LINES
+    )
+
+
+def extract_update_text_fast(html: str) -> Optional[str]:
+    """
+    Extracts the update text from an Azure update page without parsing the whole page.
+
+    Only the part of the document between `<main` and `</main>` is fed to a streaming parser, so the
+    navigation, footer and scripts are never tokenized. Lists are skipped while parsing.
+
+    Parameters
+    ----------
+    html : str
+        The HTML of the page.
+
+    Returns
+    -------
+    Optional[str]
+        The extracted text, or None if the page does not have the expected layout.
+    """
+    start = html.find("<main")
+    if start == -1:
+        return None
+
+    end = html.find("</main>", start)
+    parser = _ArticleParser()
+    parser.feed(html[start : end + len("</main>")] if end != -1 else html[start:])
+    parser.close()
+
+    if parser.texts is None:
+        return None
+
+    text = _clean_lines("\n".join(parser.texts))
+    return text or None
+
+
+def extract_update_text_full(html: str) -> str:
+    """
+    Extracts the update text from an Azure update page by parsing the whole page with BeautifulSoup.
+
+    Parameters
+    ----------
+    html : str
+        The HTML of the page.
+
+    Returns
+    -------
+    str
+        The extracted text, or an empty string if the page does not contain the update element.
+    """
+    # Imported here, since the full parse is only the fallback of the fast path
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, "html.parser")
+
+    # Select the specific div using its XPath
+    specific_div = soup.select("body > main > div > div:nth-of-type(2)")
+    if not specific_div:
+        return ""
+
+    for ul in specific_div[0].find_all("ul"):
+        ul.decompose()
+
+    # Extract the text within the div
+    return _clean_lines(specific_div[0].get_text(separator="\n"))
+
+
+def extract_update_text(
+    html: str, url: str = None, trace_memory: bool = False
+) -> PageExtraction:
+    """
+    Extracts the update text from an Azure update page.
+
+    The fast path is tried first. If the page layout does not match it anymore, a warning is logged and the
+    whole page is parsed instead.
+
+    Parameters
+    ----------
+    html : str
+        The HTML of the page.
+    url : str, optional
+        The URL of the page, used for logging.
+    trace_memory : bool
+        Whether the peak memory of the parse is measured with `tracemalloc`. Tracing slows down the whole
+        process and allocations of other threads during the parse are included, so it is meant for debugging.
+
+    Returns
+    -------
+    PageExtraction
+        The extracted text, the path that was used, the parse time and the peak memory if traced.
+    """
+    if not trace_memory:
+        return _extract_update_text(html, url)
+
+    with _trace_lock:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        baseline, _ = tracemalloc.get_traced_memory()
+
+        page = _extract_update_text(html, url)
+        page.peak_memory = tracemalloc.get_traced_memory()[1] - baseline
+
+    return page
+
+
+def _extract_update_text(html: str, url: str = None) -> PageExtraction:
+    started = time.perf_counter()
+    text = extract_update_text_fast(html)
+    if text is not None:
+        return PageExtraction(text, "fast", time.perf_counter() - started)
+
+    logging.warning(
+        f"Unexpected layout of {url or 'Azure update page'}, falling back to parsing the whole page"
+    )
+    text = extract_update_text_full(html)
+    if not text:
+        logging.error(f"No update text found in {url or 'Azure update page'}")
+
+    return PageExtraction(text, "full", time.perf_counter() - started)
@@ -0,0 +1,314 @@
+import logging
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Tuple
+
+logging.getLogger(__name__)
+
+
+class QueuedPost:
+    """
+    Class representing a blog post in the backfill queue.
+
+    Attributes
+    ----------
+    id : str
+        The ID of the blog post.
+    title : str
+        The title of the blog post.
+    created : str
+        The creation date of the blog post as ISO 8601 string.
+    tinyui : str
+        The short link of the blog post, relative to the Confluence base URL.
+    summary : str
+        The summary of the blog post, or None if it was not summarized yet.
+    attempts : int
+        The number of failed attempts to summarize or deliver the blog post.
+    delivered_to : List[str]
+        The targets the summary was delivered to.
+    """
+
+    def __init__(
+        self, post_id, title, created, tinyui, summary, attempts, delivered_to
+    ) -> None:
+        self.id: str = post_id
+        self.title: str = title
+        self.created: str = created
+        self.tinyui: str = tinyui
+        self.summary: str = summary
+        self.attempts: int = attempts
+        self.delivered_to: List[str] = delivered_to
+
+
+class BackfillQueue:
+    """
+    A durable work queue of blog posts to backfill, backed by SQLite.
+
+    The queue records the blog posts found by the backfill search, their summaries and the targets each
+    summary was delivered to, as well as the progress of the search. Every change is committed right away,
+    so a killed backfill resumes where it stopped: the search continues before the oldest queued blog post,
+    blog posts that were summarized are not summarized again and summaries are not delivered twice to the
+    same target.
+
+    Attributes
+    ----------
+    path : str
+        The path of the SQLite database file.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Initializes the BackfillQueue and creates the database if it does not exist yet.
+
+        Parameters
+        ----------
+        path : str
+            The path of the SQLite database file.
+        """
+        self.path = path
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        connection = self._connect()
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+        finally:
+            connection.close()
+
+        with self._transaction() as connection:
+            connection.execute(
+                """CREATE TABLE IF NOT EXISTS posts (
+                    id TEXT PRIMARY KEY,
+                    title TEXT,
+                    created TEXT,
+                    tinyui TEXT,
+                    summary TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    queued_at REAL NOT NULL
+                )"""
+            )
+            connection.execute(
+                """CREATE TABLE IF NOT EXISTS deliveries (
+                    post_id TEXT NOT NULL,
+                    target TEXT NOT NULL,
+                    delivered_at REAL NOT NULL,
+                    PRIMARY KEY (post_id, target)
+                )"""
+            )
+            connection.execute(
+                """CREATE TABLE IF NOT EXISTS state (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                )"""
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS posts_created ON posts (created)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """
+        Opens a connection and runs the statements of the block in one immediate transaction.
+        """
+        connection = self._connect()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield connection
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+        finally:
+            connection.close()
+
+    def get_state(self, key: str) -> Optional[str]:
+        """
+        Returns a recorded value of the backfill progress, or None.
+        """
+        connection = self._connect()
+        try:
+            row = connection.execute(
+                "SELECT value FROM state WHERE key = ?", (key,)
+            ).fetchone()
+        finally:
+            connection.close()
+
+        return row[0] if row else None
+
+    def set_state(self, key: str, value: str):
+        """
+        Records a value of the backfill progress.
+        """
+        with self._transaction() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)", (key, value)
+            )
+
+    def add(self, posts: list, limit: int = None) -> int:
+        """
+        Adds blog posts to the queue.
+
+        Blog posts that are queued already are left unchanged.
+
+        Parameters
+        ----------
+        posts : list
+            The blog posts, as `confluence.BlogPost` without their bodies.
+        limit : int, optional
+            The maximum number of blog posts to add. The first blog posts that are not queued yet are added.
+
+        Returns
+        -------
+        int
+            The number of blog posts that were added.
+        """
+        now = time.time()
+        added = 0
+
+        with self._transaction() as connection:
+            for post in posts:
+                if limit is not None and added >= limit:
+                    break
+
+                added += connection.execute(
+                    """INSERT OR IGNORE INTO posts (id, title, created, tinyui, queued_at)
+                    VALUES (?, ?, ?, ?, ?)""",
+                    (post.id, post.title, post.created_date, post._links.tinyui, now),
+                ).rowcount
+
+        return added
+
+    def progress(self) -> Tuple[int, Optional[str]]:
+        """
+        Returns the number of queued blog posts and the creation date of the oldest one.
+
+        Returns
+        -------
+        Tuple[int, Optional[str]]
+            The number of blog posts and the creation date as ISO 8601 string, or None if the queue is empty.
+        """
+        connection = self._connect()
+        try:
+            return connection.execute(
+                "SELECT COUNT(*), MIN(created) FROM posts"
+            ).fetchone()
+        finally:
+            connection.close()
+
+    def pending(self, targets: List[str], max_attempts: int) -> List[QueuedPost]:
+        """
+        Returns the blog posts that were not delivered to all targets yet, oldest first.
+
+        Parameters
+        ----------
+        targets : List[str]
+            The targets every summary is delivered to.
+        max_attempts : int
+            Blog posts that failed this many times are left out.
+
+        Returns
+        -------
+        List[QueuedPost]
+            The pending blog posts.
+        """
+        connection = self._connect()
+        try:
+            rows = connection.execute(
+                """SELECT id, title, created, tinyui, summary, attempts FROM posts
+                WHERE attempts < ? ORDER BY created, id""",
+                (max_attempts,),
+            ).fetchall()
+            delivered = {}
+            for post_id, target in connection.execute(
+                "SELECT post_id, target FROM deliveries"
+            ):
+                delivered.setdefault(post_id, []).append(target)
+        finally:
+            connection.close()
+
+        posts = [QueuedPost(*row, delivered.get(row[0], [])) for row in rows]
+        return [
+            post
+            for post in posts
+            if any(target not in post.delivered_to for target in targets)
+        ]
+
+    def set_summary(self, post_id: str, summary: str):
+        """
+        Records the summary of a blog post, so it is not summarized again when the backfill is resumed.
+        """
+        with self._transaction() as connection:
+            connection.execute(
+                "UPDATE posts SET summary = ?, error = NULL WHERE id = ?",
+                (summary, post_id),
+            )
+
+    def mark_delivered(self, post_id: str, target: str):
+        """
+        Records that the summary of a blog post was delivered to a target.
+        """
+        with self._transaction() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO deliveries (post_id, target, delivered_at) VALUES (?, ?, ?)",
+                (post_id, target, time.time()),
+            )
+
+    def mark_failed(self, post_id: str, error: str):
+        """
+        Records a failed attempt to summarize or deliver a blog post.
+        """
+        with self._transaction() as connection:
+            connection.execute(
+                "UPDATE posts SET attempts = attempts + 1, error = ? WHERE id = ?",
+                (error, post_id),
+            )
+
+    def counts(self, targets: List[str], max_attempts: int) -> dict:
+        """
+        Returns the number of queued, delivered and failed blog posts.
+
+        Parameters
+        ----------
+        targets : List[str]
+            The targets every summary is delivered to.
+        max_attempts : int
+            Blog posts that failed this many times count as failed.
+
+        Returns
+        -------
+        dict
+            The numbers keyed by `queued`, `summarized`, `delivered` and `failed`.
+        """
+        connection = self._connect()
+        try:
+            queued, summarized, failed = connection.execute(
+                """SELECT COUNT(*), COUNT(summary), COALESCE(SUM(attempts >= ?), 0)
+                FROM posts""",
+                (max_attempts,),
+            ).fetchone()
+            placeholders = ",".join("?" for _ in targets)
+            (delivered,) = connection.execute(
+                f"""SELECT COUNT(*) FROM (
+                    SELECT post_id FROM deliveries WHERE target IN ({placeholders})
+                    GROUP BY post_id HAVING COUNT(DISTINCT target) = ?
+                )""",
+                (*targets, len(targets)),
+            ).fetchone()
+        finally:
+            connection.close()
+
+        return {
+            "queued": queued,
+            "summarized": summarized,
+            "delivered": delivered,
+            "failed": failed,
+        }
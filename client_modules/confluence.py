@@ -1,7 +1,13 @@
-import requests
 import sys
 import logging
-from bs4 import BeautifulSoup
+from datetime import timedelta
+from typing import Iterator
+
+from dateutil import parser
+
+from client_modules.http_transport import HttpTransport, default_transport
+from client_modules.metrics import MetricsRecorder, default_metrics
+from client_modules.storage_extractor import extract_storage_text
 
 logging.getLogger(__name__)
 
@@ -28,9 +34,11 @@ class ConfluenceSearchResponse:
         The time taken for the search in milliseconds.
     self_link : str
         The link to the search result.
+    next_link : str
+        The link to the next page of the search result, relative to the base URL, or None on the last page.
     """
 
-    def __init__(self, data):
+    def __init__(self, data, client: "ConfluenceClient" = None):
         """
         Constructs all the necessary attributes for the ConfluenceSearchResponse object.
 
@@ -38,6 +46,8 @@ class ConfluenceSearchResponse:
         ----------
         data : dict
             The search response data from the Confluence API.
+        client : ConfluenceClient, optional
+            The client used by the blog posts to load their bodies on first access.
         """
         self.results: list[BlogPost] = []
         self.start = data.get(
@@ -49,9 +59,10 @@ class ConfluenceSearchResponse:
         self.totalSize = data.get("totalSize")
         self.searchDurationMillis = data.get("searchDurationMillis")
         self.self_link = data["_links"].get("self")
+        self.next_link = data["_links"].get("next")
 
         for result in data["results"]:
-            self.results.append(BlogPost(result))
+            self.results.append(BlogPost(result, client))
 
 
 class ConfluenceLinks:
@@ -137,7 +148,7 @@ class Body:
         body_data : dict
             The body data from the Confluence API.
         """
-        self.storage = Storage(body_data.get("storage"))
+        self.storage = Storage(body_data.get("storage") or {})
         self._expandable = body_data.get("_expandable")
 
 
@@ -169,11 +180,13 @@ class BlogPost:
         The links related to the blog post.
     _expandable : dict
         The expandable fields for the blog post.
+    history : dict
+        The history of the blog post, if it was expanded.
     body : Body
-        The body of the blog post.
+        The body of the blog post. If it was not part of the API response, it is loaded on first access.
     """
 
-    def __init__(self, data):
+    def __init__(self, data, client: "ConfluenceClient" = None):
         """
         Constructs all the necessary attributes for the BlogPost object.
 
@@ -181,6 +194,8 @@ class BlogPost:
         ----------
         data : dict
             The blog post data from the Confluence API.
+        client : ConfluenceClient, optional
+            The client used to load the body on first access, if the data does not contain it.
         """
         self.id: str = data.get("id")
         self.type = data.get("type")
@@ -193,21 +208,69 @@ class BlogPost:
         self.operations = data.get("operations")
         self._links = ConfluenceLinks(data.get("_links"))
         self._expandable = data.get("_expandable")
-        self.body: Body = Body(data.get("body"))
+        self.history = data.get("history")
+        self._client = client
+        self._body: Body = Body(data["body"]) if data.get("body") else None
+        self._text: str = None
+
+    @property
+    def body(self) -> Body:
+        """
+        The body of the blog post, loaded from Confluence and memoized on first access if necessary.
+
+        Raises
+        ------
+        ValueError
+            If the body is not loaded and the blog post has no client to load it with.
+        """
+        if self._body is None:
+            if self._client is None:
+                raise ValueError(
+                    f"The body of blogpost {self.id} is not loaded and there is no client to load it"
+                )
+            self._body = self._client.get_blogpost_body(self.id)
+        return self._body
+
+    @body.setter
+    def body(self, body: Body):
+        self._body = body
+        self._text = None
+
+    @property
+    def body_loaded(self) -> bool:
+        """
+        Whether the body of the blog post is available without another request.
+        """
+        return self._body is not None
+
+    @property
+    def created_date(self) -> str:
+        """
+        The creation date of the blog post as ISO 8601 string, or None if the history was not expanded.
+        """
+        if not self.history:
+            return None
+        return self.history.get("createdDate")
 
     def extract_text(self):
         """
-        Extracts the text from the body of the blog post.
+        Extracts the text from the body of the blog post. The text is memoized.
+
+        Headings, list items, table rows and code macros are kept on lines of their own, macro parameters
+        are left out. See `extract_storage_text`.
 
         Returns
         -------
         str
             The extracted text.
         """
-        soup = BeautifulSoup(self.body.storage.value, "html.parser")
-        text = soup.get_text()
+        if self._text is None:
+            storage = self.body.storage.value or ""
+            with default_metrics().stage("extraction") as stage:
+                stage.add_bytes(len(storage.encode()))
+                self._text = extract_storage_text(storage)
 
-        return text
+        return self._text
 
 
 class ConfluenceClient:
@@ -222,9 +285,20 @@ class ConfluenceClient:
         The username for authentication with the Confluence instance.
     token : str
         The API token for authentication with the Confluence instance.
+    transport : HttpTransport
+        The pooled HTTP transport used for all requests.
+    metrics : MetricsRecorder
+        The recorder of the `confluence_fetch` stage.
     """
 
-    def __init__(self, confluence_url, confluence_username, confluence_token) -> None:
+    def __init__(
+        self,
+        confluence_url,
+        confluence_username,
+        confluence_token,
+        transport: HttpTransport = None,
+        metrics: MetricsRecorder = None,
+    ) -> None:
         """
         Initializes the ConfluenceClient with the necessary authentication and URL details.
 
@@ -236,11 +310,28 @@ class ConfluenceClient:
             The username for authentication with the Confluence instance.
         confluence_token : str
             The API token for authentication with the Confluence instance.
+        transport : HttpTransport, optional
+            The pooled HTTP transport to use. Defaults to the transport shared by the process.
+        metrics : MetricsRecorder, optional
+            The recorder of the `confluence_fetch` stage. Defaults to the recorder shared by the process.
         """
         self.url = confluence_url
         self.username = confluence_username
         self.token = confluence_token
-        pass
+        self.transport = transport or default_transport()
+        self.metrics = metrics or default_metrics()
+
+    def _get(self, url, **kwargs):
+        """
+        Sends an authenticated GET request and records it in the `confluence_fetch` stage.
+        """
+        with self.metrics.stage("confluence_fetch") as stage:
+            response = self.transport.get(
+                url, auth=(self.username, self.token), **kwargs
+            )
+            stage.add_bytes(len(response.content))
+
+        return response
 
     def get_blogpost(self, blogpost_id) -> BlogPost:
         """
@@ -257,21 +348,87 @@ class ConfluenceClient:
             The retrieved BlogPost object.
         """
         logging.info(f"Getting blogpost with id {blogpost_id}")
-        api_url = f"{self.url}/rest/api/content/{blogpost_id}?expand=body.storage"
-        response = requests.get(api_url, auth=(self.username, self.token))
+        api_url = (
+            f"{self.url}/rest/api/content/{blogpost_id}?expand=body.storage,history"
+        )
+        response = self._get(api_url)
 
         if 200 <= response.status_code < 300:
             logging.info(f"Getting blogpost with id {blogpost_id} successful")
-            return BlogPost(response.json())
+            return BlogPost(response.json(), self)
 
         else:
             logging.error("Error retrieving blogpost:")
             logging.error(response.json())
             sys.exit(1)
 
+    def get_blogpost_body(self, blogpost_id) -> Body:
+        """
+        Retrieves the body of a specific blog post.
+
+        Parameters
+        ----------
+        blogpost_id : str
+            The ID of the blogpost.
+
+        Returns
+        -------
+        Body
+            The body of the blog post.
+        """
+        logging.info(f"Getting body of blogpost with id {blogpost_id}")
+        api_url = f"{self.url}/rest/api/content/{blogpost_id}?expand=body.storage"
+        response = self._get(api_url)
+
+        if response.status_code != 200:
+            logging.error("Error retrieving blogpost:")
+            logging.error(response.json())
+            sys.exit(1)
+
+        return Body(response.json().get("body") or {})
+
+    def load_bodies(self, blog_posts: list[BlogPost], batch_size: int = 25):
+        """
+        Loads the bodies of several blog posts with as few requests as possible.
+
+        The blog posts whose body is not loaded yet are requested in batches with an `id in (...)` CQL
+        search.
+
+        Parameters
+        ----------
+        blog_posts : list[BlogPost]
+            The blog posts to load the bodies for.
+        batch_size : int
+            The maximum number of blog posts requested at once.
+        """
+        missing = [post for post in blog_posts if not post.body_loaded]
+
+        for start in range(0, len(missing), batch_size):
+            batch = {post.id: post for post in missing[start : start + batch_size]}
+            response = self._get(
+                f"{self.url}/rest/api/content/search",
+                params={
+                    "cql": f"id in ({','.join(batch)})",
+                    "limit": len(batch),
+                    "expand": "body.storage",
+                },
+            )
+
+            if response.status_code != 200:
+                logging.error("Error retrieving blogposts:")
+                logging.error(response.json())
+                sys.exit(1)
+
+            for result in response.json()["results"]:
+                if result.get("id") in batch and result.get("body"):
+                    batch[result["id"]].body = Body(result["body"])
+
+        if missing:
+            logging.info(f"Loaded {len(missing)} blog post bodies")
+
     def get_blogposts(self, limit) -> ConfluenceSearchResponse:
         """
-        Retrieves a number of blog posts from the Confluence API.
+        Retrieves a number of blog posts from the Confluence API. The bodies are loaded on first access.
 
         Parameters
         ----------
@@ -285,18 +442,130 @@ class ConfluenceClient:
         """
 
         logging.info(f"Getting latest {limit} blogposts")
-        api_url = f"{self.url}/rest/api/content/search?cql=type%20in%20(blogpost)%20order%20by%20created%20desc&limit={limit}&expand=body.storage"
-        response = requests.get(api_url, auth=(self.username, self.token))
+        api_url = f"{self.url}/rest/api/content/search?cql=type%20in%20(blogpost)%20order%20by%20created%20desc&limit={limit}&expand=history"
+        response = self._get(api_url)
 
         if response.status_code != 200:
             logging.error("Error retrieving blogpost:")
             logging.error(response.json())
             sys.exit(1)
 
-        search = ConfluenceSearchResponse(response.json())
+        search = ConfluenceSearchResponse(response.json(), self)
         logging.info(f"Retrieved {len(search.results)} blog posts")
         return search
 
+    def get_blogpost_created_date(self, blogpost_id) -> str:
+        """
+        Retrieves the creation date of a blog post without its body.
+
+        Parameters
+        ----------
+        blogpost_id : str
+            The ID of the blog post.
+
+        Returns
+        -------
+        str
+            The creation date as ISO 8601 string.
+        """
+        api_url = f"{self.url}/rest/api/content/{blogpost_id}?expand=history"
+        response = self._get(api_url)
+
+        if response.status_code != 200:
+            logging.error(f"Error retrieving blogpost {blogpost_id}:")
+            logging.error(response.json())
+            sys.exit(1)
+
+        return BlogPost(response.json()).created_date
+
+    def get_blogposts_created_since(
+        self, created_date: str, page_size: int = 50
+    ) -> list[BlogPost]:
+        """
+        Retrieves the blog posts created at or after a date, without their bodies.
+
+        CQL compares dates in the time zone of the Confluence user, so the query starts one day before
+        the requested date and the results are filtered on their exact creation date afterwards. All pages
+        of the result are requested by following their `next` links.
+
+        Parameters
+        ----------
+        created_date : str
+            The creation date as ISO 8601 string.
+        page_size : int
+            The number of blog posts requested per page.
+
+        Returns
+        -------
+        list[BlogPost]
+            The blog posts created at or after the date, oldest first. Their bodies are not loaded.
+        """
+        since = parser.isoparse(created_date)
+        day = (since - timedelta(days=1)).strftime("%Y-%m-%d")
+
+        posts = [
+            post
+            for _, page in self.iter_blogpost_pages(
+                f'type = blogpost and created >= "{day}" order by created asc',
+                page_size,
+            )
+            for post in page
+            if post.created_date and parser.isoparse(post.created_date) >= since
+        ]
+
+        logging.info(f"Found {len(posts)} blog posts created since {created_date}")
+        return posts
+
+    def iter_blogpost_pages(
+        self, cql: str, page_size: int = 50, start: int = 0
+    ) -> Iterator[tuple[int, list[BlogPost]]]:
+        """
+        Pages through all results of a CQL search, without the bodies of the blog posts.
+
+        The first page is requested with `start` and `limit`, every further page by following the `next` link
+        of the previous one until the server returns none. The server may return fewer results per page than
+        requested, so the size of a page does not tell whether it is the last one.
+
+        Parameters
+        ----------
+        cql : str
+            The CQL query, e.g. `type = blogpost order by created desc`.
+        page_size : int
+            The number of blog posts requested per page.
+        start : int
+            The offset of the first result to request.
+
+        Yields
+        ------
+        tuple[int, list[BlogPost]]
+            The offset of the next page and the blog posts of this page.
+        """
+        url = f"{self.url}/rest/api/content/search"
+        params = {"cql": cql, "limit": page_size, "expand": "history", "start": start}
+
+        while True:
+            response = self._get(url, params=params)
+
+            if response.status_code != 200:
+                logging.error("Error retrieving blogposts:")
+                logging.error(response.json())
+                sys.exit(1)
+
+            search = ConfluenceSearchResponse(response.json(), self)
+            start += len(search.results)
+            yield start, search.results
+
+            if not search.next_link or not search.results:
+                break
+
+            # The next link carries the query and is relative to the base URL, like the tinyui links
+            url = (
+                search.next_link
+                if search.next_link.startswith("http")
+                else f"{self.url}{search.next_link}"
+            )
+            params = None
+
     def get_blogposts_newer_than_id(
         self, last_blogpost_id: str, blog_posts: list[BlogPost]
     ) -> list[BlogPost]:
@@ -345,11 +614,11 @@ class ConfluenceClient:
         SystemExit
             If the API request fails (i.e., if it doesn't return a 200 status code).
         """
-        api_url = f"{self.url}/rest/api/content/search?cql=type%20in%20(blogpost)%20order%20by%20lastmodified%20desc&limit=20&expand=body.storage.value"
+        api_url = f"{self.url}/rest/api/content/search?cql=type%20in%20(blogpost)%20order%20by%20lastmodified%20desc&limit=1"
 
-        response = requests.get(api_url, auth=(self.username, self.token))
+        response = self._get(api_url)
         if response.status_code == 200:
-            search = ConfluenceSearchResponse(response.json())
+            search = ConfluenceSearchResponse(response.json(), self)
             latest_blogpost: BlogPost = search.results[0]
 
             return latest_blogpost
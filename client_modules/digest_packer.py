@@ -0,0 +1,112 @@
+import logging
+from typing import List
+
+from client_modules.text_chunker import estimate_tokens
+
+logging.getLogger(__name__)
+
+
+def pack_entries(
+    entries: List[str],
+    input_budget: int,
+    output_budget: int,
+    output_tokens_per_entry: int,
+) -> List[List[int]]:
+    """
+    Groups digest entries into as few prompts as fit both the input and the output token budget.
+
+    The entries are placed largest first into the first prompt that still has room (first-fit decreasing).
+    Every prompt holds at most `output_budget // output_tokens_per_entry` entries, so the model can answer
+    each of them within the output limit. An entry that exceeds the input budget on its own gets a prompt of
+    its own.
+
+    Parameters
+    ----------
+    entries : List[str]
+        The formatted digest entries in feed order.
+    input_budget : int
+        The maximum number of input tokens per prompt.
+    output_budget : int
+        The maximum number of output tokens per prompt.
+    output_tokens_per_entry : int
+        The expected number of output tokens per summarized entry.
+
+    Returns
+    -------
+    List[List[int]]
+        The indices of the entries per prompt. The prompts are ordered by their first entry and the indices
+        of each prompt are in feed order.
+    """
+    max_entries = max(1, output_budget // max(1, output_tokens_per_entry))
+    sizes = [estimate_tokens(entry) for entry in entries]
+
+    batches: List[List[int]] = []
+    batch_sizes: List[int] = []
+
+    for index in sorted(range(len(entries)), key=lambda i: sizes[i], reverse=True):
+        if sizes[index] > input_budget:
+            logging.warning(
+                f"Digest entry {index} with ~{sizes[index]} tokens exceeds the input budget of {input_budget} tokens"
+            )
+
+        for batch_index, batch in enumerate(batches):
+            if (
+                len(batch) < max_entries
+                and batch_sizes[batch_index] + sizes[index] <= input_budget
+            ):
+                batch.append(index)
+                batch_sizes[batch_index] += sizes[index]
+                break
+        else:
+            batches.append([index])
+            batch_sizes.append(sizes[index])
+
+    for batch in batches:
+        batch.sort()
+    batches.sort(key=lambda batch: batch[0])
+
+    logging.info(f"Packed {len(entries)} digest entries into {len(batches)} prompts")
+    return batches
+
+
+def reassemble_sections(
+    batches: List[List[int]], summaries: List[str], separator: str = "---"
+) -> List[str]:
+    """
+    Splits the summary of every prompt into sections and puts them back into feed order.
+
+    If a summary contains exactly one section per entry of its prompt, every section is placed at the
+    position of its entry. Otherwise the sections of that prompt are kept together at the position of the
+    prompt's first entry. Empty sections are dropped.
+
+    Parameters
+    ----------
+    batches : List[List[int]]
+        The indices of the entries per prompt, as returned by `pack_entries`.
+    summaries : List[str]
+        The summary of every prompt.
+    separator : str
+        The separator between the sections of a summary.
+
+    Returns
+    -------
+    List[str]
+        The sections in feed order.
+    """
+    positions = {}
+
+    for batch, summary in zip(batches, summaries):
+        sections = [
+            section.strip() for section in summary.split(separator) if section.strip()
+        ]
+
+        if len(sections) == len(batch):
+            for index, section in zip(batch, sections):
+                positions[index] = [section]
+        else:
+            logging.warning(
+                f"Expected {len(batch)} sections but got {len(sections)}, keeping them in prompt order"
+            )
+            positions[batch[0]] = sections
+
+    return [section for index in sorted(positions) for section in positions[index]]
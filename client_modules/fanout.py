@@ -0,0 +1,94 @@
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Hashable, List
+
+logging.getLogger(__name__)
+
+
+def parse_channels(channels: str, default: str = None) -> List[str]:
+    """
+    Parses a comma-separated list of Slack channels.
+
+    Parameters
+    ----------
+    channels : str
+        The channels, e.g. `C0123,C0456`. Empty entries are ignored.
+    default : str
+        The channel returned if `channels` contains none.
+
+    Returns
+    -------
+    List[str]
+        The channels in the given order, without duplicates.
+    """
+    parsed = []
+    for channel in (channels or "").split(","):
+        channel = channel.strip()
+        if channel and channel not in parsed:
+            parsed.append(channel)
+
+    if not parsed and default:
+        parsed.append(default)
+
+    return parsed
+
+
+def deliver(
+    pending: Dict[str, List[Hashable]],
+    summaries: Dict[Hashable, Future],
+    send: Callable[[str, Hashable, object], None],
+):
+    """
+    Delivers summaries that were generated once to several Slack channels.
+
+    Every channel is served by a thread of its own, which sends its pending summaries in the given order as soon
+    as each is ready. A channel stops at the first summary that fails to generate or send, so it never receives
+    a newer summary before an older one, and its watermark only ever covers what was delivered. The other
+    channels are not affected.
+
+    Parameters
+    ----------
+    pending : Dict[str, List[Hashable]]
+        The keys of the summaries each channel has not received yet, oldest first.
+    summaries : Dict[Hashable, Future]
+        The futures of the summaries, keyed like `pending`.
+    send : Callable[[str, Hashable, object], None]
+        Called with the channel, the key and the summary to send a summary and record it in the channel's
+        watermark.
+
+    Raises
+    ------
+    BaseException
+        The first error of a channel, after all channels finished.
+    """
+    pending = {channel: keys for channel, keys in pending.items() if keys}
+    if not pending:
+        return
+
+    def deliver_channel(channel: str):
+        for key in pending[channel]:
+            try:
+                summary = summaries[key].result()
+            except BaseException:
+                logging.error(
+                    f"Summarizing {key} failed, not sending newer summaries to {channel}"
+                )
+                raise
+
+            send(channel, key, summary)
+
+    errors = []
+    with ThreadPoolExecutor(max_workers=len(pending)) as executor:
+        futures = {
+            channel: executor.submit(deliver_channel, channel) for channel in pending
+        }
+
+        for channel, future in futures.items():
+            try:
+                future.result()
+            except BaseException as e:
+                logging.error(f"Delivering to {channel} failed. (╯°□°）╯︵ ┻━┻")
+                errors.append(e)
+
+    if errors:
+        raise errors[0]
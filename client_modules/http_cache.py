@@ -0,0 +1,281 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+logging.getLogger(__name__)
+
+# Response headers kept with a cached body.
+_STORED_HEADERS = ("Content-Type", "ETag", "Last-Modified", "Content-Location")
+
+
+class HttpCache:
+    """
+    A disk-backed cache for conditional GET requests backed by SQLite.
+
+    Responses carrying an `ETag` or `Last-Modified` header are stored zlib-compressed per URL. Later requests
+    for the same URL send `If-None-Match` and `If-Modified-Since`, and a `304 Not Modified` answer is served
+    from the cache. Like the summary cache, the database runs in WAL mode and every write happens in its own
+    immediate transaction.
+
+    Attributes
+    ----------
+    path : str
+        The path of the SQLite database file.
+    max_bytes : int
+        The maximum combined size of all compressed bodies. The least recently used entries are evicted first.
+    hits : int
+        The number of requests answered with `304 Not Modified` during this run.
+    misses : int
+        The number of requests that downloaded the body during this run.
+    bytes_saved : int
+        The number of body bytes that did not have to be downloaded during this run.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 100 * 1024 * 1024) -> None:
+        """
+        Initializes the HttpCache and creates the database if it does not exist yet.
+
+        Parameters
+        ----------
+        path : str
+            The path of the SQLite database file.
+        max_bytes : int
+            The maximum combined size of all compressed bodies.
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        connection = self._connect()
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+        finally:
+            connection.close()
+
+        with self._transaction() as connection:
+            connection.execute(
+                """CREATE TABLE IF NOT EXISTS responses (
+                    url TEXT PRIMARY KEY,
+                    etag TEXT,
+                    last_modified TEXT,
+                    headers TEXT NOT NULL,
+                    encoding TEXT,
+                    body BLOB NOT NULL,
+                    body_size INTEGER NOT NULL,
+                    size INTEGER NOT NULL,
+                    stored_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )"""
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """
+        Opens a connection and runs the statements of the block in one immediate transaction.
+        """
+        connection = self._connect()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield connection
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+        finally:
+            connection.close()
+
+    def get(self, session: requests.Session, url: str, **kwargs) -> requests.Response:
+        """
+        Sends a conditional GET request and answers it from the cache if the resource did not change.
+
+        Parameters
+        ----------
+        session : requests.Session
+            The session to send the request with.
+        url : str
+            The URL to request.
+        **kwargs
+            Additional arguments passed to `requests.Session.get`.
+
+        Returns
+        -------
+        requests.Response
+            The downloaded response, or a response rebuilt from the cache with status 200. Responses served
+            from the cache have the attribute `from_cache` set to True.
+        """
+        connection = self._connect()
+        try:
+            row = connection.execute(
+                "SELECT etag, last_modified, headers, encoding, body, body_size FROM responses WHERE url = ?",
+                (url,),
+            ).fetchone()
+        finally:
+            connection.close()
+
+        headers = dict(kwargs.pop("headers", None) or {})
+        if row is not None:
+            if row[0]:
+                headers["If-None-Match"] = row[0]
+            if row[1]:
+                headers["If-Modified-Since"] = row[1]
+
+        response = session.get(url, headers=headers, **kwargs)
+
+        if response.status_code == 304 and row is not None:
+            self._touch(url, response)
+            with self._lock:
+                self.hits += 1
+                self.bytes_saved += row[5]
+            logging.info(f"HTTP cache hit for {url}")
+            return self._rebuild(url, row, response)
+
+        with self._lock:
+            self.misses += 1
+
+        if response.status_code == 200 and (
+            response.headers.get("ETag") or response.headers.get("Last-Modified")
+        ):
+            self.put(url, response)
+
+        response.from_cache = False
+        return response
+
+    def _touch(self, url: str, response: requests.Response):
+        """
+        Marks an entry as recently used and takes over renewed validators of a 304 response.
+        """
+        with self._transaction() as connection:
+            connection.execute(
+                """UPDATE responses SET
+                    etag = COALESCE(?, etag),
+                    last_modified = COALESCE(?, last_modified),
+                    accessed_at = ?
+                    WHERE url = ?""",
+                (
+                    response.headers.get("ETag"),
+                    response.headers.get("Last-Modified"),
+                    time.time(),
+                    url,
+                ),
+            )
+
+    @staticmethod
+    def _rebuild(url: str, row: tuple, revalidation: requests.Response):
+        """
+        Builds a response with status 200 from a cache entry.
+        """
+        response = requests.Response()
+        response.status_code = 200
+        response.url = url
+        response.headers = CaseInsensitiveDict(json.loads(row[2]))
+        response.encoding = row[3]
+        response._content = zlib.decompress(row[4])
+        response.elapsed = revalidation.elapsed
+        response.request = revalidation.request
+        response.from_cache = True
+        return response
+
+    def put(self, url: str, response: requests.Response):
+        """
+        Stores a response in the cache and evicts the least recently used entries afterwards.
+
+        Parameters
+        ----------
+        url : str
+            The requested URL.
+        response : requests.Response
+            The response with status 200.
+        """
+        body = zlib.compress(response.content)
+        headers = {
+            name: response.headers[name]
+            for name in _STORED_HEADERS
+            if name in response.headers
+        }
+        now = time.time()
+
+        with self._transaction() as connection:
+            connection.execute(
+                """INSERT OR REPLACE INTO responses
+                    (url, etag, last_modified, headers, encoding, body, body_size, size, stored_at, accessed_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (
+                    url,
+                    response.headers.get("ETag"),
+                    response.headers.get("Last-Modified"),
+                    json.dumps(headers),
+                    response.encoding,
+                    body,
+                    len(response.content),
+                    len(body),
+                    now,
+                    now,
+                ),
+            )
+
+        self.evict()
+
+    def evict(self):
+        """
+        Removes the least recently used entries exceeding the size limit.
+        """
+        with self._transaction() as connection:
+            total = connection.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()[0]
+
+            evicted = 0
+            if total > self.max_bytes:
+                rows = connection.execute(
+                    "SELECT url, size FROM responses ORDER BY accessed_at ASC"
+                ).fetchall()
+
+                for url, size in rows:
+                    if total <= self.max_bytes:
+                        break
+                    connection.execute("DELETE FROM responses WHERE url = ?", (url,))
+                    total -= size
+                    evicted += 1
+
+        if evicted:
+            logging.info(f"HTTP cache evicted {evicted} least recently used entries")
+
+    def hit_ratio(self) -> Optional[float]:
+        """
+        Returns the share of requests of this run that were answered from the cache, or None without requests.
+        """
+        requests_sent = self.hits + self.misses
+        return self.hits / requests_sent if requests_sent else None
+
+    def log_stats(self):
+        """
+        Logs the hits, misses, hit ratio and saved bytes of this run.
+        """
+        ratio = self.hit_ratio()
+        logging.info(
+            f"HTTP cache: {self.hits} hits, {self.misses} misses, "
+            f"hit ratio {ratio or 0:.0%}, {self.bytes_saved} bytes saved"
+        )
@@ -0,0 +1,210 @@
+import logging
+import threading
+from os import getenv
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from client_modules.http_cache import HttpCache
+
+logging.getLogger(__name__)
+
+
+class HttpTransport:
+    """
+    A class wrapping a pooled HTTP session that is shared by all clients of a run.
+
+    The session keeps connections alive between requests, negotiates compressed responses and applies
+    connect and read timeouts to every request.
+
+    Attributes
+    ----------
+    session : requests.Session
+        The pooled session used for all requests.
+    timeout : tuple
+        The connect and read timeout in seconds.
+    cache : HttpCache
+        The conditional GET cache used by `get_cached`, or None.
+    """
+
+    def __init__(
+        self,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 60.0,
+        pool_connections: int = 10,
+        pool_maxsize: int = 10,
+        cache: HttpCache = None,
+    ) -> None:
+        """
+        Initializes the HttpTransport with a pooled session.
+
+        Parameters
+        ----------
+        connect_timeout : float
+            The timeout in seconds for establishing a connection.
+        read_timeout : float
+            The timeout in seconds for waiting on data from the server.
+        pool_connections : int
+            The number of hosts to keep connection pools for.
+        pool_maxsize : int
+            The maximum number of connections kept per host.
+        cache : HttpCache, optional
+            The conditional GET cache used by `get_cached`.
+        """
+        self.timeout = (connect_timeout, read_timeout)
+        self.cache = cache
+
+        self.session = requests.Session()
+        self.session.headers.update(
+            {"Accept-Encoding": "gzip, deflate", "Connection": "keep-alive"}
+        )
+
+        adapter = HTTPAdapter(
+            pool_connections=pool_connections, pool_maxsize=pool_maxsize
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        Sends a request through the pooled session.
+
+        Parameters
+        ----------
+        method : str
+            The HTTP method of the request.
+        url : str
+            The URL to send the request to.
+        **kwargs
+            Additional arguments passed to `requests.Session.request`. If no timeout is given, the configured
+            connect and read timeouts are used.
+
+        Returns
+        -------
+        requests.Response
+            The response of the request.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+
+        return self.session.request(method, url, **kwargs)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        """
+        Sends a GET request through the pooled session.
+
+        Parameters
+        ----------
+        url : str
+            The URL to send the request to.
+        **kwargs
+            Additional arguments passed to `request`.
+
+        Returns
+        -------
+        requests.Response
+            The response of the request.
+        """
+        return self.request("GET", url, **kwargs)
+
+    def get_cached(self, url: str, **kwargs) -> requests.Response:
+        """
+        Sends a GET request through the conditional GET cache, if one is configured.
+
+        Parameters
+        ----------
+        url : str
+            The URL to send the request to.
+        **kwargs
+            Additional arguments passed to `request`.
+
+        Returns
+        -------
+        requests.Response
+            The response of the request, possibly rebuilt from the cache.
+        """
+        if self.cache is None:
+            return self.get(url, **kwargs)
+
+        kwargs.setdefault("timeout", self.timeout)
+        return self.cache.get(self.session, url, **kwargs)
+
+    def connection_stats(self) -> dict:
+        """
+        Collects the connection counters of all connection pools of the session.
+
+        The counters include requests that other libraries, like `openai`, send through the session.
+
+        Returns
+        -------
+        dict
+            The number of requests, the number of opened connections and the number of requests that reused
+            an existing connection.
+        """
+        opened = 0
+        pooled_requests = 0
+
+        for adapter in set(self.session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                opened += pool.num_connections
+                pooled_requests += pool.num_requests
+
+        return {
+            "requests": pooled_requests,
+            "connections_opened": opened,
+            "connections_reused": max(0, pooled_requests - opened),
+        }
+
+    def log_stats(self):
+        """
+        Logs the connection counters of the transport.
+        """
+        stats = self.connection_stats()
+        logging.info(
+            f"HTTP transport: { stats['requests'] } requests, "
+            f"{ stats['connections_opened'] } connections opened, "
+            f"{ stats['connections_reused'] } connections reused"
+        )
+
+        if self.cache is not None:
+            self.cache.log_stats()
+
+
+_default_transport = None
+_default_transport_lock = threading.Lock()
+
+
+def default_transport() -> HttpTransport:
+    """
+    Returns the transport shared by all clients of the process, creating it on first use.
+
+    The timeouts are read from the `HTTP_CONNECT_TIMEOUT` and `HTTP_READ_TIMEOUT` environment variables. If
+    `HTTP_CACHE_PATH` is set, cached GET requests go through a conditional GET cache stored at that path.
+
+    Returns
+    -------
+    HttpTransport
+        The shared transport.
+    """
+    global _default_transport
+
+    with _default_transport_lock:
+        if _default_transport is None:
+            cache = None
+            if getenv("HTTP_CACHE_PATH"):
+                cache = HttpCache(
+                    getenv("HTTP_CACHE_PATH"),
+                    max_bytes=int(getenv("HTTP_CACHE_MAX_MB", "100")) * 1024 * 1024,
+                )
+
+            _default_transport = HttpTransport(
+                connect_timeout=float(getenv("HTTP_CONNECT_TIMEOUT", "5")),
+                read_timeout=float(getenv("HTTP_READ_TIMEOUT", "60")),
+                pool_maxsize=int(getenv("HTTP_POOL_MAXSIZE", "10")),
+                cache=cache,
+            )
+
+    return _default_transport
@@ -0,0 +1,334 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+logging.getLogger(__name__)
+
+
+class StageMetrics:
+    """
+    Class holding the aggregated measurements of one pipeline stage.
+
+    Attributes
+    ----------
+    count : int
+        The number of times the stage ran.
+    duration : float
+        The combined duration of all runs in seconds.
+    max_duration : float
+        The duration of the slowest run in seconds.
+    bytes : int
+        The number of bytes the stage transferred or processed.
+    prompt_tokens : int
+        The number of prompt tokens sent to OpenAI.
+    completion_tokens : int
+        The number of completion tokens received from OpenAI.
+    retries : int
+        The number of retries after rate limit errors.
+    errors : int
+        The number of runs that raised an exception.
+    """
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.duration = 0.0
+        self.max_duration = 0.0
+        self.bytes = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.retries = 0
+        self.errors = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "duration_seconds": round(self.duration, 6),
+            "max_duration_seconds": round(self.max_duration, 6),
+            "bytes": self.bytes,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "retries": self.retries,
+            "errors": self.errors,
+        }
+
+
+class StageRecord:
+    """
+    Class collecting the measurements of a single run of a stage, see `MetricsRecorder.stage`.
+
+    Attributes
+    ----------
+    bytes : int
+        The number of bytes transferred or processed.
+    prompt_tokens : int
+        The number of prompt tokens sent to OpenAI.
+    completion_tokens : int
+        The number of completion tokens received from OpenAI.
+    retries : int
+        The number of retries after rate limit errors.
+    """
+
+    def __init__(self) -> None:
+        self.bytes = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.retries = 0
+
+    def add_bytes(self, amount: int):
+        self.bytes += amount or 0
+
+    def add_usage(self, usage: dict):
+        """
+        Adds the token usage of an OpenAI response.
+        """
+        usage = usage or {}
+        self.prompt_tokens += usage.get("prompt_tokens", 0) or 0
+        self.completion_tokens += usage.get("completion_tokens", 0) or 0
+
+    def retry(self):
+        self.retries += 1
+
+
+class MetricsRecorder:
+    """
+    Records duration, bytes, tokens and retries per pipeline stage of a job run.
+
+    Stages are measured with `stage`, which can be used concurrently from several threads. At the end of a
+    run, the measurements are logged as a JSON summary and can be written as JSON file and as Prometheus
+    text file for the node exporter textfile collector.
+
+    Attributes
+    ----------
+    job : str
+        The name of the job, used as label in the exports.
+    started : float
+        The time the recorder was created, as UNIX timestamp.
+    stages : Dict[str, StageMetrics]
+        The measurements per stage.
+    """
+
+    def __init__(self, job: str = "summarizer") -> None:
+        self.job = job
+        self.started = time.time()
+        self.stages: Dict[str, StageMetrics] = {}
+        self._started_monotonic = time.monotonic()
+        self._lock = threading.Lock()
+        self._export_lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[StageRecord]:
+        """
+        Measures one run of a stage.
+
+        The block can add bytes, token usage and retries to the yielded record. Exceptions are counted as
+        errors of the stage and re-raised.
+
+        Parameters
+        ----------
+        name : str
+            The name of the stage, e.g. `openai_call`.
+
+        Yields
+        ------
+        StageRecord
+            The record of this run.
+        """
+        record = StageRecord()
+        started = time.perf_counter()
+        failed = False
+
+        try:
+            yield record
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            self.record(name, time.perf_counter() - started, record, failed)
+
+    def record(
+        self,
+        name: str,
+        duration: float,
+        record: Optional[StageRecord] = None,
+        failed: bool = False,
+    ):
+        """
+        Adds a measured run of a stage.
+
+        Parameters
+        ----------
+        name : str
+            The name of the stage.
+        duration : float
+            The duration of the run in seconds.
+        record : StageRecord, optional
+            The bytes, tokens and retries of the run.
+        failed : bool
+            Whether the run raised an exception.
+        """
+        record = record or StageRecord()
+
+        with self._lock:
+            stage = self.stages.setdefault(name, StageMetrics())
+            stage.count += 1
+            stage.duration += duration
+            stage.max_duration = max(stage.max_duration, duration)
+            stage.bytes += record.bytes
+            stage.prompt_tokens += record.prompt_tokens
+            stage.completion_tokens += record.completion_tokens
+            stage.retries += record.retries
+            stage.errors += 1 if failed else 0
+
+    def summary(self) -> dict:
+        """
+        Returns the measurements of the run.
+
+        Returns
+        -------
+        dict
+            The job, the start time, the run duration and the measurements per stage.
+        """
+        with self._lock:
+            stages = {name: stage.to_dict() for name, stage in self.stages.items()}
+
+        return {
+            "job": self.job,
+            "started_at": self.started,
+            "duration_seconds": round(time.monotonic() - self._started_monotonic, 6),
+            "stages": stages,
+        }
+
+    def prometheus(self) -> str:
+        """
+        Formats the measurements of the run in the Prometheus text exposition format.
+
+        Returns
+        -------
+        str
+            The metrics, labelled with the job and the stage.
+        """
+        summary = self.summary()
+        job = summary["job"].replace("\\", "\\\\").replace('"', '\\"')
+
+        lines = [
+            "# HELP summarizer_run_duration_seconds Duration of the last run.",
+            "# TYPE summarizer_run_duration_seconds gauge",
+            f'summarizer_run_duration_seconds{{job="{job}"}} {summary["duration_seconds"]}',
+            "# HELP summarizer_run_timestamp_seconds Start of the last run as UNIX timestamp.",
+            "# TYPE summarizer_run_timestamp_seconds gauge",
+            f'summarizer_run_timestamp_seconds{{job="{job}"}} {summary["started_at"]:.3f}',
+        ]
+
+        for metric, field, kind, description in (
+            ("summarizer_stage_runs", "count", "gauge", "Runs of the stage."),
+            (
+                "summarizer_stage_duration_seconds",
+                "duration_seconds",
+                "gauge",
+                "Combined duration of the stage.",
+            ),
+            (
+                "summarizer_stage_max_duration_seconds",
+                "max_duration_seconds",
+                "gauge",
+                "Duration of the slowest run of the stage.",
+            ),
+            ("summarizer_stage_bytes", "bytes", "gauge", "Bytes of the stage."),
+            (
+                "summarizer_stage_prompt_tokens",
+                "prompt_tokens",
+                "gauge",
+                "Prompt tokens of the stage.",
+            ),
+            (
+                "summarizer_stage_completion_tokens",
+                "completion_tokens",
+                "gauge",
+                "Completion tokens of the stage.",
+            ),
+            (
+                "summarizer_stage_retries",
+                "retries",
+                "gauge",
+                "Retries after rate limit errors.",
+            ),
+            ("summarizer_stage_errors", "errors", "gauge", "Failed runs of the stage."),
+        ):
+            lines.append(f"# HELP {metric} {description}")
+            lines.append(f"# TYPE {metric} {kind}")
+            for name, stage in sorted(summary["stages"].items()):
+                lines.append(f'{metric}{{job="{job}",stage="{name}"}} {stage[field]}')
+
+        return "\n".join(lines) + "\n"
+
+    def export(self, json_path: str = None, prometheus_path: str = None):
+        """
+        Logs the JSON summary of the run and writes it to the given files.
+
+        The files are replaced atomically, so a textfile collector never reads a partially written file.
+        Concurrent exports, e.g. by the jobs of the resident mode, write unique temporary files one after the
+        other, so the files always hold the newest summary.
+
+        Parameters
+        ----------
+        json_path : str, optional
+            The path of the JSON file.
+        prometheus_path : str, optional
+            The path of the Prometheus text file, which should end with `.prom`.
+        """
+        with self._export_lock:
+            summary = self.summary()
+            logging.info(f"Run metrics: {json.dumps(summary)}")
+
+            for path, content in (
+                (json_path, lambda: json.dumps(summary, indent=2)),
+                (prometheus_path, self.prometheus),
+            ):
+                if not path:
+                    continue
+
+                directory = os.path.dirname(path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+
+                descriptor, temporary_path = tempfile.mkstemp(
+                    prefix=f"{os.path.basename(path)}.",
+                    suffix=".tmp",
+                    dir=directory or ".",
+                )
+                try:
+                    with os.fdopen(descriptor, "w", encoding="utf-8") as file:
+                        file.write(content())
+                    os.chmod(temporary_path, 0o644)
+                    os.replace(temporary_path, path)
+                except BaseException:
+                    os.unlink(temporary_path)
+                    raise
+                logging.info(f"Wrote run metrics to {path}")
+
+
+_default_metrics = None
+_default_metrics_lock = threading.Lock()
+
+
+def default_metrics() -> MetricsRecorder:
+    """
+    Returns the metrics recorder shared by all clients of the process, creating it on first use.
+
+    Returns
+    -------
+    MetricsRecorder
+        The shared recorder.
+    """
+    global _default_metrics
+
+    with _default_metrics_lock:
+        if _default_metrics is None:
+            _default_metrics = MetricsRecorder()
+
+    return _default_metrics
@@ -0,0 +1,250 @@
+import logging
+from typing import Callable, List, Optional, Tuple
+
+from client_modules.rate_limiter import RateLimiter
+from client_modules.text_chunker import estimate_tokens
+
+# The models tried by default, smallest and fastest first.
+DEFAULT_MODELS = "gpt-3.5-turbo:4096,gpt-3.5-turbo-16k:16384"
+
+# Tokens of the chat framing around every message, plus the priming of the reply.
+MESSAGE_FRAMING_TOKENS = 4
+REPLY_FRAMING_TOKENS = 3
+
+logging.getLogger(__name__)
+
+
+class ChatModel:
+    """
+    Class representing a chat model the summaries can be routed to.
+
+    Attributes
+    ----------
+    name : str
+        The name of the OpenAI model.
+    context_tokens : int
+        The size of the context window of the model in tokens.
+    rate_limiter : RateLimiter
+        The rate limiter of the model. OpenAI applies its limits per model.
+    """
+
+    def __init__(
+        self, name: str, context_tokens: int, rate_limiter: RateLimiter
+    ) -> None:
+        self.name = name
+        self.context_tokens = context_tokens
+        self.rate_limiter = rate_limiter
+
+    def __repr__(self) -> str:
+        return f"ChatModel({self.name}, {self.context_tokens})"
+
+
+def parse_models(
+    spec: str, rate_limiter_of: Callable[[str], RateLimiter]
+) -> List[ChatModel]:
+    """
+    Parses a list of chat models like `gpt-3.5-turbo:4096,gpt-3.5-turbo-16k:16384`.
+
+    Parameters
+    ----------
+    spec : str
+        Comma separated `name:context_tokens` pairs, in the order the models should be preferred.
+    rate_limiter_of : Callable[[str], RateLimiter]
+        Creates the rate limiter of a model from its name.
+
+    Returns
+    -------
+    List[ChatModel]
+        The configured models.
+
+    Raises
+    ------
+    ValueError
+        If an entry has no valid context size or the list is empty.
+    """
+    models = []
+
+    for entry in spec.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+
+        name, separator, context_tokens = entry.rpartition(":")
+        if not separator or not name or not context_tokens.strip().isdigit():
+            raise ValueError(
+                f"Invalid model {entry!r}, expected <name>:<context tokens>"
+            )
+
+        models.append(
+            ChatModel(name.strip(), int(context_tokens), rate_limiter_of(name.strip()))
+        )
+
+    if not models:
+        raise ValueError("No chat models configured")
+
+    return models
+
+
+def estimate_prompt_tokens(system_message: str, text: str) -> int:
+    """
+    Estimates the prompt tokens of a chat request with a system and a user message.
+
+    Parameters
+    ----------
+    system_message : str
+        The system message of the request.
+    text : str
+        The user input of the request.
+
+    Returns
+    -------
+    int
+        The estimated number of prompt tokens, including the message framing.
+    """
+    return (
+        estimate_tokens(system_message)
+        + estimate_tokens(text)
+        + 2 * MESSAGE_FRAMING_TOKENS
+        + REPLY_FRAMING_TOKENS
+    )
+
+
+class ModelRouter:
+    """
+    Picks the chat model and the completion size of a request from the size of its input.
+
+    A request goes to the first configured model whose context fits the prompt and the expected completion,
+    so short texts are sent to the small and fast models. The other models that fit are the fallbacks, tried
+    in order when a model is rate limited. Models that are still paused after a rate limit error are moved to
+    the end of the list.
+
+    Attributes
+    ----------
+    models : List[ChatModel]
+        The configured models, in the order they are preferred.
+    max_tokens : int
+        The upper bound of the tokens generated per completion.
+    min_completion_tokens : int
+        The lower bound of the tokens generated per completion.
+    completion_ratio : float
+        The expected size of a completion relative to the size of the prompt.
+    margin_tokens : int
+        The margin kept free in the context for estimation errors.
+    """
+
+    def __init__(
+        self,
+        models: List[ChatModel],
+        max_tokens: int = 2000,
+        min_completion_tokens: int = 512,
+        completion_ratio: float = 0.5,
+        margin_tokens: int = 256,
+    ) -> None:
+        self.models = models
+        self.max_tokens = max_tokens
+        self.min_completion_tokens = min_completion_tokens
+        self.completion_ratio = completion_ratio
+        self.margin_tokens = margin_tokens
+
+    @property
+    def context_tokens(self) -> int:
+        """
+        The size of the largest context of the configured models.
+        """
+        return max(model.context_tokens for model in self.models)
+
+    def completion_tokens(
+        self, prompt_tokens: int, expected_tokens: Optional[int] = None
+    ) -> int:
+        """
+        Calculates the `max_tokens` of a request.
+
+        Parameters
+        ----------
+        prompt_tokens : int
+            The estimated prompt tokens of the request.
+        expected_tokens : int, optional
+            The completion size the caller expects, e.g. from the number of sections to summarize. If None,
+            it is derived from the prompt size.
+
+        Returns
+        -------
+        int
+            The number of tokens to allow for the completion, between `min_completion_tokens` and
+            `max_tokens`.
+        """
+        if expected_tokens is None:
+            expected_tokens = int(prompt_tokens * self.completion_ratio)
+
+        return min(self.max_tokens, max(self.min_completion_tokens, expected_tokens))
+
+    def route(
+        self, prompt_tokens: int, expected_tokens: Optional[int] = None
+    ) -> List[Tuple[ChatModel, int]]:
+        """
+        Returns the models to try for a request, each with the `max_tokens` to request.
+
+        Parameters
+        ----------
+        prompt_tokens : int
+            The estimated prompt tokens of the request.
+        expected_tokens : int, optional
+            The completion size the caller expects, see `completion_tokens`.
+
+        Returns
+        -------
+        List[Tuple[ChatModel, int]]
+            The models whose context fits the request, in the order they should be tried. If none fits, the
+            model with the largest context, with the completion shrunk to what is left of its context, but
+            not below `min_completion_tokens`.
+        """
+        max_tokens = self.completion_tokens(prompt_tokens, expected_tokens)
+
+        fitting = [
+            model
+            for model in self.models
+            if prompt_tokens + max_tokens + self.margin_tokens <= model.context_tokens
+        ]
+
+        if not fitting:
+            largest = max(self.models, key=lambda model: model.context_tokens)
+            remaining = largest.context_tokens - prompt_tokens - self.margin_tokens
+            logging.warning(
+                f"Request with ~{prompt_tokens} prompt tokens exceeds the context of all models, sending it to {largest.name}"
+            )
+            return [
+                (largest, max(self.min_completion_tokens, min(max_tokens, remaining)))
+            ]
+
+        available = [model for model in fitting if not model.rate_limiter.paused_for()]
+        paused = [model for model in fitting if model.rate_limiter.paused_for()]
+
+        return [(model, max_tokens) for model in available + paused]
+
+    def primary(
+        self, prompt_tokens: int, expected_tokens: Optional[int] = None
+    ) -> ChatModel:
+        """
+        Returns the model a request is routed to when no model is rate limited.
+
+        The result does not depend on the rate limit state, so it can be used for cache keys.
+
+        Parameters
+        ----------
+        prompt_tokens : int
+            The estimated prompt tokens of the request.
+        expected_tokens : int, optional
+            The completion size the caller expects, see `completion_tokens`.
+
+        Returns
+        -------
+        ChatModel
+            The first model whose context fits the request, or the model with the largest context.
+        """
+        max_tokens = self.completion_tokens(prompt_tokens, expected_tokens)
+
+        for model in self.models:
+            if prompt_tokens + max_tokens + self.margin_tokens <= model.context_tokens:
+                return model
+
+        return max(self.models, key=lambda model: model.context_tokens)
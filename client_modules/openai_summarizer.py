@@ -1,6 +1,24 @@
 import openai
 import logging
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Optional
+
+from client_modules.http_transport import HttpTransport, default_transport
+from client_modules.metrics import MetricsRecorder, StageRecord, default_metrics
+from client_modules.model_router import (
+    DEFAULT_MODELS,
+    ChatModel,
+    ModelRouter,
+    estimate_prompt_tokens,
+    parse_models,
+)
+from client_modules.rate_limiter import RateLimiter, parse_retry_after
+from client_modules.summary_cache import SummaryCache
+from client_modules.text_chunker import estimate_tokens, split_into_chunks
+
+chunk_summary_message = """You are summarizing one part of a longer document. Summarize the following part in the language of the text. Keep the headings of the sections, and all key facts, numbers, names and decisions. Do not add an introduction or a conclusion."""
 
 logging.getLogger(__name__)
 
@@ -13,36 +31,181 @@ class OpenaiClient:
     ----------
     api_key : str
         The API key for OpenAI.
+    transport : HttpTransport
+        The pooled HTTP transport used for all requests.
+    cache : SummaryCache
+        The persistent summary cache. If None, every request is sent to OpenAI.
+    router : ModelRouter
+        Picks the chat model and the `max_tokens` of each request from the size of its input.
+    map_workers : int
+        The number of chunks of a long text that are summarized in parallel.
+    rate_limiter : RateLimiter
+        The rate limiter of the default models, if no models are configured.
+    api_base : str
+        The base URL of the OpenAI API. If None, the default of the `openai` library is used.
+    metrics : MetricsRecorder
+        The recorder of the `openai_call` stage.
     """
 
-    def __init__(self, openai_api_key):
+    def __init__(
+        self,
+        openai_api_key,
+        transport: HttpTransport = None,
+        cache: SummaryCache = None,
+        map_workers: int = 4,
+        api_base: str = None,
+        metrics: MetricsRecorder = None,
+        models: List[ChatModel] = None,
+        max_tokens: int = 2000,
+    ):
         """
         Initializes the OpenaiClient with the provided API key.
 
+        The API key is passed with every request instead of being stored in the global `openai` module
+        state. The `openai` library is configured to send its requests through the pooled session of the
+        transport.
+
         Parameters
         ----------
         openai_api_key : str
             The API key for OpenAI.
+        transport : HttpTransport, optional
+            The pooled HTTP transport to use. Defaults to the transport shared by the process.
+        cache : SummaryCache, optional
+            The persistent summary cache to look up and store chat completions in.
+        map_workers : int, optional
+            The number of chunks of a long text that are summarized in parallel.
+        api_base : str, optional
+            The base URL of the OpenAI API, e.g. to use a local stand-in for testing.
+        metrics : MetricsRecorder, optional
+            The recorder of the `openai_call` stage. Defaults to the recorder shared by the process.
+        models : List[ChatModel], optional
+            The chat models to route the requests to, smallest and fastest first. Defaults to the models of
+            `DEFAULT_MODELS`, each with a rate limiter of its own for 3500 requests and 180000 tokens per
+            minute, so a model that is rate limited does not pause the fallback to the next one.
+        max_tokens : int, optional
+            The upper bound of the tokens generated per completion.
         """
         self.api_key = openai_api_key
-        openai.api_key = self.api_key
+        self.transport = transport or default_transport()
+        self.cache = cache
+        self.map_workers = map_workers
+        self.router = ModelRouter(
+            models
+            or parse_models(
+                DEFAULT_MODELS, lambda name: RateLimiter(f"OpenAI {name}", 3500, 180000)
+            ),
+            max_tokens,
+        )
+        self.api_base = api_base
+        self.metrics = metrics or default_metrics()
+        openai.requestssession = self.transport.session
 
-    def chatCompletion(self, system_message: str, text: str) -> str:
+    @property
+    def max_tokens(self) -> int:
         """
-        Generates a conversation using OpenAI's GPT-3.5 model based on the provided system message and user input.
+        The upper bound of the tokens generated per completion.
+        """
+        return self.router.max_tokens
 
-        This function uses the "gpt-3.5-turbo-16k" model. The system message sets up the initial context of the
-        conversation, and the user message acts as an interaction with the model.
+    @property
+    def context_tokens(self) -> int:
+        """
+        The size of the largest context of the configured models.
+        """
+        return self.router.context_tokens
+
+    def _create(
+        self,
+        messages: list,
+        prompt_tokens: int,
+        expected_tokens: Optional[int],
+        stage: StageRecord,
+        stream: bool = False,
+    ):
+        """
+        Sends a chat completion request to the routed model, falling back to the next model that fits when
+        a model is rate limited.
+
+        Only the last model is retried under its rate limiter, the others are given up after the first rate
+        limit error. Their limiters stay paused for the `Retry-After`, so later requests try them last.
+
+        Returns
+        -------
+        Tuple[str, object]
+            The name of the model that answered and its response.
+        """
+        candidates = self.router.route(prompt_tokens, expected_tokens)
+
+        for index, (model, max_tokens) in enumerate(candidates):
+            fallback = index + 1 < len(candidates)
+            logging.info(
+                f"Sending ~{prompt_tokens} prompt tokens to {model.name} with max_tokens {max_tokens}"
+            )
+
+            try:
+                response = model.rate_limiter.call(
+                    lambda: openai.ChatCompletion.create(
+                        model=model.name,
+                        messages=messages,
+                        api_key=self.api_key,
+                        api_base=self.api_base,
+                        request_timeout=self.transport.timeout,
+                        max_tokens=max_tokens,
+                        n=1,
+                        stop=None,
+                        temperature=0,
+                        stream=stream,
+                    ),
+                    prompt_tokens + max_tokens,
+                    retry_after_of=_openai_retry_after,
+                    # Streamed responses carry no usage, so it is estimated from the streamed text
+                    tokens_used_of=(
+                        lambda chunks: prompt_tokens
+                        + estimate_tokens(_streamed_text(chunks))
+                    )
+                    if stream
+                    else lambda response: response.get("usage", {}).get("total_tokens"),
+                    max_retries=0 if fallback else 5,
+                    on_retry=stage.retry,
+                    stream=stream,
+                )
+            except openai.error.RateLimitError:
+                if not fallback:
+                    raise
+
+                stage.retry()
+                logging.warning(
+                    f"{model.name} rate limited, falling back to {candidates[index + 1][0].name}"
+                )
+                continue
+
+            return model.name, response
+
+    def chatCompletion(
+        self, system_message: str, text: str, expected_tokens: int = None
+    ) -> str:
+        """
+        Generates a conversation using OpenAI's GPT-3.5 models based on the provided system message and user input.
+
+        The request is sent to the smallest configured model whose context fits the prompt and the expected
+        completion, and `max_tokens` is sized from the input, see `ModelRouter`. The system message sets up
+        the initial context of the conversation, and the user message acts as an interaction with the model.
 
         The function logs the beginning and end of the OpenAI request. If the OpenAI API call is successful,
         the function extracts the first choice's message content as the generated response.
 
+        Since the request is deterministic, the response is looked up in and stored to the summary cache,
+        if one is configured.
+
         Parameters
         ----------
         system_message : str
             The initial message given by the system to set the context of the conversation.
         text : str
             The user input text to interact with the AI model.
+        expected_tokens : int, optional
+            The expected size of the completion in tokens. If None, it is derived from the size of the input.
 
         Returns
         -------
@@ -59,27 +222,213 @@ class OpenaiClient:
             {"role": "system", "content": f"{system_message}"},
             {"role": "user", "content": f"{text}"},
         ]
+        prompt_tokens = estimate_prompt_tokens(system_message, text)
+
+        if self.cache:
+            cache_key = self.cache.key(
+                self.router.primary(prompt_tokens, expected_tokens).name,
+                system_message,
+                text,
+            )
+            cached = self.cache.get(cache_key)
+            if cached:
+                return cached.summary
 
         logging.info("Started openAI summary request")
-        response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo-16k",
-            messages=messages,
-            max_tokens=2000,
-            n=1,
-            stop=None,
-            temperature=0,
-        )
+        with self.metrics.stage("openai_call") as stage:
+            model, response = self._create(
+                messages, prompt_tokens, expected_tokens, stage
+            )
+            stage.add_usage(response.get("usage"))
+            stage.add_bytes(len(system_message.encode()) + len(text.encode()))
 
         logging.info("openAI summary request done")
 
         if "choices" in response and len(response["choices"]) > 0:
             summary = response["choices"][0]["message"]["content"].strip()
-            logging.info(response["usage"])
+            usage = response["usage"]
+            logging.info(
+                f"OpenAI usage of {model}: {usage.get('prompt_tokens')} prompt, {usage.get('completion_tokens')} completion tokens"
+            )
+            if response["choices"][0].get("finish_reason") == "length":
+                logging.warning(f"Summary of {model} was cut off at max_tokens")
+
+            if self.cache:
+                self.cache.put(cache_key, model, summary, response["usage"])
+
             return summary
         else:
             logging.error(f"Sending to OpenAI has failed. (╯°□°）╯︵ ┻━┻")
             sys.exit(1)
 
+    def stream_chat_completion(
+        self, system_message: str, text: str, expected_tokens: int = None
+    ) -> Iterator[str]:
+        """
+        Generates a chat completion like `chatCompletion`, but yields the generated text while it arrives.
+
+        If the summary cache holds the completion already, it is yielded as a whole. Otherwise the completion
+        is stored in the cache once it is complete.
+
+        Parameters
+        ----------
+        system_message : str
+            The initial message given by the system to set the context of the conversation.
+        text : str
+            The user input text to interact with the AI model.
+        expected_tokens : int, optional
+            The expected size of the completion in tokens. If None, it is derived from the size of the input.
+
+        Yields
+        ------
+        str
+            The parts of the generated response in order.
+        """
+        messages = [
+            {"role": "system", "content": f"{system_message}"},
+            {"role": "user", "content": f"{text}"},
+        ]
+        prompt_tokens = estimate_prompt_tokens(system_message, text)
+
+        if self.cache:
+            cache_key = self.cache.key(
+                self.router.primary(prompt_tokens, expected_tokens).name,
+                system_message,
+                text,
+            )
+            cached = self.cache.get(cache_key)
+            if cached:
+                yield cached.summary
+                return
+
+        logging.info("Started streaming openAI summary request")
+
+        # The `openai_call` stage only measures the waits for OpenAI, not the time the caller spends on the
+        # yielded parts, e.g. updating a Slack message
+        stage = StageRecord()
+        duration = 0.0
+        failed = False
+        waiting_since = time.perf_counter()
+        parts = []
+        stream = None
+
+        try:
+            model, stream = self._create(
+                messages, prompt_tokens, expected_tokens, stage, stream=True
+            )
+
+            for chunk in stream:
+                part = _chunk_text(chunk)
+                if part:
+                    parts.append(part)
+                    duration += time.perf_counter() - waiting_since
+                    waiting_since = None
+                    yield part
+                    waiting_since = time.perf_counter()
+
+            # Streamed responses carry no usage, so it is estimated
+            stage.add_usage(
+                {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": estimate_tokens("".join(parts)),
+                }
+            )
+            stage.add_bytes(len(system_message.encode()) + len(text.encode()))
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            # Releases the rate limiter slot of the request if the caller stopped early
+            if stream is not None:
+                stream.close()
+            if waiting_since is not None:
+                duration += time.perf_counter() - waiting_since
+            self.metrics.record("openai_call", duration, stage, failed)
+
+        logging.info("openAI streaming summary request done")
+
+        summary = "".join(parts).strip()
+        if self.cache and summary:
+            completion_tokens = estimate_tokens(summary)
+            self.cache.put(
+                cache_key,
+                model,
+                summary,
+                {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                },
+            )
+
+    def input_budget(self, system_message: str) -> int:
+        """
+        Calculates how many tokens of user input fit into a request with the given system message.
+
+        Parameters
+        ----------
+        system_message : str
+            The system message of the request.
+
+        Returns
+        -------
+        int
+            The estimated number of input tokens that fit next to the system message and the completion.
+        """
+        return (
+            self.context_tokens
+            - self.max_tokens
+            - estimate_tokens(system_message)
+            - self.router.margin_tokens
+        )
+
+    def summarize(self, system_message: str, text: str) -> str:
+        """
+        Summarizes a text, splitting it into several requests if it does not fit into the model context.
+
+        Texts that fit are summarized with a single `chatCompletion` call. Longer texts are split into chunks
+        at heading and paragraph boundaries, the chunks are summarized in parallel, and the partial summaries
+        are merged by a final request using the provided system message, so the output keeps its format.
+
+        Parameters
+        ----------
+        system_message : str
+            The system message used for the final summary.
+        text : str
+            The text to summarize.
+
+        Returns
+        -------
+        str
+            The generated summary.
+        """
+        input_budget = self.input_budget(system_message)
+
+        if estimate_tokens(text) <= input_budget:
+            return self.chatCompletion(system_message, text)
+
+        chunk_budget = min(input_budget, self.input_budget(chunk_summary_message))
+        chunks = split_into_chunks(text, chunk_budget)
+        logging.info(
+            f"Text with ~{estimate_tokens(text)} tokens exceeds the context, summarizing {len(chunks)} chunks"
+        )
+
+        with ThreadPoolExecutor(
+            max_workers=max(1, min(self.map_workers, len(chunks)))
+        ) as executor:
+            partial_summaries = list(
+                executor.map(
+                    lambda chunk: self.chatCompletion(chunk_summary_message, chunk),
+                    chunks,
+                )
+            )
+
+        merged = "\n\n".join(partial_summaries)
+        if estimate_tokens(merged) > input_budget:
+            return self.summarize(system_message, merged)
+
+        return self.chatCompletion(system_message, merged)
+
     def generate_summary_confluence(self, statement: str, text: str) -> str:
         """
         Generates a summary using OpenAI's GPT-3 model based on the provided statement and text.
@@ -102,6 +451,9 @@ class OpenaiClient:
         response = openai.Completion.create(
             engine="text-davinci-003",
             prompt=prompt,
+            api_key=self.api_key,
+            api_base=self.api_base,
+            request_timeout=self.transport.timeout,
             max_tokens=500,
             n=1,
             stop=None,
@@ -116,3 +468,30 @@ class OpenaiClient:
         else:
             logging.error(f"Sending to OpenAI has failed. (╯°□°）╯︵ ┻━┻")
             sys.exit(1)
+
+
+def _openai_retry_after(error: BaseException):
+    """
+    Returns the seconds to wait if the error is an OpenAI rate limit error, or None otherwise.
+    """
+    if not isinstance(error, openai.error.RateLimitError):
+        return None
+
+    return parse_retry_after(error.headers)
+
+
+def _chunk_text(chunk: dict) -> str:
+    """
+    Returns the generated text of a chunk of a streamed chat completion, or an empty string.
+    """
+    if not chunk.get("choices"):
+        return ""
+
+    return chunk["choices"][0].get("delta", {}).get("content") or ""
+
+
+def _streamed_text(chunks: list) -> str:
+    """
+    Returns the generated text of all chunks of a streamed chat completion.
+    """
+    return "".join(_chunk_text(chunk) for chunk in chunks)
@@ -0,0 +1,374 @@
+import logging
+import random
+import threading
+import time
+from typing import Callable, Iterable, Iterator, List, Optional
+
+logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    A thread-safe token bucket that refills continuously.
+
+    The balance may become negative when a reservation is reconciled with a higher actual cost. Later
+    acquisitions then wait until the debt is paid back.
+
+    Attributes
+    ----------
+    capacity : float
+        The maximum number of tokens in the bucket.
+    refill_rate : float
+        The number of tokens added per second.
+    """
+
+    def __init__(self, capacity: float, refill_rate: float) -> None:
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.refill_rate
+        )
+        self._updated = now
+
+    def acquire(self, amount: float):
+        """
+        Takes tokens from the bucket, blocking until enough tokens are available.
+
+        Parameters
+        ----------
+        amount : float
+            The number of tokens to take. Amounts larger than the capacity are capped at the capacity.
+        """
+        amount = min(amount, self.capacity)
+
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return
+                wait = (amount - self._tokens) / self.refill_rate
+
+            time.sleep(wait)
+
+    def adjust(self, amount: float):
+        """
+        Adds tokens to or removes tokens from the bucket without blocking.
+
+        Parameters
+        ----------
+        amount : float
+            The number of tokens to add. Negative amounts remove tokens.
+        """
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.capacity, self._tokens + amount)
+
+
+class RateLimiter:
+    """
+    A rate limiter for one API, shared by all threads calling it.
+
+    Requests are limited by a requests-per-minute and an optional tokens-per-minute bucket and by an
+    adaptive concurrency limit. The concurrency limit grows by one per window of successful requests and is
+    halved whenever the API answers with a rate limit error (AIMD). A `Retry-After` from the API pauses all
+    requests through this limiter until it has passed.
+
+    Attributes
+    ----------
+    name : str
+        The name of the limited API, used for logging.
+    max_concurrency : int
+        The upper bound of the adaptive concurrency limit.
+    concurrency : float
+        The current concurrency limit.
+    rate_limited : int
+        The number of rate limit errors seen.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        requests_per_minute: float,
+        tokens_per_minute: Optional[float] = None,
+        max_concurrency: int = 8,
+    ) -> None:
+        """
+        Initializes the RateLimiter.
+
+        Parameters
+        ----------
+        name : str
+            The name of the limited API, used for logging.
+        requests_per_minute : float
+            The number of requests allowed per minute.
+        tokens_per_minute : float, optional
+            The number of tokens allowed per minute. If None, only requests are limited.
+        max_concurrency : int
+            The upper bound of the adaptive concurrency limit.
+        """
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.concurrency = float(max_concurrency)
+        self.rate_limited = 0
+
+        self._requests = TokenBucket(
+            max(1.0, requests_per_minute / 60), requests_per_minute / 60
+        )
+        self._tokens = (
+            TokenBucket(tokens_per_minute, tokens_per_minute / 60)
+            if tokens_per_minute
+            else None
+        )
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._condition = threading.Condition()
+
+    def acquire(self, estimated_tokens: int = 0):
+        """
+        Blocks until a request with the given estimated cost may be sent and reserves its cost.
+
+        Parameters
+        ----------
+        estimated_tokens : int
+            The estimated number of tokens the request will use.
+        """
+        with self._condition:
+            while True:
+                pause = self._paused_until - time.monotonic()
+                if pause > 0:
+                    self._condition.wait(pause)
+                elif self._in_flight >= max(1, int(self.concurrency)):
+                    self._condition.wait()
+                else:
+                    break
+            self._in_flight += 1
+
+        try:
+            self._requests.acquire(1)
+            if self._tokens and estimated_tokens:
+                self._tokens.acquire(estimated_tokens)
+        except BaseException:
+            self.release()
+            raise
+
+    def release(
+        self,
+        estimated_tokens: int = 0,
+        actual_tokens: Optional[int] = None,
+        retry_after: Optional[float] = None,
+    ):
+        """
+        Finishes a request, reconciles its reserved cost and adapts the concurrency limit.
+
+        Parameters
+        ----------
+        estimated_tokens : int
+            The number of tokens that were reserved for the request.
+        actual_tokens : int, optional
+            The number of tokens the request actually used. If None, the reservation is kept as is.
+        retry_after : float, optional
+            If set, the request was rate limited and no request is sent for this many seconds.
+        """
+        if self._tokens and actual_tokens is not None:
+            self._tokens.adjust(estimated_tokens - actual_tokens)
+
+        with self._condition:
+            self._in_flight -= 1
+
+            if retry_after is not None:
+                self.rate_limited += 1
+                self.concurrency = max(1.0, self.concurrency / 2)
+                self._paused_until = max(
+                    self._paused_until, time.monotonic() + retry_after
+                )
+                logging.warning(
+                    f"{self.name} rate limited, pausing for {retry_after:.1f}s, concurrency limit {int(self.concurrency)}"
+                )
+            else:
+                self.concurrency = min(
+                    self.max_concurrency, self.concurrency + 1 / self.concurrency
+                )
+
+            self._condition.notify_all()
+
+    def paused_for(self) -> float:
+        """
+        Returns the number of seconds requests through this limiter are still paused after a rate limit error.
+
+        Returns
+        -------
+        float
+            The remaining pause in seconds, or 0 if requests may be sent.
+        """
+        with self._condition:
+            return max(0.0, self._paused_until - time.monotonic())
+
+    def call(
+        self,
+        function: Callable,
+        estimated_tokens: int = 0,
+        retry_after_of: Callable[[BaseException], Optional[float]] = lambda e: None,
+        tokens_used_of: Callable[[object], Optional[int]] = lambda result: None,
+        max_retries: int = 5,
+        on_retry: Optional[Callable[[], None]] = None,
+        stream: bool = False,
+    ):
+        """
+        Calls a function under the rate limit, retrying it when the API answers with a rate limit error.
+
+        If the function returns a stream, the request is not finished when the function returns. With `stream`,
+        the result is wrapped in a `HeldStream`, which keeps the concurrency slot until the stream is exhausted,
+        fails or is closed.
+
+        Parameters
+        ----------
+        function : Callable
+            The function sending the request.
+        estimated_tokens : int
+            The estimated number of tokens the request will use.
+        retry_after_of : Callable[[BaseException], Optional[float]]
+            Returns the number of seconds to wait if an exception is a rate limit error, or None otherwise.
+            An exception that is a rate limit error without a `Retry-After` should return 0, in which case an
+            exponential backoff is used.
+        tokens_used_of : Callable[[object], Optional[int]]
+            Returns the number of tokens a result actually used, or None if unknown. For a stream, it is called
+            with the list of the streamed items once the stream is exhausted.
+        max_retries : int
+            The maximum number of retries after rate limit errors.
+        on_retry : Callable[[], None], optional
+            Called before every retry, e.g. to count retries in the metrics of a stage.
+        stream : bool
+            Whether the function returns a stream of items.
+
+        Returns
+        -------
+        object
+            The result of the function, or a `HeldStream` of it if `stream` is set.
+
+        Raises
+        ------
+        BaseException
+            The exception of the last attempt, if it was not a rate limit error or no retries were left. A
+            rate limit error without retries left still pauses the limiter.
+        """
+        for attempt in range(max_retries + 1):
+            self.acquire(estimated_tokens)
+
+            try:
+                result = function()
+            except BaseException as e:
+                retry_after = retry_after_of(e)
+
+                if retry_after is None:
+                    self.release(estimated_tokens)
+                    raise
+
+                if not retry_after:
+                    retry_after = min(60.0, 2**attempt + random.random())
+
+                self.release(estimated_tokens, 0, retry_after)
+                if attempt == max_retries:
+                    raise
+                if on_retry:
+                    on_retry()
+                continue
+
+            if stream:
+                return HeldStream(self, result, estimated_tokens, tokens_used_of)
+
+            self.release(estimated_tokens, tokens_used_of(result))
+            return result
+
+
+class HeldStream:
+    """
+    Iterates over the stream of a request sent through a `RateLimiter` and finishes the request at its end.
+
+    The request is released when the stream is exhausted, raises or is closed, so it occupies a concurrency
+    slot of the limiter while it is being received. The reserved tokens are only reconciled with the actual
+    usage if the stream was exhausted.
+    """
+
+    def __init__(
+        self,
+        limiter: RateLimiter,
+        stream: Iterable,
+        estimated_tokens: int,
+        tokens_used_of: Callable[[List], Optional[int]],
+    ) -> None:
+        self._limiter = limiter
+        self._iterator: Iterator = iter(stream)
+        self._estimated_tokens = estimated_tokens
+        self._tokens_used_of = tokens_used_of
+        self._items: List = []
+        self._released = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            item = next(self._iterator)
+        except StopIteration:
+            self._release(self._tokens_used_of(self._items))
+            raise
+        except BaseException:
+            self.close()
+            raise
+
+        self._items.append(item)
+        return item
+
+    def _release(self, actual_tokens: Optional[int] = None):
+        if not self._released:
+            self._released = True
+            self._limiter.release(self._estimated_tokens, actual_tokens)
+
+    def close(self):
+        """
+        Stops receiving the stream and releases the request, if it was not released yet.
+        """
+        if self._released:
+            return
+
+        self._release()
+        close = getattr(self._iterator, "close", None)
+        if close:
+            close()
+
+    def __del__(self):
+        self.close()
+
+
+def parse_retry_after(headers) -> float:
+    """
+    Reads the `Retry-After` header in seconds from the headers of a response.
+
+    Parameters
+    ----------
+    headers : dict
+        The response headers. May be None.
+
+    Returns
+    -------
+    float
+        The number of seconds to wait, or 0 if the header is missing or not a number.
+    """
+    if not headers:
+        return 0.0
+
+    for name, value in headers.items():
+        if name.lower() == "retry-after":
+            try:
+                return max(0.0, float(value))
+            except (TypeError, ValueError):
+                return 0.0
+
+    return 0.0
@@ -0,0 +1,236 @@
+import logging
+import sys
+import threading
+from os import getenv
+from typing import TYPE_CHECKING, List, Optional
+
+from client_modules.fanout import parse_channels
+from client_modules.http_transport import HttpTransport, default_transport
+from client_modules.metrics import MetricsRecorder, default_metrics
+
+# The clients below pull in `openai` and `slack_sdk`, which take most of the start-up time. They are imported
+# when a client is first used, so a run that finds nothing new never loads them.
+if TYPE_CHECKING:
+    from client_modules.openai_summarizer import OpenaiClient
+    from client_modules.slack_client import SlackClient
+    from client_modules.summary_cache import SummaryCache
+    from client_modules.watermark_store import WatermarkStore
+
+logging.getLogger(__name__)
+
+
+def configure_logging():
+    """
+    Configures the log format shared by all modes.
+    """
+    logging.basicConfig(
+        stream=sys.stdout,
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+
+
+class Clients:
+    """
+    Class holding the clients shared by the summarizer modes running in one process.
+
+    Apart from the transport and the metrics, the clients are created on first use from the environment
+    variables, see `from_env`. Creating them is thread-safe, so modes running concurrently share the same
+    instances.
+
+    Attributes
+    ----------
+    transport : HttpTransport
+        The pooled HTTP transport used for all requests.
+    metrics : MetricsRecorder
+        The recorder of the run metrics.
+    slack_channel : str
+        The Slack channel the test runs of `DEBUG` post to. The first of `slack_channels`.
+    slack_channels : List[str]
+        The Slack channels the new summaries are delivered to.
+    """
+
+    def __init__(
+        self,
+        transport: HttpTransport,
+        metrics: MetricsRecorder,
+        slack_channel: str,
+        factories: dict,
+        slack_channels: Optional[List[str]] = None,
+    ) -> None:
+        """
+        Initializes the Clients.
+
+        Parameters
+        ----------
+        transport : HttpTransport
+            The pooled HTTP transport used for all requests.
+        metrics : MetricsRecorder
+            The recorder of the run metrics.
+        slack_channel : str
+            The Slack channel the summaries are posted to.
+        factories : dict
+            The functions creating the lazy clients, keyed by `summary_cache`, `openai_client`, `slack_client`
+            and `watermark_store`.
+        slack_channels : Optional[List[str]]
+            The Slack channels the new summaries are delivered to. Defaults to `slack_channel`.
+        """
+        self.transport = transport
+        self.metrics = metrics
+        self.slack_channel = slack_channel
+        self.slack_channels = slack_channels or [slack_channel]
+        self._factories = factories
+        self._instances = {}
+        self._lock = threading.RLock()
+
+    def _get(self, name: str):
+        with self._lock:
+            if name not in self._instances:
+                self._instances[name] = self._factories[name](self)
+
+            return self._instances[name]
+
+    def loaded(self, name: str) -> bool:
+        """
+        Returns whether the client with the given name was created already.
+        """
+        with self._lock:
+            return name in self._instances
+
+    @property
+    def summary_cache(self) -> "SummaryCache":
+        """
+        The persistent summary cache, or None.
+        """
+        return self._get("summary_cache")
+
+    @property
+    def openai_client(self) -> "OpenaiClient":
+        """
+        The client summarizing the texts.
+        """
+        return self._get("openai_client")
+
+    @property
+    def slack_client(self) -> "SlackClient":
+        """
+        The client posting the summaries.
+        """
+        return self._get("slack_client")
+
+    @property
+    def watermark_store(self) -> "WatermarkStore":
+        """
+        The store of the last summarized posts, or None.
+        """
+        return self._get("watermark_store")
+
+    @classmethod
+    def from_env(cls, job: str) -> "Clients":
+        """
+        Creates the clients from the environment variables.
+
+        Parameters
+        ----------
+        job : str
+            The name of the job in the run metrics, e.g. `confluence`.
+
+        Returns
+        -------
+        Clients
+            The configured clients.
+        """
+        metrics = default_metrics()
+        metrics.job = job
+        slack_channels = parse_channels(
+            getenv("SLACK_CHANNELS"), getenv("SLACK_CHANNEL")
+        )
+
+        return cls(
+            default_transport(),
+            metrics,
+            slack_channels[0] if slack_channels else getenv("SLACK_CHANNEL"),
+            {
+                "summary_cache": _summary_cache_from_env,
+                "openai_client": _openai_client_from_env,
+                "slack_client": _slack_client_from_env,
+                "watermark_store": _watermark_store_from_env,
+            },
+            slack_channels,
+        )
+
+    def finish(self):
+        """
+        Logs the statistics of the transport and the summary cache and exports the run metrics to the paths
+        set by `METRICS_JSON_PATH` and `METRICS_PROMETHEUS_PATH`.
+        """
+        self.transport.log_stats()
+
+        if self.loaded("summary_cache") and self.summary_cache:
+            self.summary_cache.log_stats()
+
+        self.metrics.export(
+            getenv("METRICS_JSON_PATH"), getenv("METRICS_PROMETHEUS_PATH")
+        )
+
+
+def _summary_cache_from_env(clients: Clients):
+    if not getenv("SUMMARY_CACHE_PATH"):
+        return None
+
+    from client_modules.summary_cache import SummaryCache
+
+    return SummaryCache(
+        getenv("SUMMARY_CACHE_PATH"),
+        max_bytes=int(getenv("SUMMARY_CACHE_MAX_MB", "50")) * 1024 * 1024,
+        max_age=float(getenv("SUMMARY_CACHE_MAX_AGE_DAYS", "30")) * 24 * 60 * 60,
+    )
+
+
+def _openai_client_from_env(clients: Clients):
+    from client_modules.model_router import DEFAULT_MODELS, parse_models
+    from client_modules.openai_summarizer import OpenaiClient
+    from client_modules.rate_limiter import RateLimiter
+
+    openai_models = parse_models(
+        getenv("OPENAI_MODELS", DEFAULT_MODELS),
+        lambda model: RateLimiter(
+            f"OpenAI {model}",
+            requests_per_minute=float(getenv("OPENAI_RPM", "3500")),
+            tokens_per_minute=float(getenv("OPENAI_TPM", "180000")),
+            max_concurrency=int(getenv("OPENAI_MAX_CONCURRENCY", "8")),
+        ),
+    )
+
+    return OpenaiClient(
+        getenv("OPENAI_API_KEY"),
+        clients.transport,
+        clients._get("summary_cache"),
+        map_workers=int(getenv("OPENAI_MAP_WORKERS", "4")),
+        api_base=getenv("OPENAI_API_BASE"),
+        metrics=clients.metrics,
+        models=openai_models,
+        max_tokens=int(getenv("OPENAI_MAX_TOKENS", "2000")),
+    )
+
+
+def _slack_client_from_env(clients: Clients):
+    from client_modules.slack_client import SlackClient
+
+    slack_history_limit = getenv("SLACK_HISTORY_LIMIT")
+    return SlackClient(
+        getenv("SLACK_TOKEN"),
+        history_limit=int(slack_history_limit) if slack_history_limit else None,
+        history_oldest=getenv("SLACK_HISTORY_OLDEST"),
+        base_url=getenv("SLACK_API_URL"),
+        metrics=clients.metrics,
+    )
+
+
+def _watermark_store_from_env(clients: Clients):
+    if not getenv("WATERMARK_STORE"):
+        return None
+
+    from client_modules.watermark_store import create_watermark_store
+
+    return create_watermark_store(getenv("WATERMARK_STORE"))
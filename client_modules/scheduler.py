@@ -0,0 +1,162 @@
+import logging
+import random
+import signal
+import threading
+import time
+from typing import Callable, List
+
+logging.getLogger(__name__)
+
+
+class ScheduledJob:
+    """
+    Class representing a job that runs periodically in the resident mode.
+
+    Attributes
+    ----------
+    name : str
+        The name of the job, used for logging.
+    function : Callable[[], None]
+        The function running one cycle of the job.
+    interval : float
+        The mean number of seconds between the starts of two cycles.
+    jitter : float
+        The share of the interval by which every delay is randomly lengthened or shortened.
+    cycles : int
+        The number of cycles run.
+    failures : int
+        The number of cycles that raised an exception.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        function: Callable[[], None],
+        interval: float,
+        jitter: float = 0.1,
+    ) -> None:
+        self.name = name
+        self.function = function
+        self.interval = interval
+        self.jitter = jitter
+        self.cycles = 0
+        self.failures = 0
+
+    def delay(self, elapsed: float = 0.0) -> float:
+        """
+        Returns the seconds to wait before the next cycle.
+
+        Parameters
+        ----------
+        elapsed : float
+            The duration of the last cycle, which is subtracted from the interval.
+
+        Returns
+        -------
+        float
+            The jittered delay, at least 0.
+        """
+        jittered = self.interval * (1 + random.uniform(-self.jitter, self.jitter))
+        return max(0.0, jittered - elapsed)
+
+    def run_cycle(self):
+        """
+        Runs one cycle of the job. Exceptions, including `SystemExit` from a failed request, are logged and
+        counted, so the next cycle still runs.
+        """
+        started = time.perf_counter()
+        self.cycles += 1
+
+        try:
+            self.function()
+        except (Exception, SystemExit) as e:
+            if isinstance(e, SystemExit) and not e.code:
+                pass
+            else:
+                self.failures += 1
+                logging.exception(
+                    f"Cycle {self.cycles} of {self.name} failed. (╯°□°）╯︵ ┻━┻"
+                )
+
+        logging.info(
+            f"Cycle {self.cycles} of {self.name} took {time.perf_counter() - started:.2f}s"
+        )
+
+
+class Scheduler:
+    """
+    Runs jobs periodically in one process until it is stopped, e.g. by SIGTERM.
+
+    Every job runs in a thread of its own. The first cycles start after a random delay of up to the jitter
+    of their interval, so jobs with the same interval do not start at the same moment, and every further
+    delay is jittered as well. When the scheduler is stopped, running cycles are finished and no new cycles
+    start.
+
+    Attributes
+    ----------
+    jobs : List[ScheduledJob]
+        The scheduled jobs.
+    stopped : threading.Event
+        Set when the scheduler is stopped.
+    """
+
+    def __init__(self, jobs: List[ScheduledJob]) -> None:
+        self.jobs = jobs
+        self.stopped = threading.Event()
+
+    def stop(self, *args):
+        """
+        Stops the scheduler. Can be used as signal handler.
+        """
+        if not self.stopped.is_set():
+            logging.info("Stopping scheduler after the running cycles")
+        self.stopped.set()
+
+    def _run_job(self, job: ScheduledJob):
+        delay = random.uniform(0, job.interval * job.jitter)
+
+        while not self.stopped.wait(delay):
+            started = time.perf_counter()
+            job.run_cycle()
+            delay = job.delay(time.perf_counter() - started)
+            logging.info(f"Next cycle of {job.name} in {delay:.0f}s")
+
+    def run(self, handle_signals: bool = True):
+        """
+        Runs the jobs until the scheduler is stopped.
+
+        Parameters
+        ----------
+        handle_signals : bool
+            Whether SIGTERM and SIGINT stop the scheduler. Only possible in the main thread.
+        """
+        if handle_signals:
+            signal.signal(signal.SIGTERM, self.stop)
+            signal.signal(signal.SIGINT, self.stop)
+
+        threads = [
+            threading.Thread(target=self._run_job, args=(job,), name=job.name)
+            for job in self.jobs
+        ]
+        for thread in threads:
+            thread.start()
+
+        logging.info(
+            "Scheduler started: "
+            + ", ".join(f"{job.name} every {job.interval:.0f}s" for job in self.jobs)
+        )
+
+        # Waiting with a timeout keeps the main thread responsive to signals
+        while not self.stopped.wait(1):
+            pass
+
+        for thread in threads:
+            thread.join()
+
+        logging.info(
+            "Scheduler stopped: "
+            + ", ".join(
+                f"{job.name} {job.cycles} cycles, {job.failures} failed"
+                for job in self.jobs
+            )
+        )
@@ -1,13 +1,29 @@
 import sys
 import logging
+import threading
+import time
 from slack_sdk import WebClient
 from slack_sdk.errors import SlackApiError
 from enum import Enum
 from uuid import uuid4
-from typing import List
+from typing import Callable, Iterable, Iterator, List, Optional
+
+from client_modules.metrics import MetricsRecorder, default_metrics
+from client_modules.rate_limiter import RateLimiter, parse_retry_after
 
 logger = logging.getLogger(__name__)
 
+# Requests per minute allowed for the Slack methods in use, following their rate limit tiers.
+# chat.postMessage is limited to about one message per second and channel instead of a tier.
+SLACK_METHOD_RATE_LIMITS = {
+    "conversations_history": 50,
+    "chat_postMessage": 60,
+    "chat_update": 50,
+}
+
+# Methods limited per channel. Their limiter in `rate_limiters` is the template for the limiter of each channel.
+SLACK_CHANNEL_RATE_LIMITED = ("chat_postMessage",)
+
 
 class MessageType(Enum):
     """
@@ -36,10 +52,13 @@ class ActionTrigger(Enum):
         Represents an action that is triggered based on a schedule.
     REQUESTED : str
         Represents an action that is triggered based on a request.
+    BACKFILL : str
+        Represents an action of a backfill. Backfilled summaries are not taken as the last scheduled summary.
     """
 
     SCHEDULED: str = "scheduled"
     REQUESTED: str = "requested"
+    BACKFILL: str = "backfill"
 
 
 class MessageMetadata:
@@ -79,6 +98,79 @@ class SummaryMessage:
         self.metadata = metadata
 
 
+class HistoryScan:
+    """
+    Class to lazily iterate over the history of a Slack channel, newest message first.
+
+    The pages of `conversations_history` are requested one at a time by following
+    `response_metadata.next_cursor`, so only the current page is held in memory. The scan stops when the
+    history is exhausted, when `limit` messages were read or when the iteration is not continued.
+
+    Attributes
+    ----------
+    pages : int
+        The number of pages requested so far.
+    messages : int
+        The number of messages read so far.
+    """
+
+    def __init__(
+        self,
+        fetch_page: Callable[..., dict],
+        channel: str,
+        oldest: Optional[str] = None,
+        limit: Optional[int] = None,
+        page_size: int = 200,
+    ) -> None:
+        self.fetch_page = fetch_page
+        self.channel = channel
+        self.oldest = oldest
+        self.limit = limit
+        self.page_size = page_size
+        self.pages = 0
+        self.messages = 0
+
+    def __iter__(self) -> Iterator[dict]:
+        cursor = None
+
+        while True:
+            page_size = self.page_size
+            if self.limit is not None:
+                page_size = max(1, min(page_size, self.limit - self.messages))
+
+            arguments = {
+                "channel": self.channel,
+                "include_all_metadata": True,
+                "limit": page_size,
+            }
+            if cursor:
+                arguments["cursor"] = cursor
+            if self.oldest:
+                arguments["oldest"] = self.oldest
+
+            response = self.fetch_page(**arguments)
+            self.pages += 1
+
+            for message in response["messages"]:
+                if self.limit is not None and self.messages >= self.limit:
+                    return
+                self.messages += 1
+                yield message
+
+            cursor = (response.get("response_metadata") or {}).get("next_cursor")
+            if not response.get("has_more") or not cursor:
+                return
+
+
+# Metrics stage of each WebClient method, other methods are recorded as `slack_api`
+SLACK_STAGES = {
+    "chat_postMessage": "slack_post",
+    "chat_update": "slack_post",
+    "chat_delete": "slack_post",
+    "conversations_history": "slack_history",
+}
+
+
 class SlackClient:
     """
     A client for interacting with Slack.
@@ -87,10 +179,168 @@ class SlackClient:
     ----------
     client : WebClient
         WebClient object for Slack API interaction.
+    history_limit : int
+        The maximum number of messages to read when scanning the channel history. None means no limit.
+    history_oldest : str
+        The timestamp of the oldest message to read when scanning the channel history.
+    rate_limiters : dict
+        The rate limiter for each Slack method, keyed by the name of the WebClient method. The methods of
+        `SLACK_CHANNEL_RATE_LIMITED` get a rate limiter per channel, keyed by the method and the channel.
+    metrics : MetricsRecorder
+        The recorder of the Slack stages, see `SLACK_STAGES`.
     """
 
-    def __init__(self, slack_token: str) -> None:
-        self.client: WebClient = WebClient(token=slack_token)
+    def __init__(
+        self,
+        slack_token: str,
+        history_limit: Optional[int] = None,
+        history_oldest: Optional[str] = None,
+        rate_limiters: Optional[dict] = None,
+        base_url: Optional[str] = None,
+        metrics: Optional[MetricsRecorder] = None,
+    ) -> None:
+        self.client: WebClient = WebClient(
+            token=slack_token, base_url=base_url or WebClient.BASE_URL
+        )
+        self.history_limit = history_limit
+        self.history_oldest = history_oldest
+        self.rate_limiters = rate_limiters or create_slack_rate_limiters()
+        self.metrics = metrics or default_metrics()
+        self._lock = threading.Lock()
+
+    def rate_limiter(
+        self, method: str, channel: Optional[str] = None
+    ) -> Optional[RateLimiter]:
+        """
+        Returns the rate limiter of a method, or of a method and channel for the methods of
+        `SLACK_CHANNEL_RATE_LIMITED`, so messages to several channels are not paced as one.
+        """
+        template = self.rate_limiters.get(method)
+        if (
+            template is None
+            or channel is None
+            or method not in SLACK_CHANNEL_RATE_LIMITED
+        ):
+            return template
+
+        with self._lock:
+            key = (method, channel)
+            if key not in self.rate_limiters:
+                self.rate_limiters[key] = RateLimiter(
+                    f"{template.name} {channel}",
+                    SLACK_METHOD_RATE_LIMITS.get(method, 60),
+                    None,
+                    template.max_concurrency,
+                )
+
+            return self.rate_limiters[key]
+
+    def call_api(self, method: str, **kwargs):
+        """
+        Calls a WebClient method under the rate limit of the method.
+
+        Requests that Slack answers with `ratelimited` are retried after the `Retry-After` Slack sends. Every
+        call is recorded in the metrics stage of the method, see `SLACK_STAGES`.
+
+        Parameters
+        ----------
+        method : str
+            The name of the WebClient method, e.g. `chat_postMessage`.
+        **kwargs
+            The arguments of the method.
+
+        Returns
+        -------
+        SlackResponse
+            The response of the method.
+
+        Raises
+        ------
+        SlackApiError
+            If the request fails for another reason, or is still rate limited after all retries.
+        """
+        function = getattr(self.client, method)
+        limiter = self.rate_limiter(method, kwargs.get("channel"))
+
+        with self.metrics.stage(SLACK_STAGES.get(method, "slack_api")) as stage:
+            if limiter is None:
+                response = function(**kwargs)
+            else:
+                response = limiter.call(
+                    lambda: function(**kwargs),
+                    retry_after_of=_slack_retry_after,
+                    on_retry=stage.retry,
+                )
+
+        return response
+
+    def iter_history(self, channel: str, page_size: int = 200) -> HistoryScan:
+        """
+        Creates a lazy scan over the history of a channel, bounded by `history_limit` and `history_oldest`.
+
+        Parameters
+        ----------
+        channel : str
+            The channel to read the history from.
+        page_size : int
+            The number of messages requested per page.
+
+        Returns
+        -------
+        HistoryScan
+            An iterable yielding the messages of the channel, newest first.
+        """
+        return HistoryScan(
+            lambda **arguments: self.call_api("conversations_history", **arguments),
+            channel,
+            self.history_oldest,
+            self.history_limit,
+            page_size,
+        )
+
+    def find_last_metadata_event(
+        self,
+        channel: str,
+        message_type: MessageType,
+        predicate: Callable[[dict], bool] = lambda event_payload: True,
+    ) -> Optional[dict]:
+        """
+        Scans the channel history for the newest message with metadata of the given type.
+
+        The scan stops at the first matching message, so usually only the first page is requested.
+
+        Parameters
+        ----------
+        channel : str
+            The channel to scan.
+        message_type : MessageType
+            The event type of the message metadata to look for.
+        predicate : Callable[[dict], bool], optional
+            An additional condition on the event payload of the metadata.
+
+        Returns
+        -------
+        Optional[dict]
+            The event payload of the newest matching message, or None if no message matched.
+        """
+        scan = self.iter_history(channel)
+        event_payload = None
+
+        for message in scan:
+            metadata = message.get("metadata")
+            if not metadata or metadata.get("event_type") != message_type.value:
+                continue
+
+            payload = metadata.get("event_payload", {})
+            if predicate(payload):
+                logging.debug(message)
+                event_payload = payload
+                break
+
+        logging.info(
+            f"Scanned {scan.messages} Slack messages on {scan.pages} pages for { message_type.value }"
+        )
+        return event_payload
 
     def get_last_summary_id(self, channel) -> str:
         """
@@ -108,28 +358,15 @@ class SlackClient:
         """
         last_summary_id = ""
         try:
-            response = self.client.conversations_history(
-                channel=channel,
-                include_all_metadata=True,
+            event_payload = self.find_last_metadata_event(
+                channel,
+                MessageType.BLOGPOST_SUMMARY,
+                lambda payload: payload.get("action_trigger")
+                == ActionTrigger.SCHEDULED.value,
             )
 
-            messages = response["messages"]
-
-            for message in messages:
-                if (
-                    "metadata" not in message
-                    or MessageType.BLOGPOST_SUMMARY.value
-                    != message["metadata"]["event_type"]
-                ):
-                    continue
-
-                metadata = message["metadata"]
-                event_payload = metadata.get("event_payload", {})
-
-                if event_payload.get("action_trigger") == ActionTrigger.SCHEDULED.value:
-                    last_summary_id = event_payload.get("id")
-                    print(message)
-                    break
+            if event_payload:
+                last_summary_id = event_payload.get("id")
 
         except SlackApiError as e:
             logging.error(f"Failed to connect to Slack.  щ（ﾟДﾟщ）")
@@ -175,44 +412,14 @@ class SlackClient:
         SystemExit
             If there's an error when sending the message to the Slack channel, after logging the error, the program is terminated.
         """
-        block_sections = []
-
-        sections = split_sections_by_blank_lines(summary)
-        for section in sections:
-            block_sections.append(
-                {
-                    "type": "section",
-                    "text": {"type": "mrkdwn", "text": f"{ section }"},
-                }
-            )
-
         try:
-            blocks = [
-                {"type": "header", "text": {"type": "plain_text", "text": title}},
-                {
-                    "type": "section",
-                    "text": {"type": "mrkdwn", "text": f"*TL;DR:*"},
-                },
-            ]
-
-            blocks.extend(block_sections)
-            blocks.append(
-                {
-                    "type": "actions",
-                    "elements": [
-                        {
-                            "type": "button",
-                            "text": {"type": "plain_text", "text": "Open blog post"},
-                            "url": blogpost_url,
-                        }
-                    ],
-                },
-            )
+            blocks = confluence_summary_blocks(summary, title, blogpost_url)
 
             logging.debug("Blocks:")
             logging.debug(blocks)
             logging.debug("Blocks:")
-            response = self.client.chat_postMessage(
+            response = self.call_api(
+                "chat_postMessage",
                 channel=channel,
                 blocks=blocks,
                 metadata={
@@ -234,34 +441,151 @@ class SlackClient:
             logging.error(f"{e.response['error']}")
             sys.exit(1)
 
-    def send_azure_blogpost_summary(
-        self, sections: list, channel: str, date_published: str
-    ):
+    def delete_message(self, channel, ts):
+        """
+        Deletes a message sent by the bot. Errors are logged, not raised.
+
+        Parameters
+        ----------
+        channel : str
+            The Slack channel of the message.
+        ts : str
+            The timestamp of the message.
+        """
         try:
-            message_uuid = uuid4()
+            self.call_api("chat_delete", channel=channel, ts=ts)
+            logger.info(f"Deleted Slack message {ts} in {channel}")
+        except SlackApiError as e:
+            logging.error(
+                f"Error deleting Slack message {ts}: {e.response['error']} (╯°□°）╯︵ ┻━┻"
+            )
 
-            block_sections = []
+    def stream_message_confluence_summary(
+        self,
+        chunks: Iterable[str],
+        title,
+        channel,
+        blogpost_url,
+        blogpost_id,
+        actiontrigger,
+        update_interval: float = 1.5,
+    ) -> str:
+        """
+        Posts a Confluence summary to Slack while it is being generated.
 
-            for section in sections:
-                block_sections.append(
-                    {
-                        "type": "section",
-                        "text": {"type": "mrkdwn", "text": f"{ section }"},
-                    }
-                )
-                block_sections.append({"type": "divider"})
+        A placeholder message is posted first and updated with the text received so far at most once every
+        `update_interval` seconds. When all chunks are received, the message is replaced with the same blocks
+        and metadata that `send_message_confluence_summary` would send. If the chunks or an update fail, the
+        placeholder is deleted again and the error is re-raised.
 
-            blocks = [
-                {
-                    "type": "header",
-                    "text": {
-                        "type": "plain_text",
-                        "text": f"Azure Blog updates from { date_published }",
+        Parameters
+        ----------
+        chunks : Iterable[str]
+            The parts of the summary as they are generated.
+        title : str
+            The title of the Confluence post.
+        channel : str
+            The Slack channel to send the message to.
+        blogpost_url : str
+            The URL of the Confluence post.
+        blogpost_id : str
+            The ID of the Confluence post.
+        actiontrigger : str
+            The action that triggered the sending of the message.
+        update_interval : float
+            The minimum number of seconds between two updates of the message.
+
+        Returns
+        -------
+        str
+            The complete summary.
+
+        Raises
+        ------
+        SystemExit
+            If there's an error when sending the message to the Slack channel, after logging the error, the program is terminated.
+        """
+        summary = ""
+
+        try:
+            response = self.call_api(
+                "chat_postMessage",
+                channel=channel,
+                text=title,
+                blocks=confluence_summary_blocks(
+                    "_Zusammenfassung wird erstellt …_", title, blogpost_url
+                ),
+            )
+        except SlackApiError as e:
+            logging.error(f"Error sending message to Slack:  (╯°□°）╯︵ ┻━┻")
+            logging.error(f"{e.response['error']}")
+            sys.exit(1)
+
+        message_channel = response["channel"]
+        message_ts = response["ts"]
+
+        try:
+            last_update = time.monotonic()
+            updated_summary = ""
+
+            for chunk in chunks:
+                summary += chunk
+
+                if (
+                    time.monotonic() - last_update >= update_interval
+                    and summary.strip() != updated_summary
+                ):
+                    updated_summary = summary.strip()
+                    self.call_api(
+                        "chat_update",
+                        channel=message_channel,
+                        ts=message_ts,
+                        text=title,
+                        blocks=confluence_summary_blocks(
+                            f"{ updated_summary } …", title, blogpost_url
+                        ),
+                    )
+                    last_update = time.monotonic()
+
+            summary = summary.strip()
+            self.call_api(
+                "chat_update",
+                channel=message_channel,
+                ts=message_ts,
+                text=title,
+                blocks=confluence_summary_blocks(summary, title, blogpost_url),
+                metadata={
+                    "event_type": MessageType.BLOGPOST_SUMMARY.value,
+                    "event_payload": {
+                        "id": blogpost_id,
+                        "action_trigger": actiontrigger,
                     },
                 },
-            ]
+            )
+
+        except BaseException as e:
+            # Without its final update the message holds a partial summary, so it is removed
+            self.delete_message(message_channel, message_ts)
+
+            if isinstance(e, SlackApiError):
+                logging.error(f"Error sending message to Slack:  (╯°□°）╯︵ ┻━┻")
+                logging.error(f"{e.response['error']}")
+                sys.exit(1)
+            raise
+
+        logger.info(
+            f"Successfully streamed Slack { MessageType.BLOGPOST_SUMMARY.value } message with blogpost_id: {blogpost_id}"
+        )
+
+        return summary
+
+    def send_azure_blogpost_summary(
+        self, sections: list, channel: str, date_published: str
+    ):
+        try:
+            message_uuid = uuid4()
 
-            blocks.extend(block_sections)
+            blocks = azure_summary_blocks(sections, date_published)
 
             message_metadata = (
                 {
@@ -274,7 +598,8 @@ class SlackClient:
                 },
             )
 
-            response = self.client.chat_postMessage(
+            response = self.call_api(
+                "chat_postMessage",
                 channel=channel,
                 blocks=blocks,
                 text="Azure posted a new Update!",
@@ -316,24 +641,11 @@ class SlackClient:
         """
         last_summary_date = ""
         try:
-            response = self.client.conversations_history(
-                channel=channel,
-                include_all_metadata=True,
+            event_payload = self.find_last_metadata_event(
+                channel, MessageType.AZURE_BLOGPOST
             )
 
-            messages = response["messages"]
-
-            for message in reversed(messages):
-                if (
-                    "metadata" not in message
-                    or message["metadata"]["event_type"]
-                    != MessageType.AZURE_BLOGPOST.value
-                ):
-                    continue
-
-                metadata = message["metadata"]
-                event_payload = metadata.get("event_payload", {})
-
+            if event_payload:
                 last_summary_date = event_payload.get("date_published")
 
         except SlackApiError as e:
@@ -343,6 +655,137 @@ class SlackClient:
         return last_summary_date
 
 
+def confluence_summary_blocks(summary: str, title: str, blogpost_url: str) -> list:
+    """
+    Builds the Slack blocks of a Confluence summary message.
+
+    The message consists of a header with the post title, the summary split into sections at blank lines,
+    and a button linking to the original post.
+
+    Parameters
+    ----------
+    summary : str
+        The summary of the Confluence post.
+    title : str
+        The title of the Confluence post.
+    blogpost_url : str
+        The URL of the Confluence post.
+
+    Returns
+    -------
+    list
+        The Slack blocks of the message.
+    """
+    blocks = [
+        {"type": "header", "text": {"type": "plain_text", "text": title}},
+        {
+            "type": "section",
+            "text": {"type": "mrkdwn", "text": f"*TL;DR:*"},
+        },
+    ]
+
+    for section in split_sections_by_blank_lines(summary):
+        blocks.append(
+            {
+                "type": "section",
+                "text": {"type": "mrkdwn", "text": f"{ section }"},
+            }
+        )
+
+    blocks.append(
+        {
+            "type": "actions",
+            "elements": [
+                {
+                    "type": "button",
+                    "text": {"type": "plain_text", "text": "Open blog post"},
+                    "url": blogpost_url,
+                }
+            ],
+        },
+    )
+
+    return blocks
+
+
+def azure_summary_blocks(sections: list, date_published: str) -> list:
+    """
+    Builds the Slack blocks of an Azure summary message.
+
+    Parameters
+    ----------
+    sections : list
+        The summarized sections of the day.
+    date_published : str
+        The publication date of the summarized updates.
+
+    Returns
+    -------
+    list
+        The Slack blocks of the message.
+    """
+    block_sections = []
+
+    for section in sections:
+        block_sections.append(
+            {
+                "type": "section",
+                "text": {"type": "mrkdwn", "text": f"{ section }"},
+            }
+        )
+        block_sections.append({"type": "divider"})
+
+    blocks = [
+        {
+            "type": "header",
+            "text": {
+                "type": "plain_text",
+                "text": f"Azure Blog updates from { date_published }",
+            },
+        },
+    ]
+
+    blocks.extend(block_sections)
+
+    return blocks
+
+
+def create_slack_rate_limiters(max_concurrency: int = 4) -> dict:
+    """
+    Creates a rate limiter for each Slack method in use, sized after the method's rate limit tier.
+
+    Parameters
+    ----------
+    max_concurrency : int
+        The upper bound of the adaptive concurrency limit of each method.
+
+    Returns
+    -------
+    dict
+        The rate limiters keyed by the name of the WebClient method.
+    """
+    return {
+        method: RateLimiter(
+            f"Slack {method}", requests_per_minute, None, max_concurrency
+        )
+        for method, requests_per_minute in SLACK_METHOD_RATE_LIMITS.items()
+    }
+
+
+def _slack_retry_after(error: BaseException) -> Optional[float]:
+    """
+    Returns the seconds to wait if the error is a Slack rate limit error, or None otherwise.
+    """
+    if not isinstance(error, SlackApiError):
+        return None
+
+    response = error.response
+    if response.status_code != 429 and response.get("error") != "ratelimited":
+        return None
+
+    return parse_retry_after(response.headers)
+
+
 def split_sections_by_blank_lines(text):
     """
     Splits a given text into sections based on blank lines.
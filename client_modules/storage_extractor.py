@@ -0,0 +1,285 @@
+import logging
+import re
+from html.parser import HTMLParser
+from typing import List, Optional
+
+logging.getLogger(__name__)
+
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+
+# Elements that start and end a line of text.
+_BLOCK_TAGS = {
+    "p",
+    "div",
+    "section",
+    "article",
+    "blockquote",
+    "table",
+    "tbody",
+    "thead",
+    "tfoot",
+    "ul",
+    "ol",
+    "hr",
+    "ac:layout",
+    "ac:layout-section",
+    "ac:layout-cell",
+    "ac:rich-text-body",
+    "ac:task-list",
+}
+
+_HEADING_TAGS = {"h1": 1, "h2": 2, "h3": 3, "h4": 4, "h5": 5, "h6": 6}
+
+# Elements whose content is never part of the text.
+_SKIPPED_TAGS = {
+    "script",
+    "style",
+    "ac:parameter",
+    "ac:task-id",
+    "ac:task-status",
+    "ac:placeholder",
+    "ac:emoticon",
+    "ac:image",
+}
+
+# HTML void elements, which have no end tag in storage format written by browsers.
+_VOID_TAGS = {"br", "hr", "img", "col", "input", "meta", "link", "wbr"}
+
+
+class StorageTextExtractor(HTMLParser):
+    """
+    A streaming extractor for the plain text of Confluence storage format.
+
+    The extractor reacts to parser events without building a document tree. Headings are prefixed with `#`
+    according to their level, list items with `-` or their number, table rows are written as cells joined
+    by `|` and code macros as fenced blocks. Macro parameters and other Confluence metadata are skipped.
+    Links to pages and attachments without a link body are replaced by the page title or file name.
+
+    Use `extract_storage_text` for single documents.
+    """
+
+    def __init__(self) -> None:
+        super().__init__(convert_charrefs=True)
+        self._lines: List[str] = []
+        self._line: List[str] = []
+        self._skip_depth = 0
+        self._pre_depth = 0
+        self._lists: List[List] = []
+        self._cells: Optional[List[str]] = None
+        self._cell: Optional[List[str]] = None
+        self._macros: List[str] = []
+        self._link_marks: List[tuple] = []
+        self._link_title: Optional[str] = None
+        self._marker_only = False
+
+    def text(self) -> str:
+        """
+        Returns the extracted text of everything fed so far.
+
+        Returns
+        -------
+        str
+            The extracted text with at most one blank line between blocks.
+        """
+        self.close()
+        self._end_line()
+        return "\n".join(self._lines).strip("\n")
+
+    def _target(self) -> List[str]:
+        return self._cell if self._cell is not None else self._line
+
+    def _position(self) -> tuple:
+        return len(self._lines), len(self._line), len(self._cell or [])
+
+    def _write(self, text: str):
+        if not text:
+            return
+
+        target = self._target()
+        if self._pre_depth == 0:
+            text = _WHITESPACE_PATTERN.sub(" ", text)
+            if not target or target[-1].endswith((" ", "\n")):
+                text = text.lstrip(" ")
+        if text:
+            target.append(text)
+            self._marker_only = False
+
+    def _end_line(self):
+        if self._cell is not None or self._marker_only:
+            return
+
+        line = "".join(self._line).rstrip()
+        self._line = []
+        if line:
+            self._lines.append(line)
+
+    def _blank_line(self):
+        self._end_line()
+        if self._cell is not None or self._lists:
+            return
+
+        if self._lines and self._lines[-1] != "":
+            self._lines.append("")
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _SKIPPED_TAGS:
+            if tag not in _VOID_TAGS:
+                self._skip_depth += 1
+            return
+        if self._skip_depth:
+            return
+
+        attributes = dict(attrs)
+
+        if tag in _HEADING_TAGS:
+            self._blank_line()
+            self._write("#" * _HEADING_TAGS[tag] + " ")
+        elif tag in ("ul", "ol"):
+            self._end_line()
+            self._lists.append([tag, 0])
+        elif tag in ("li", "ac:task"):
+            self._end_line()
+            depth = max(0, len(self._lists) - 1)
+            if self._lists and self._lists[-1][0] == "ol" and tag == "li":
+                self._lists[-1][1] += 1
+                marker = f"{self._lists[-1][1]}."
+            else:
+                marker = "-"
+            self._line.append("  " * depth + marker + " ")
+            self._marker_only = True
+        elif tag == "tr":
+            self._end_line()
+            self._cells = []
+        elif tag in ("td", "th") and self._cells is not None:
+            self._cell = []
+        elif tag == "br":
+            if self._cell is not None:
+                self._write(" ")
+            elif self._pre_depth:
+                self._line.append("\n")
+            else:
+                self._end_line()
+        elif tag == "pre":
+            self._blank_line()
+            self._pre_depth += 1
+        elif tag == "ac:structured-macro" or tag == "ac:macro":
+            self._macros.append(attributes.get("ac:name", ""))
+        elif tag == "ac:plain-text-body":
+            self._blank_line()
+            self._pre_depth += 1
+            if self._macros and self._macros[-1] in ("code", "noformat"):
+                self._lines.append("```")
+        elif tag == "ac:link":
+            self._link_marks.append(self._position())
+            self._link_title = None
+        elif tag.startswith("ri:"):
+            self._link_title = (
+                attributes.get("ri:content-title")
+                or attributes.get("ri:filename")
+                or attributes.get("ri:space-key")
+                or self._link_title
+            )
+            if tag == "ri:url" and attributes.get("ri:value"):
+                self._write(attributes["ri:value"])
+        elif tag == "time" and attributes.get("datetime"):
+            self._write(f" {attributes['datetime']} ")
+        elif tag in _BLOCK_TAGS:
+            self._end_line()
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in _VOID_TAGS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag in _SKIPPED_TAGS:
+            if tag not in _VOID_TAGS and self._skip_depth:
+                self._skip_depth -= 1
+            return
+        if self._skip_depth:
+            return
+
+        if tag in _HEADING_TAGS:
+            self._blank_line()
+        elif tag in ("ul", "ol"):
+            self._end_line()
+            if self._lists:
+                self._lists.pop()
+            if not self._lists:
+                self._blank_line()
+        elif tag in ("li", "ac:task"):
+            self._marker_only = False
+            self._end_line()
+        elif tag in ("td", "th") and self._cell is not None:
+            self._cells.append("".join(self._cell).strip())
+            self._cell = None
+        elif tag == "tr" and self._cells is not None:
+            cells = self._cells
+            self._cells = None
+            if any(cells):
+                self._lines.append(" | ".join(cells))
+        elif tag == "pre":
+            self._pre_depth = max(0, self._pre_depth - 1)
+            self._blank_line()
+        elif tag == "ac:plain-text-body":
+            self._pre_depth = max(0, self._pre_depth - 1)
+            self._end_line()
+            if self._macros and self._macros[-1] in ("code", "noformat"):
+                self._lines.append("```")
+            self._blank_line()
+        elif tag == "ac:structured-macro" or tag == "ac:macro":
+            if self._macros:
+                self._macros.pop()
+        elif tag == "ac:link":
+            mark = self._link_marks.pop() if self._link_marks else None
+            if mark == self._position() and self._link_title:
+                self._write(self._link_title)
+            self._link_title = None
+        elif tag in (
+            "p",
+            "div",
+            "blockquote",
+            "table",
+            "ac:layout-section",
+            "ac:task-list",
+        ):
+            self._blank_line()
+        elif tag in _BLOCK_TAGS:
+            self._end_line()
+
+    def handle_data(self, data):
+        if self._skip_depth:
+            return
+
+        if self._pre_depth and self._cell is None:
+            lines = data.split("\n")
+            self._line.append(lines[0])
+            for line in lines[1:]:
+                self._lines.append("".join(self._line).rstrip())
+                self._line = [line]
+            return
+
+        self._write(data)
+
+    def unknown_decl(self, data):
+        if data.startswith("CDATA["):
+            self.handle_data(data[len("CDATA[") :])
+
+
+def extract_storage_text(storage: str) -> str:
+    """
+    Extracts compact, structured plain text from a document in Confluence storage format.
+
+    Parameters
+    ----------
+    storage : str
+        The XHTML-based storage format of a Confluence page or blog post.
+
+    Returns
+    -------
+    str
+        The extracted text.
+    """
+    extractor = StorageTextExtractor()
+    extractor.feed(storage or "")
+    return extractor.text()
@@ -0,0 +1,268 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+logging.getLogger(__name__)
+
+
+class CachedSummary:
+    """
+    Class to represent a summary stored in the cache.
+
+    Attributes
+    ----------
+    summary : str
+        The cached summary text.
+    usage : dict
+        The token usage reported by OpenAI when the summary was created.
+    """
+
+    def __init__(self, summary, usage) -> None:
+        self.summary: str = summary
+        self.usage: dict = usage
+
+
+class SummaryCache:
+    """
+    A persistent, content-addressed cache for OpenAI summaries backed by SQLite.
+
+    Entries are keyed by a hash of the model, the system message and the input text. The database runs in
+    WAL mode and every write happens in its own immediate transaction, so several processes can share the
+    same cache file.
+
+    Attributes
+    ----------
+    path : str
+        The path of the SQLite database file.
+    max_bytes : int
+        The maximum combined size of all cached summaries. The least recently used entries are evicted first.
+    max_age : float
+        The maximum age of an entry in seconds.
+    hits : int
+        The number of cache hits during this run.
+    misses : int
+        The number of cache misses during this run.
+    tokens_saved : int
+        The number of tokens that cache hits saved during this run.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = 50 * 1024 * 1024,
+        max_age: float = 30 * 24 * 60 * 60,
+    ) -> None:
+        """
+        Initializes the SummaryCache and creates the database if it does not exist yet.
+
+        Parameters
+        ----------
+        path : str
+            The path of the SQLite database file.
+        max_bytes : int
+            The maximum combined size of all cached summaries.
+        max_age : float
+            The maximum age of an entry in seconds.
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.tokens_saved = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        connection = self._connect()
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+        finally:
+            connection.close()
+
+        with self._transaction() as connection:
+            connection.execute(
+                """CREATE TABLE IF NOT EXISTS summaries (
+                    key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    summary TEXT NOT NULL,
+                    usage TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )"""
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS summaries_accessed_at ON summaries (accessed_at)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """
+        Opens a connection and runs the statements of the block in one immediate transaction.
+        """
+        connection = self._connect()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield connection
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+        finally:
+            connection.close()
+
+    @staticmethod
+    def key(model: str, system_message: str, text: str) -> str:
+        """
+        Computes the cache key for a completion request.
+
+        Parameters
+        ----------
+        model : str
+            The name of the OpenAI model.
+        system_message : str
+            The system message of the request.
+        text : str
+            The user input of the request.
+
+        Returns
+        -------
+        str
+            The hex encoded SHA-256 hash of the inputs.
+        """
+        digest = hashlib.sha256()
+        for part in (model, system_message, text):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[CachedSummary]:
+        """
+        Looks up a cached summary and marks it as recently used.
+
+        Parameters
+        ----------
+        key : str
+            The cache key of the request.
+
+        Returns
+        -------
+        Optional[CachedSummary]
+            The cached summary, or None if there is no entry or the entry is expired.
+        """
+        now = time.time()
+
+        with self._transaction() as connection:
+            row = connection.execute(
+                "SELECT summary, usage FROM summaries WHERE key = ? AND created_at >= ?",
+                (key, now - self.max_age),
+            ).fetchone()
+
+            if row is not None:
+                connection.execute(
+                    "UPDATE summaries SET accessed_at = ? WHERE key = ?", (now, key)
+                )
+
+        if row is None:
+            with self._lock:
+                self.misses += 1
+            logging.info(f"Summary cache miss for key {key[:12]}")
+            return None
+
+        cached = CachedSummary(row[0], json.loads(row[1]))
+        saved = cached.usage.get("total_tokens", 0)
+
+        with self._lock:
+            self.hits += 1
+            self.tokens_saved += saved
+
+        logging.info(f"Summary cache hit for key {key[:12]}, saved {saved} tokens")
+        return cached
+
+    def put(self, key: str, model: str, summary: str, usage: dict):
+        """
+        Stores a summary in the cache and evicts old entries afterwards.
+
+        Parameters
+        ----------
+        key : str
+            The cache key of the request.
+        model : str
+            The name of the OpenAI model that created the summary.
+        summary : str
+            The summary to store.
+        usage : dict
+            The token usage reported by OpenAI.
+        """
+        now = time.time()
+
+        with self._transaction() as connection:
+            connection.execute(
+                """INSERT OR REPLACE INTO summaries
+                    (key, model, summary, usage, size, created_at, accessed_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                (
+                    key,
+                    model,
+                    summary,
+                    json.dumps(dict(usage)),
+                    len(summary.encode("utf-8")),
+                    now,
+                    now,
+                ),
+            )
+
+        self.evict()
+
+    def evict(self):
+        """
+        Removes expired entries and the least recently used entries exceeding the size limit.
+        """
+        with self._transaction() as connection:
+            expired = connection.execute(
+                "DELETE FROM summaries WHERE created_at < ?",
+                (time.time() - self.max_age,),
+            ).rowcount
+
+            total = connection.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM summaries"
+            ).fetchone()[0]
+
+            evicted = 0
+            if total > self.max_bytes:
+                rows = connection.execute(
+                    "SELECT key, size FROM summaries ORDER BY accessed_at ASC"
+                ).fetchall()
+
+                for key, size in rows:
+                    if total <= self.max_bytes:
+                        break
+                    connection.execute("DELETE FROM summaries WHERE key = ?", (key,))
+                    total -= size
+                    evicted += 1
+
+        if expired or evicted:
+            logging.info(
+                f"Summary cache evicted {expired} expired and {evicted} least recently used entries"
+            )
+
+    def log_stats(self):
+        """
+        Logs the hits, misses and saved tokens of this run.
+        """
+        logging.info(
+            f"Summary cache: {self.hits} hits, {self.misses} misses, {self.tokens_saved} tokens saved"
+        )
@@ -0,0 +1,141 @@
+import math
+import re
+from typing import List
+
+# Average number of characters per token. German text tokenizes worse than English, so this errs on the
+# side of overestimating the token count.
+CHARS_PER_TOKEN = 3.5
+
+_HEADING_PATTERN = re.compile(r"^(#{1,6}\s|\*[^*\n]+\*$)")
+_SENTENCE_PATTERN = re.compile(r"(?<=[.!?:;])\s+")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimates the number of tokens of a text without calling a tokenizer.
+
+    Parameters
+    ----------
+    text : str
+        The text to estimate.
+
+    Returns
+    -------
+    int
+        The estimated number of tokens.
+    """
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def split_into_chunks(text: str, max_tokens: int) -> List[str]:
+    """
+    Splits a text into chunks of at most `max_tokens` estimated tokens.
+
+    The text is split at paragraph boundaries (blank lines) and before headings. Consecutive paragraphs are
+    packed into the same chunk as long as they fit. Once a chunk is more than half full, a heading starts a
+    new chunk, so sections stay together where possible. Paragraphs that are too long on their own are split
+    at line, sentence and finally word boundaries.
+
+    Parameters
+    ----------
+    text : str
+        The text to split.
+    max_tokens : int
+        The maximum estimated number of tokens per chunk.
+
+    Returns
+    -------
+    List[str]
+        The chunks in the order of the text.
+    """
+    chunks = []
+    current = []
+    current_tokens = 0
+
+    def flush():
+        nonlocal current, current_tokens
+        if current:
+            chunks.append("\n\n".join(current))
+        current = []
+        current_tokens = 0
+
+    for block in _split_blocks(text):
+        tokens = estimate_tokens(block)
+
+        if tokens > max_tokens:
+            flush()
+            chunks.extend(_split_oversized(block, max_tokens))
+            continue
+
+        starts_section = _HEADING_PATTERN.match(block) is not None
+        if current_tokens + tokens > max_tokens or (
+            starts_section and current_tokens > max_tokens / 2
+        ):
+            flush()
+
+        current.append(block)
+        current_tokens += tokens + 1
+
+    flush()
+    return chunks
+
+
+def _split_blocks(text: str) -> List[str]:
+    """
+    Splits a text into paragraphs and headings.
+    """
+    blocks = []
+
+    for paragraph in re.split(r"\n\s*\n", text):
+        current = []
+        for line in paragraph.split("\n"):
+            if _HEADING_PATTERN.match(line.strip()) and current:
+                blocks.append("\n".join(current))
+                current = []
+            current.append(line)
+
+        block = "\n".join(current).strip()
+        if block:
+            blocks.append(block)
+
+    return blocks
+
+
+def _split_oversized(text: str, max_tokens: int) -> List[str]:
+    """
+    Splits a single paragraph that exceeds `max_tokens` at line, sentence or word boundaries.
+    """
+    for pattern, separator in (
+        (re.compile(r"\n"), "\n"),
+        (_SENTENCE_PATTERN, " "),
+        (re.compile(r"\s+"), " "),
+    ):
+        parts = [part for part in pattern.split(text) if part.strip()]
+        if len(parts) > 1:
+            break
+    else:
+        max_chars = max(1, int(max_tokens * CHARS_PER_TOKEN))
+        return [text[i : i + max_chars] for i in range(0, len(text), max_chars)]
+
+    chunks = []
+    current = ""
+
+    for part in parts:
+        candidate = f"{current}{separator}{part}" if current else part
+        if estimate_tokens(candidate) <= max_tokens:
+            current = candidate
+            continue
+
+        if current:
+            chunks.append(current)
+
+        if estimate_tokens(part) > max_tokens:
+            chunks.extend(_split_oversized(part, max_tokens))
+            current = ""
+        else:
+            current = part
+
+    if current:
+        chunks.append(current)
+
+    return chunks
@@ -0,0 +1,265 @@
+import fcntl
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from enum import Enum
+from typing import Iterator, Optional
+from urllib.parse import urlparse
+
+logging.getLogger(__name__)
+
+
+class Watermark(Enum):
+    """
+    Enum representing the watermarks recorded per Slack channel.
+
+    Attributes
+    ----------
+    CONFLUENCE_ID : str
+        The id of the last Confluence blog post that was summarized.
+    CONFLUENCE_CREATED : str
+        The creation date of the last Confluence blog post that was summarized.
+    AZURE_DATE : str
+        The publication date of the last Azure update day that was summarized.
+    AZURE_GUID : str
+        The guid of the newest Azure update of the last summarized day.
+    """
+
+    CONFLUENCE_ID: str = "confluence_last_id"
+    CONFLUENCE_CREATED: str = "confluence_last_created"
+    AZURE_DATE: str = "azure_last_date"
+    AZURE_GUID: str = "azure_last_guid"
+
+
+class WatermarkStore(ABC):
+    """
+    Base class for stores that record the last processed item per Slack channel.
+
+    Subclasses implement `get` and `set`. An empty store means the watermark has to be bootstrapped from
+    the Slack history once.
+    """
+
+    @abstractmethod
+    def get(self, channel: str, watermark: Watermark) -> Optional[str]:
+        """
+        Returns the recorded value of a watermark.
+
+        Parameters
+        ----------
+        channel : str
+            The Slack channel the watermark belongs to.
+        watermark : Watermark
+            The watermark to read.
+
+        Returns
+        -------
+        Optional[str]
+            The recorded value, or None if nothing was recorded yet.
+        """
+
+    @abstractmethod
+    def set(self, channel: str, watermark: Watermark, value: str):
+        """
+        Records the value of a watermark.
+
+        Parameters
+        ----------
+        channel : str
+            The Slack channel the watermark belongs to.
+        watermark : Watermark
+            The watermark to write.
+        value : str
+            The value to record.
+        """
+
+
+class MemoryWatermarkStore(WatermarkStore):
+    """
+    A watermark store that keeps the watermarks in memory for the lifetime of the process.
+    """
+
+    def __init__(self) -> None:
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def get(self, channel: str, watermark: Watermark) -> Optional[str]:
+        with self._lock:
+            return self._values.get((channel, watermark.value))
+
+    def set(self, channel: str, watermark: Watermark, value: str):
+        with self._lock:
+            self._values[(channel, watermark.value)] = str(value)
+
+
+class SqliteWatermarkStore(WatermarkStore):
+    """
+    A watermark store backed by a local SQLite database.
+
+    Attributes
+    ----------
+    path : str
+        The path of the SQLite database file.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Initializes the SqliteWatermarkStore and creates the database if it does not exist yet.
+
+        Parameters
+        ----------
+        path : str
+            The path of the SQLite database file.
+        """
+        self.path = path
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        connection = self._connect()
+        try:
+            with connection:
+                connection.execute(
+                    """CREATE TABLE IF NOT EXISTS watermarks (
+                        channel TEXT NOT NULL,
+                        name TEXT NOT NULL,
+                        value TEXT NOT NULL,
+                        updated_at REAL NOT NULL,
+                        PRIMARY KEY (channel, name)
+                    )"""
+                )
+        finally:
+            connection.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get(self, channel: str, watermark: Watermark) -> Optional[str]:
+        connection = self._connect()
+        try:
+            row = connection.execute(
+                "SELECT value FROM watermarks WHERE channel = ? AND name = ?",
+                (channel, watermark.value),
+            ).fetchone()
+        finally:
+            connection.close()
+
+        return row[0] if row else None
+
+    def set(self, channel: str, watermark: Watermark, value: str):
+        connection = self._connect()
+        try:
+            with connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO watermarks (channel, name, value, updated_at) VALUES (?, ?, ?, ?)",
+                    (channel, watermark.value, str(value), time.time()),
+                )
+        finally:
+            connection.close()
+
+
+class JsonFileWatermarkStore(WatermarkStore):
+    """
+    A watermark store that keeps all watermarks in a single JSON document.
+
+    This is a stand-in for shared storage: pointed at a mounted bucket or network share, several jobs see
+    the same watermarks. The document is replaced atomically on every write, so readers never see a
+    partially written file. Writes hold an exclusive `flock` on the sidecar file `<path>.lock` for the whole
+    read-modify-write, so concurrent writes of several processes are serialized instead of overwriting each
+    other. The file system has to support `flock` across the writing hosts.
+
+    Attributes
+    ----------
+    path : str
+        The path of the JSON file.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Initializes the JsonFileWatermarkStore.
+
+        Parameters
+        ----------
+        path : str
+            The path of the JSON file.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _read(self) -> dict:
+        try:
+            with open(self.path, encoding="utf-8") as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        """
+        Holds the lock of this process and the exclusive file lock shared with other processes.
+        """
+        with self._lock, open(f"{self.path}.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def get(self, channel: str, watermark: Watermark) -> Optional[str]:
+        return self._read().get(channel, {}).get(watermark.value)
+
+    def set(self, channel: str, watermark: Watermark, value: str):
+        with self._locked():
+            document = self._read()
+            document.setdefault(channel, {})[watermark.value] = str(value)
+
+            temporary_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(temporary_path, "w", encoding="utf-8") as file:
+                json.dump(document, file, indent=2)
+            os.replace(temporary_path, self.path)
+
+
+def create_watermark_store(url: str) -> WatermarkStore:
+    """
+    Creates a watermark store from a URL.
+
+    Supported URLs are `sqlite:///path/to/file.sqlite`, `file:///path/to/file.json` and `memory://`.
+    Relative paths can be given by leaving out the third slash, e.g. `sqlite://.cache/watermarks.sqlite`.
+
+    Parameters
+    ----------
+    url : str
+        The URL describing the store.
+
+    Returns
+    -------
+    WatermarkStore
+        The created watermark store.
+
+    Raises
+    ------
+    SystemExit
+        If the URL scheme is not supported.
+    """
+    parsed = urlparse(url)
+    path = f"{parsed.netloc}{parsed.path}"
+
+    if parsed.scheme == "memory":
+        return MemoryWatermarkStore()
+    if parsed.scheme == "sqlite":
+        return SqliteWatermarkStore(path)
+    if parsed.scheme == "file":
+        return JsonFileWatermarkStore(path)
+
+    logging.error(f"Unsupported watermark store: {url} (╯°□°）╯︵ ┻━┻")
+    sys.exit(1)
@@ -1,18 +1,178 @@
 #!/usr/bin/env python3
+"""
+Entry point running the summarizer modes in this process.
+
+    ./main.py confluence
+    ./main.py azure
+    ./main.py all [--sequential]
+    ./main.py all --daemon
+    ./main.py backfill
+
+Without a subcommand, the mode is taken from the `MODE` environment variable (`CONFLUENCE`, `AZURE` or
+`BACKFILL`).
+With `--daemon`, the process stays resident and polls the modes on the intervals set by
+`DAEMON_CONFLUENCE_INTERVAL` and `DAEMON_AZURE_INTERVAL` until it receives SIGTERM.
+"""
+import argparse
+import logging
 import os
-import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
 
 from dotenv import load_dotenv
 
-load_dotenv()
+from client_modules.runtime import Clients, configure_logging
+
+MODES = ("confluence", "azure")
+
+# Modes that are only run on their own, not by `all` or `--daemon`.
+ONE_OFF_MODES = ("backfill",)
+
+# Default seconds between two cycles of a mode in the daemon mode.
+DAEMON_INTERVALS = {"confluence": "900", "azure": "3600"}
+
+# Settings for one-off runs that would repeat the same summary on every cycle.
+ONE_OFF_SETTINGS = ("REQUESTED_BLOGPOST_ID", "DEBUG", "AZURE_SUMMARY_DATE")
+
+
+def run_mode(mode: str, clients: Clients):
+    """
+    Runs a single mode with the shared clients.
+    """
+    if mode == "confluence":
+        import summarize_blogposts
+
+        summarize_blogposts.main(clients)
+    elif mode == "backfill":
+        import backfill
+
+        backfill.main(clients)
+    else:
+        import azure_blog_reader
+
+        azure_blog_reader.main(clients)
+
+
+def run_modes(modes: list, clients: Clients, concurrent: bool) -> bool:
+    """
+    Runs the given modes with the shared clients, concurrently in threads or one after the other.
+
+    A failing mode does not stop the others.
+
+    Returns
+    -------
+    bool
+        Whether all modes succeeded.
+    """
+    succeeded = True
+
+    if concurrent and len(modes) > 1:
+        with ThreadPoolExecutor(max_workers=len(modes)) as executor:
+            futures = {mode: executor.submit(run_mode, mode, clients) for mode in modes}
+    else:
+        futures = None
+
+    for mode in modes:
+        try:
+            if futures:
+                futures[mode].result()
+            else:
+                run_mode(mode, clients)
+        except (Exception, SystemExit) as e:
+            if isinstance(e, SystemExit) and not e.code:
+                continue
+            logging.exception(f"The {mode} mode failed. (╯°□°）╯︵ ┻━┻")
+            succeeded = False
+
+    return succeeded
+
+
+def run_daemon(modes: list, clients: Clients):
+    """
+    Runs the given modes periodically in this process until SIGTERM or SIGINT is received.
+
+    The clients, and with them the HTTP pool, the summary cache and the watermarks, are kept between the
+    cycles. Without `WATERMARK_STORE`, the watermarks are kept in memory, so only the first cycle looks up
+    the last summary in the Slack history. A failing cycle is logged and the mode is run again on its next
+    cycle. After every cycle, the cumulative metrics are exported.
+    """
+    from client_modules.scheduler import ScheduledJob, Scheduler
+
+    for name in ONE_OFF_SETTINGS:
+        if os.getenv(name):
+            print(f"{name} can not be used with --daemon. (╯°□°）╯︵ ┻━┻")
+            sys.exit(1)
+
+    if not os.getenv("WATERMARK_STORE"):
+        os.environ["WATERMARK_STORE"] = "memory://"
+
+    def cycle(mode: str):
+        try:
+            with clients.metrics.stage(f"{mode}_cycle"):
+                run_mode(mode, clients)
+        finally:
+            clients.finish()
+
+    jitter = float(os.getenv("DAEMON_JITTER", "0.1"))
+    jobs = [
+        ScheduledJob(
+            mode,
+            lambda mode=mode: cycle(mode),
+            float(os.getenv(f"DAEMON_{mode.upper()}_INTERVAL", DAEMON_INTERVALS[mode])),
+            jitter,
+        )
+        for mode in modes
+    ]
+
+    Scheduler(jobs).run()
+
+
+def main():
+    arguments = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arguments.add_argument(
+        "mode",
+        nargs="?",
+        choices=(*MODES, *ONE_OFF_MODES, "all"),
+        help="the mode to run, defaults to the MODE environment variable",
+    )
+    arguments.add_argument(
+        "--sequential",
+        action="store_true",
+        help="run the modes of `all` one after the other instead of concurrently",
+    )
+    arguments.add_argument(
+        "--daemon",
+        action="store_true",
+        help="stay resident and run the modes periodically until SIGTERM",
+    )
+    options = arguments.parse_args()
+
+    load_dotenv()
+    configure_logging()
+
+    mode = options.mode or (os.getenv("MODE") or "").lower()
+    if mode not in (*MODES, *ONE_OFF_MODES, "all"):
+        print("Environment variable is not set to a recognized value.")
+        sys.exit(1)
+
+    if options.daemon and mode in ONE_OFF_MODES:
+        print(f"The {mode} mode can not be used with --daemon. (╯°□°）╯︵ ┻━┻")
+        sys.exit(1)
+
+    modes = list(MODES) if mode == "all" else [mode]
+
+    clients = Clients.from_env(mode)
+
+    if options.daemon:
+        run_daemon(modes, clients)
+        return
+
+    succeeded = run_modes(modes, clients, concurrent=not options.sequential)
+    clients.finish()
+
+    if not succeeded:
+        sys.exit(1)
 
-# Get the environment variable
-env_var = os.getenv("MODE")
 
-# Based on the environment variable, decide which script to run
-if env_var == "CONFLUENCE":
-    subprocess.run(["python", "summarize_blogposts.py"])
-elif env_var == "AZURE":
-    subprocess.run(["python", "azure_blog_reader.py"])
-else:
-    print("Environment variable is not set to a recognized value.")
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,19 @@
 #!/usr/bin/env python3
 import logging
-import sys
 import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from dateutil import parser
 
 import client_modules.confluence as confluence
-from client_modules.slack_client import SlackClient, ActionTrigger
-from client_modules.openai_summarizer import OpenaiClient
+from client_modules.fanout import deliver
+from client_modules.runtime import Clients, configure_logging
+from client_modules.text_chunker import estimate_tokens
+from client_modules.watermark_store import Watermark
 
 from dotenv import load_dotenv
 
-load_dotenv()
-
-confluence_base_url = os.getenv("BASE_URL")
-confluence_username = os.getenv("CONFLUENCE_USERNAME")
-confluence_token = os.getenv("CONFLUENCE_TOKEN")
-openai_api_key = os.getenv("OPENAI_API_KEY")
-slack_token = os.getenv("SLACK_TOKEN")
-slack_channel = os.getenv("SLACK_CHANNEL")
-openai_statement = os.getenv("OPENAI_STATEMENT")
-debug = os.getenv("DEBUG")
-requested_blogpost_id = os.getenv("REQUESTED_BLOGPOST_ID")
-
 default_blogpost_summary_statement = """Du bist Pexon und erstellst eine lockere Zusammenfassung. Fasse folgenden Text in maximal 150 Wörtern und Bulletpoints zusammen. 
 Die nachricht sollte für slack formatiert sein.  Nutze für bulletpoints immer ein "-" am anfang der zeile. Übernimm Überschriften der sektionen, und formatiere sie fett, in dem du sie zwischen * packst, wie in diesem beispiel: *Hallo Welt*
 
@@ -33,30 +26,215 @@ Das ergebnis sollte so aussehen
 """
 
 logger = logging.getLogger(__name__)
-logging.basicConfig(
-    stream=sys.stdout,
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-)
 
-slackClient = SlackClient(slack_token)
-confluenceClient = confluence.ConfluenceClient(
-    confluence_base_url, confluence_username, confluence_token
-)
+# Settings and clients of the mode, set by `configure`
+confluence_base_url = None
+slack_channel = None
+slack_channels = []
+debug = None
+requested_blogpost_id = None
+summary_concurrency = 4
+stream_summary = None
+slack_update_interval = 1.5
+confluence_poll_mode = "incremental"
+blogpost_summary_statement = default_blogpost_summary_statement
+
+shared_clients = None
+metrics = None
+confluenceClient = None
+watermark_store = None
+
+
+def configure(clients: Clients):
+    """
+    Reads the settings of the Confluence mode from the environment and sets up its clients.
+
+    Parameters
+    ----------
+    clients : Clients
+        The clients shared with the other modes of the process.
+    """
+    global confluence_base_url, slack_channel, slack_channels, debug, requested_blogpost_id, summary_concurrency
+    global stream_summary, slack_update_interval, confluence_poll_mode, blogpost_summary_statement
+    global shared_clients, metrics, confluenceClient, watermark_store
+
+    confluence_base_url = os.getenv("BASE_URL")
+    slack_channel = clients.slack_channel
+    slack_channels = clients.slack_channels
+    debug = os.getenv("DEBUG")
+    requested_blogpost_id = os.getenv("REQUESTED_BLOGPOST_ID")
+    summary_concurrency = int(os.getenv("CONFLUENCE_SUMMARY_CONCURRENCY", "4"))
+    stream_summary = os.getenv("STREAM_SUMMARY")
+    slack_update_interval = float(os.getenv("SLACK_UPDATE_INTERVAL", "1.5"))
+    confluence_poll_mode = os.getenv("CONFLUENCE_POLL_MODE", "incremental")
+    blogpost_summary_statement = (
+        os.getenv("OPENAI_STATEMENT") or default_blogpost_summary_statement
+    )
+
+    shared_clients = clients
+    metrics = clients.metrics
+    watermark_store = clients.watermark_store
+    confluenceClient = confluence.ConfluenceClient(
+        confluence_base_url,
+        os.getenv("CONFLUENCE_USERNAME"),
+        os.getenv("CONFLUENCE_TOKEN"),
+        clients.transport,
+        clients.metrics,
+    )
+
+
+def get_last_summary_id(channel: str = None) -> str:
+    """
+    Returns the ID of the last blogpost that was summarized in a Slack channel, by default `slack_channel`.
+
+    The ID is read from the watermark store. Only if the store has no record for the channel yet, the Slack
+    history is scanned once and the result is recorded in the store. The lookup is recorded in the
+    `watermark_lookup` stage of the metrics.
+    """
+    channel = channel or slack_channel
+
+    with metrics.stage("watermark_lookup"):
+        if watermark_store:
+            last_summary_id = watermark_store.get(channel, Watermark.CONFLUENCE_ID)
+            if last_summary_id:
+                return last_summary_id
+
+            logging.info(
+                f"No watermark recorded yet for {channel}, bootstrapping from Slack history"
+            )
 
-openai_client = OpenaiClient(openai_api_key)
+        last_summary_id = shared_clients.slack_client.get_last_summary_id(channel)
+
+        if watermark_store and last_summary_id:
+            watermark_store.set(channel, Watermark.CONFLUENCE_ID, last_summary_id)
+
+        return last_summary_id
+
+
+def record_summary(blogpost: confluence.BlogPost, channel: str = None):
+    """
+    Records the ID and the creation date of a blogpost whose summary was sent to a Slack channel, by default
+    `slack_channel`, in the watermark store.
+    """
+    channel = channel or slack_channel
+
+    if watermark_store:
+        watermark_store.set(channel, Watermark.CONFLUENCE_ID, blogpost.id)
+        if blogpost.created_date:
+            watermark_store.set(
+                channel, Watermark.CONFLUENCE_CREATED, blogpost.created_date
+            )
+
+
+def find_new_blogposts(last_summary_ids: dict) -> tuple[list, dict]:
+    """
+    Finds the blogposts published after the last summarized one of each Slack channel.
+
+    In the default `incremental` poll mode, only the metadata of the blogposts created since the oldest of the last summarized blogposts
+    is requested, across as many result pages as needed. The creation dates of the last summarized blogposts are taken from the watermark
+    store, or requested once per blogpost if they are not recorded. In the `latest` poll mode, the 20 newest blogposts are requested and
+    filtered by ID. In both modes, the bodies of the new blogposts are then requested in batches, once for all channels.
+
+    Parameters
+    ----------
+    last_summary_ids : dict
+        The ID of the last summarized blogpost, keyed by Slack channel.
+
+    Returns
+    -------
+    tuple[list, dict]
+        The blogposts new to any of the channels including their bodies, oldest first, and the new blogposts of each Slack channel,
+        oldest first. Blogposts new to several channels are the same objects.
+    """
+    if confluence_poll_mode == "latest":
+        blogposts = confluenceClient.get_blogposts(20).results
+        new_posts = {
+            channel: list(
+                reversed(
+                    confluenceClient.get_blogposts_newer_than_id(
+                        last_summary_id, blogposts
+                    )
+                )
+            )
+            for channel, last_summary_id in last_summary_ids.items()
+        }
+        new_ids = {post.id for posts in new_posts.values() for post in posts}
+        posts = [post for post in reversed(blogposts) if post.id in new_ids]
+        confluenceClient.load_bodies(posts)
+        return posts, new_posts
+
+    last_created_dates = {}
+    created_dates_by_id = {}
+    for channel, last_summary_id in last_summary_ids.items():
+        last_created = None
+        if watermark_store:
+            last_created = watermark_store.get(channel, Watermark.CONFLUENCE_CREATED)
+        if not last_created:
+            if last_summary_id not in created_dates_by_id:
+                created_dates_by_id[
+                    last_summary_id
+                ] = confluenceClient.get_blogpost_created_date(last_summary_id)
+            last_created = created_dates_by_id[last_summary_id]
+        last_created_dates[channel] = last_created
+
+    oldest_created = min(last_created_dates.values(), key=parser.isoparse)
+    posts = confluenceClient.get_blogposts_created_since(oldest_created)
+
+    new_posts = {
+        channel: [
+            post
+            for post in posts
+            if post.id != str(last_summary_ids[channel])
+            and parser.isoparse(post.created_date)
+            >= parser.isoparse(last_created_dates[channel])
+        ]
+        for channel in last_summary_ids
+    }
+
+    new_ids = {post.id for posts in new_posts.values() for post in posts}
+    posts = [post for post in posts if post.id in new_ids]
+    logging.info(f"Found {len(posts)} blog posts since last summary")
+    confluenceClient.load_bodies(posts)
+    return posts, new_posts
 
 
 def send_initial_summary():
     """
-    Fetches a specific blogpost from Confluence, generates a summary using OpenAI, and posts the summary to Slack.
+    Fetches a specific blogpost from Confluence, generates a summary using OpenAI, and posts the summary to all Slack channels.
+    If `STREAM_SUMMARY` is set, there is a single channel and the blogpost fits into a single request, the Slack message is posted right
+    away and updated while the summary is generated.
     The blogpost ID, blogpost summary statement, Slack channel, and Confluence base URL are assumed to be globally defined.
     """
+    from client_modules.slack_client import ActionTrigger
+
     blogpost = confluenceClient.get_blogpost(requested_blogpost_id)
+    text = blogpost.extract_text()
+
+    if (
+        stream_summary
+        and len(slack_channels) == 1
+        and estimate_tokens(text)
+        <= shared_clients.openai_client.input_budget(blogpost_summary_statement)
+    ):
+        summary = shared_clients.slack_client.stream_message_confluence_summary(
+            shared_clients.openai_client.stream_chat_completion(
+                blogpost_summary_statement, text
+            ),
+            blogpost.title,
+            slack_channels[0],
+            f"{confluence_base_url}{blogpost._links.tinyui}",
+            blogpost.id,
+            ActionTrigger.SCHEDULED.value,
+            slack_update_interval,
+        )
 
-    summary = openai_client.chatCompletion(
-        blogpost_summary_statement, blogpost.extract_text()
-    )
+        logging.info(f"Streamed summary from blogpost with id {blogpost.id}:")
+        logging.info(summary)
+
+        record_summary(blogpost, slack_channels[0])
+        return
+
+    summary = shared_clients.openai_client.summarize(blogpost_summary_statement, text)
 
     logging.info(f"Summary from blogpost with id {blogpost.id}:")
 
@@ -65,14 +243,32 @@ def send_initial_summary():
 {summary}"""
     )
 
-    slackClient.send_message_confluence_summary(
+    with ThreadPoolExecutor(max_workers=len(slack_channels)) as executor:
+        list(
+            executor.map(
+                lambda channel: send_summary(channel, blogpost, summary),
+                slack_channels,
+            )
+        )
+
+
+def send_summary(channel: str, blogpost: confluence.BlogPost, summary: str):
+    """
+    Sends the summary of a blogpost to a Slack channel and records it in the channel's watermark.
+    """
+    from client_modules.slack_client import ActionTrigger
+
+    shared_clients.slack_client.send_message_confluence_summary(
         summary,
         blogpost.title,
-        slack_channel,
+        channel,
         f"{confluence_base_url}{blogpost._links.tinyui}",
         blogpost.id,
         ActionTrigger.SCHEDULED.value,
     )
+    record_summary(blogpost, channel)
+
+    logger.info(f"Sent summary for blogpost {blogpost.id} to {channel}")
 
 
 def test_function():
@@ -85,15 +281,19 @@ def test_function():
     If no previous summary is found, it logs an error message.
     The required constants (like slack_channel, confluence_base_url, and blogpost_summary_statement) are assumed to be globally defined.
     """
+    from client_modules.slack_client import ActionTrigger
+
     blogpost = confluenceClient.get_blogposts(1).results[0]
     extracted_text = blogpost.extract_text()
     logging.info(f"Text from blogpost with id {blogpost.id}")
     logging.info(extracted_text)
-    summary = openai_client.chatCompletion(blogpost_summary_statement, extracted_text)
+    summary = shared_clients.openai_client.summarize(
+        blogpost_summary_statement, extracted_text
+    )
     logging.info(f"Summary from blogpost with id {blogpost.id}:")
     logging.info(summary)
 
-    slackClient.send_message_confluence_summary(
+    shared_clients.slack_client.send_message_confluence_summary(
         summary,
         blogpost.title,
         slack_channel,
@@ -102,7 +302,7 @@ def test_function():
         ActionTrigger.SCHEDULED.value,
     )
 
-    last_slack_message = slackClient.get_last_summary_id(slack_channel)
+    last_slack_message = shared_clients.slack_client.get_last_summary_id(slack_channel)
 
     if last_slack_message != "":
         blogposts = confluenceClient.get_blogposts(20).results
@@ -121,60 +321,101 @@ def test_function():
         logging.error("No scheduled messages found")
 
 
-def summarize_newest_blogposts():
+def summarize_newest_blogposts(channels: List[str] = None):
     """
     Function to fetch and summarize the newest blogposts on Confluence and post the summaries to Slack.
 
-    It first fetches the ID of the last summary sent to Slack. If a summary exists, it retrieves a list of 20 blogposts and checks if there are
-    newer blogposts than the last summary. If newer blogposts exist, it logs their IDs and titles, generates a summary using OpenAI, and then sends
-    the summary to Slack. It logs an info message after each summary is sent. If no previous summary is found, it logs an error message.
+    It first fetches the ID of the last summary sent to each Slack channel. For the channels with a previous summary, it retrieves the
+    blogposts that are newer than their last summary (see `find_new_blogposts`). If newer blogposts exist, it generates a summary of each
+    using OpenAI, once for all channels, and then sends the summaries to the channels that have not received them yet. If no previous
+    summary is found in a channel, it logs an error message.
 
-    The required constants (like slack_channel, confluence_base_url, and blogpost_summary_statement) are assumed to be globally defined.
-    """
-    last_slack_message = slackClient.get_last_summary_id(slack_channel)
-    logging.info("last ID in Slack: " + last_slack_message)
+    Up to `summary_concurrency` summaries are generated in parallel and the channels are served concurrently, but each channel receives
+    its summaries strictly oldest first. If a summary fails, the summaries of newer blogposts are not sent, so the watermark of a channel
+    only ever covers posts that were delivered.
 
-    if last_slack_message != "":
-        blogposts = confluenceClient.get_blogposts(20).results
+    Parameters
+    ----------
+    channels : List[str]
+        The Slack channels to deliver to. Defaults to `slack_channels`.
+    """
+    channels = channels or slack_channels
 
-        # print(blogposts[0].body.storage.value)
-        # logging.info(blogposts[0].extract_text())
-        newer_blogposts = confluenceClient.get_blogposts_newer_than_id(
-            last_slack_message, blogposts
+    with ThreadPoolExecutor(max_workers=len(channels)) as executor:
+        last_summary_ids = dict(
+            zip(channels, executor.map(get_last_summary_id, channels))
         )
 
-        if len(newer_blogposts) != 0:
-            for post in reversed(newer_blogposts):
-                logging.info(post.id)
-                logging.info(post.title)
-
-                summary = openai_client.chatCompletion(
-                    blogpost_summary_statement, post.extract_text()
+    for channel in channels:
+        logging.info(f"last ID in Slack {channel}: {last_summary_ids[channel]}")
+        if last_summary_ids[channel] == "":
+            logging.error(f"No scheduled messages found in {channel}")
+            del last_summary_ids[channel]
+
+    if not last_summary_ids:
+        return
+
+    posts, new_posts = find_new_blogposts(last_summary_ids)
+
+    if len(posts) != 0:
+        by_id = {post.id: post for post in posts}
+        for post in posts:
+            logging.info(f"{post.id} {post.title}")
+
+        with ThreadPoolExecutor(max_workers=max(1, summary_concurrency)) as executor:
+            summaries = {
+                post.id: executor.submit(
+                    lambda post: shared_clients.openai_client.summarize(
+                        blogpost_summary_statement, post.extract_text()
+                    ),
+                    post,
                 )
-
-                slackClient.send_message_confluence_summary(
-                    summary,
-                    post.title,
-                    slack_channel,
-                    f"{confluence_base_url}{post._links.tinyui}",
-                    post.id,
-                    ActionTrigger.SCHEDULED.value,
+                for post in posts
+            }
+
+            try:
+                deliver(
+                    {
+                        channel: [post.id for post in channel_posts]
+                        for channel, channel_posts in new_posts.items()
+                    },
+                    summaries,
+                    lambda channel, post_id, summary: send_summary(
+                        channel, by_id[post_id], summary
+                    ),
                 )
+            except BaseException:
+                for pending in summaries.values():
+                    pending.cancel()
+                raise
+
+
+def main(clients: Clients):
+    """
+    Runs the Confluence mode with the given clients.
 
-                logger.info(f"Sent summary for blogpost {post.id}")
+    Summarizes the blogpost set by `REQUESTED_BLOGPOST_ID`, the latest blogpost if `DEBUG` is set, or all
+    blogposts published since the last summary.
 
+    Parameters
+    ----------
+    clients : Clients
+        The clients shared with the other modes of the process.
+    """
+    configure(clients)
+
+    if requested_blogpost_id:
+        send_initial_summary()
+    elif debug:
+        test_function()
     else:
-        logging.error("No scheduled messages found")
+        summarize_newest_blogposts()
 
 
-if openai_statement:
-    blogpost_summary_statement = openai_statement
-else:
-    blogpost_summary_statement = default_blogpost_summary_statement
+if __name__ == "__main__":
+    load_dotenv()
+    configure_logging()
 
-if requested_blogpost_id:
-    send_initial_summary()
-elif debug:
-    test_function()
-else:
-    summarize_newest_blogposts()
+    clients = Clients.from_env("confluence")
+    main(clients)
+    clients.finish()